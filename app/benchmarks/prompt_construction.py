@@ -0,0 +1,48 @@
+"""Micro-benchmark of chatbot request construction.
+
+Compares building the system prompt dict, message array and token estimate on every
+call (the previous approach) with the prepared prompt registry.
+
+Run with: python -m app.benchmarks.prompt_construction
+"""
+import timeit
+from app.modules.prompt_registry import DEFAULT_PROMPTS, estimate_tokens, prompt_registry
+
+ITERATIONS = 100_000
+AGE_GROUPS = ["preschool", "early_elementary", "late_elementary", "early_teen", "teen"]
+HISTORY = [
+    {"role": "user", "content": "ما هو أكبر كوكب في المجموعة الشمسية؟"},
+    {"role": "assistant", "content": "أكبر كوكب هو المشتري، وهو أكبر من الأرض بكثير!"},
+] * 3
+QUESTION = "ولماذا لون المريخ أحمر؟"
+
+
+def build_per_call(age_group: str):
+    prompts = {name: text for name, text in DEFAULT_PROMPTS.items() if name != "summary"}
+    messages = [
+        {"role": "system", "content": prompts.get(age_group, prompts["early_elementary"])},
+        *HISTORY,
+        {"role": "user", "content": QUESTION}
+    ]
+    return messages, sum(estimate_tokens(message["content"]) for message in messages)
+
+
+def build_with_registry(age_group: str):
+    messages = prompt_registry.build_messages(age_group, HISTORY, QUESTION)
+    return messages, prompt_registry.estimate_request_tokens(age_group, HISTORY, QUESTION)
+
+
+def run(label: str, build):
+    seconds = timeit.timeit(
+        lambda: [build(age_group) for age_group in AGE_GROUPS],
+        number=ITERATIONS // len(AGE_GROUPS)
+    )
+    print(f"{label:<20} {seconds / ITERATIONS * 1e6:8.3f} us per request")
+    return seconds
+
+
+if __name__ == "__main__":
+    print(f"{ITERATIONS} requests, {len(HISTORY)} history turns")
+    baseline = run("per call", build_per_call)
+    registry = run("prompt registry", build_with_registry)
+    print(f"speedup              {baseline / registry:8.2f}x")
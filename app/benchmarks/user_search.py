@@ -0,0 +1,54 @@
+"""Micro-benchmark of child search.
+
+Compares a scan that checks every child for the query (what LIKE '%q%' does in MySQL)
+with the in-memory n-gram index, on synthetic children.
+
+Run with: python -m app.benchmarks.user_search
+"""
+import random
+import string
+import timeit
+from app.modules.user_search import IndexedChild, SearchData, UserSearchIndex, normalize_name
+
+CHILDREN = 100_000
+ITERATIONS = 2_000
+FIRST_NAMES = ["أحمد", "سارة", "محمد", "ليان", "عبدالله", "نورة", "يوسف", "ريم", "Omar", "Lina"]
+LAST_NAMES = ["العتيبي", "القحطاني", "الشهري", "الغامدي", "الزهراني", "Salem", "Hassan"]
+QUERIES = ["sa", "omar", "lin", "احم", "نور", "zz9", "ali"]
+
+
+def make_rows(count: int) -> list:
+    random.seed(7)
+    return [
+        {
+            "childUserName": "".join(random.choices(string.ascii_lowercase, k=5)) + str(i),
+            "firstName": random.choice(FIRST_NAMES),
+            "lastName": random.choice(LAST_NAMES),
+            "profileIcon": None,
+        }
+        for i in range(count)
+    ]
+
+
+def scan(rows: list, query: str) -> list:
+    query = normalize_name(query)
+    return [row for row in rows if query in row["childUserName"]][:10]
+
+
+def run(label: str, search):
+    seconds = timeit.timeit(lambda: [search(query) for query in QUERIES], number=ITERATIONS // len(QUERIES))
+    print(f"{label:<20} {seconds / ITERATIONS * 1e6:10.1f} us per search")
+    return seconds
+
+
+if __name__ == "__main__":
+    rows = make_rows(CHILDREN)
+    index = UserSearchIndex()
+    index._data = SearchData.build([IndexedChild(row) for row in rows])
+    # No friends: this measures lookup and ranking, not the social graph
+    index._friends_of_friends = lambda username: set()
+
+    print(f"{CHILDREN} children, {len(QUERIES)} queries")
+    baseline = run("full scan", lambda query: scan(rows, query))
+    indexed = run("n-gram index", lambda query: index.search(query, ""))
+    print(f"speedup              {baseline / indexed:10.1f}x")
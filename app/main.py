@@ -1,8 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
+import asyncio
 from app.database import Database
+from app.modules.llm_client import get_llm_metrics, start_llm_clients, close_llm_clients
+from app.modules.message_filter import close_moderation_batcher
+from app.modules.notification_queue import notification_worker
+from app.modules.notification_hub import notification_hub
+from app.modules.notification_retention import notification_retention
+from app.modules.notification_digest import notification_digests
+from app.modules.notification_dedup import notification_deduplicator
+from app.modules.moderation_policy import moderation_policy
+from app.modules.response_cache import response_cache
+from app.modules.chatbot_quota import chatbot_quota
+from app.modules.chatbot import conversation_memory
+from app.modules.prompt_registry import prompt_registry
+from app.modules.social_graph import social_graph
+from app.modules.user_search import user_search_index
+from app.modules.data_migrations import run_data_migrations
 
 
 # Import and include importing api end points 
@@ -21,8 +38,45 @@ else:
     print("Failed to connect to the database. Exiting...")
     exit(1)  # Exit the program if the database connection fails
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Friend lists, block checks and suggestions read tables that have to be backfilled before serving
+    if await asyncio.to_thread(run_data_migrations):
+        social_graph.clear()
+    # Open the shared LLM connection pool once so TLS connections are reused across requests
+    start_llm_clients()
+    # Push new notifications to connected parents, across workers when Redis is configured
+    await notification_hub.start()
+    # Deliver queued parent notifications, including any left in the outbox by a previous run
+    notification_worker.start()
+    # Compile the moderation policy and keep picking up changes without a restart
+    moderation_policy.start()
+    # Chatbot limits and today's usage are held in memory and flushed in batches
+    chatbot_quota.start()
+    # Chatbot prompts are prepared once and re-read when CHATBOT_PROMPTS_PATH changes
+    prompt_registry.start()
+    # Move expired notifications to the archive in small batches to keep the hot table bounded
+    notification_retention.start()
+    # Periodic summaries for parents who prefer digests over individual alerts
+    notification_digests.start()
+    # Child search is served from an in-memory n-gram index, rebuilt periodically
+    user_search_index.start()
+    yield
+    await user_search_index.stop()
+    await notification_digests.stop()
+    await notification_retention.stop()
+    await prompt_registry.stop()
+    # Summaries still running are charged to the quota before its last flush
+    await conversation_memory.stop()
+    await chatbot_quota.stop()
+    await moderation_policy.stop()
+    await notification_worker.stop()
+    await close_moderation_batcher()
+    await close_llm_clients()
+    await notification_hub.stop()
+
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for Flutter connections
 app.add_middleware(
@@ -31,6 +85,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 
@@ -43,6 +98,19 @@ app.include_router(chatbot.router, prefix="/api")
 def read_root():
     return {"message": "أنيس .. رفيق طفلك الذي تثق به"}
 
+@app.get("/api/llm/metrics")
+def llm_metrics():
+    """Upstream LLM latency, error counters, circuit breaker state, chatbot cache hit rate and prompt version"""
+    return {
+        **get_llm_metrics(),
+        "chatbot_cache": response_cache.metrics(),
+        "chatbot_prompts": prompt_registry.describe(),
+        "notification_hub": notification_hub.metrics(),
+        "notification_dedup": notification_deduplicator.stats,
+        "social_graph": social_graph.metrics(),
+        "user_search": user_search_index.metrics(),
+    }
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -73,6 +73,30 @@ friendshipTable = sa.Table(
     sa.Column("friendshipTimeStamp", sa.DateTime, server_default=func.now(), nullable=False)
 )
 
+# Each friendship once per direction, so friend lists and block checks are single index range scans
+friendEdgeTable = sa.Table(
+    "FriendEdge",
+    metadata,
+    sa.Column("childUserName", sa.String(20), sa.ForeignKey("Child.childUserName"), primary_key=True),
+    sa.Column("friendUserName", sa.String(20), sa.ForeignKey("Child.childUserName"), primary_key=True),
+    sa.Column("status", sa.Enum("Active", "Blocked", name="friend_edge_status_enum"), nullable=False, default="Active"),
+    sa.Column("friendshipID", sa.Integer, sa.ForeignKey("Friendship.friendshipID"), nullable=False),
+    sa.Index("ix_friend_edge_status", "childUserName", "status", "friendUserName"),
+    sa.Index("ix_friend_edge_friend", "friendUserName"),
+)
+
+# Children sharing active friends without being connected yet; see app/modules/friend_suggestions.py
+friendSuggestionTable = sa.Table(
+    "FriendSuggestion",
+    metadata,
+    sa.Column("childUserName", sa.String(20), sa.ForeignKey("Child.childUserName"), primary_key=True),
+    sa.Column("candidateUserName", sa.String(20), sa.ForeignKey("Child.childUserName"), primary_key=True),
+    sa.Column("mutualCount", sa.Integer, nullable=False),
+    sa.Column("updatedAt", sa.DateTime, server_default=func.now(), onupdate=func.now(), nullable=False),
+    sa.Index("ix_friend_suggestion_rank", "childUserName", "mutualCount"),
+    sa.Index("ix_friend_suggestion_candidate", "candidateUserName"),
+)
+
 requestTable = sa.Table(
     "Request",
     metadata,
@@ -82,7 +106,19 @@ requestTable = sa.Table(
     sa.Column("requestStatus", sa.Enum("Pending", "Accepted", "Declined", name="request_status_enum"), nullable=False, default="Pending"),
     sa.Column("requestTimeStamp", sa.DateTime, server_default=func.now(), nullable=False),
     sa.Column("acceptedTimeStamp", sa.DateTime, nullable=True),
-    sa.Column("declinedTimeStamp", sa.DateTime, nullable=True)
+    sa.Column("declinedTimeStamp", sa.DateTime, nullable=True),
+    # Same value for A->B and B->A while pending, NULL otherwise, so the unique index allows
+    # one pending request per pair of children in either direction
+    sa.Column(
+        "pendingPair",
+        sa.String(41),
+        sa.Computed(
+            "IF(requestStatus = 'Pending', CONCAT(LEAST(requestChildUserName, ReceiverChildUserName), '|', "
+            "GREATEST(requestChildUserName, ReceiverChildUserName)), NULL)",
+            persisted=True
+        )
+    ),
+    sa.UniqueConstraint("pendingPair", name="uq_request_pending_pair"),
 )
 
 riskTypeTable = sa.Table(
@@ -105,6 +141,125 @@ notificationTable = sa.Table(
     sa.Column("riskType", sa.String(100), nullable=False),
     sa.Column("timeStamp", sa.DateTime, server_default=func.now(), nullable=False),
     sa.Column("isRead", sa.Boolean, nullable=False, server_default=sa.text("0")),
+    # Repeats of the same (sender, receiver, riskType) folded into this row
+    sa.Column("occurrenceCount", sa.Integer, nullable=False, server_default=sa.text("1")),
+    sa.Column("latestContent", sa.String(255), nullable=True),
+    sa.Column("lastOccurrenceAt", sa.DateTime, nullable=True),
+    # Keyset pagination of the parent feed, optionally narrowed to one child
+    sa.Index("ix_notification_parent_feed", "parentUserName", "timeStamp", "notificationID"),
+    sa.Index("ix_notification_receiver_feed", "receiverChildUserName", "timeStamp", "notificationID"),
+    # Oldest-first scan of the retention job
+    sa.Index("ix_notification_time", "timeStamp"),
+)
+
+moderationPolicyOverrideTable = sa.Table(
+    "ModerationPolicyOverride",
+    metadata,
+    sa.Column("parentUserName", sa.String(20), sa.ForeignKey("Parent.parentUserName"), primary_key=True),
+    sa.Column("riskID", sa.Integer, sa.ForeignKey("RiskType.riskID"), primary_key=True),
+    sa.Column("minAge", sa.Integer, primary_key=True),
+    sa.Column("maxAge", sa.Integer, nullable=False),
+    sa.Column("action", sa.Enum("allow", "mask", "notify", name="moderation_action_enum"), nullable=False),
+)
+
+chatbotMemoryTable = sa.Table(
+    "ChatbotMemory",
+    metadata,
+    sa.Column("childUserName", sa.String(20), sa.ForeignKey("Child.childUserName"), primary_key=True),
+    sa.Column("summary", sa.Text, nullable=True),
+    sa.Column("turns", sa.Text, nullable=True),
+    sa.Column("updatedAt", sa.DateTime, server_default=func.now(), onupdate=func.now(), nullable=False),
+)
+
+chatbotLimitTable = sa.Table(
+    "ChatbotLimit",
+    metadata,
+    sa.Column("childUserName", sa.String(20), sa.ForeignKey("Child.childUserName"), primary_key=True),
+    sa.Column("requestsPerMinute", sa.Integer, nullable=False),
+    sa.Column("dailyRequests", sa.Integer, nullable=False),
+    sa.Column("dailyTokens", sa.Integer, nullable=False),
+)
+
+chatbotUsageTable = sa.Table(
+    "ChatbotUsage",
+    metadata,
+    sa.Column("childUserName", sa.String(20), sa.ForeignKey("Child.childUserName"), primary_key=True),
+    sa.Column("usageDate", sa.Date, primary_key=True),
+    sa.Column("requestCount", sa.Integer, nullable=False, server_default=sa.text("0")),
+    sa.Column("tokenCount", sa.Integer, nullable=False, server_default=sa.text("0")),
+)
+
+parentUnreadCounterTable = sa.Table(
+    "ParentUnreadCounter",
+    metadata,
+    sa.Column("parentUserName", sa.String(20), sa.ForeignKey("Parent.parentUserName"), primary_key=True),
+    sa.Column("unreadCount", sa.Integer, nullable=False, server_default=sa.text("0")),
+)
+
+# Notifications past their retention period, without the unmasked original text.
+# No foreign keys, so archived rows never block changes to the live tables.
+notificationArchiveTable = sa.Table(
+    "NotificationArchive",
+    metadata,
+    sa.Column("notificationID", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("firebaseMessageID", sa.String(255), nullable=False),
+    sa.Column("senderChildUserName", sa.String(20), nullable=False),
+    sa.Column("receiverChildUserName", sa.String(20), nullable=False),
+    sa.Column("parentUserName", sa.String(20), nullable=False),
+    sa.Column("content", sa.String(255), nullable=False),
+    sa.Column("riskType", sa.String(100), nullable=False),
+    sa.Column("timeStamp", sa.DateTime, nullable=False),
+    sa.Column("isRead", sa.Boolean, nullable=False),
+    sa.Column("occurrenceCount", sa.Integer, nullable=False, server_default=sa.text("1")),
+    sa.Column("latestContent", sa.String(255), nullable=True),
+    sa.Column("lastOccurrenceAt", sa.DateTime, nullable=True),
+    sa.Column("archivedAt", sa.DateTime, server_default=func.now(), nullable=False),
+    sa.Index("ix_notification_archive_parent", "parentUserName", "timeStamp"),
+    sa.Index("ix_notification_archive_time", "timeStamp"),
+)
+
+parentRetentionTable = sa.Table(
+    "ParentRetention",
+    metadata,
+    sa.Column("parentUserName", sa.String(20), sa.ForeignKey("Parent.parentUserName"), primary_key=True),
+    sa.Column("retentionDays", sa.Integer, nullable=False),
+)
+
+notificationDigestPreferenceTable = sa.Table(
+    "NotificationDigestPreference",
+    metadata,
+    sa.Column("parentUserName", sa.String(20), sa.ForeignKey("Parent.parentUserName"), primary_key=True),
+    sa.Column("frequency", sa.Enum("off", "hourly", "daily", name="digest_frequency_enum"), nullable=False),
+    sa.Column("lastSentAt", sa.DateTime, nullable=True),
+)
+
+notificationDigestTable = sa.Table(
+    "NotificationDigest",
+    metadata,
+    sa.Column("digestID", sa.Integer, primary_key=True, autoincrement=True),
+    sa.Column("parentUserName", sa.String(20), sa.ForeignKey("Parent.parentUserName"), nullable=False),
+    sa.Column("periodStart", sa.DateTime, nullable=False),
+    sa.Column("periodEnd", sa.DateTime, nullable=False),
+    sa.Column("notificationCount", sa.Integer, nullable=False),
+    sa.Column("occurrenceCount", sa.Integer, nullable=False),
+    sa.Column("summary", sa.Text, nullable=False),
+    sa.Column("createdAt", sa.DateTime, server_default=func.now(), nullable=False),
+    sa.Index("ix_notification_digest_parent", "parentUserName", "periodEnd"),
+)
+
+parentSuggestionSettingTable = sa.Table(
+    "ParentSuggestionSetting",
+    metadata,
+    sa.Column("parentUserName", sa.String(20), sa.ForeignKey("Parent.parentUserName"), primary_key=True),
+    sa.Column("allowSuggestions", sa.Boolean, nullable=False, default=True),
+)
+
+# One row per one-off data backfill already applied to this database; see app/modules/data_migrations.py
+dataMigrationTable = sa.Table(
+    "DataMigration",
+    metadata,
+    sa.Column("name", sa.String(64), primary_key=True),
+    sa.Column("appliedAt", sa.DateTime, server_default=func.now(), nullable=False),
 )
 
 #----------------------------------------------------
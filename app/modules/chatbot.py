@@ -1,71 +1,67 @@
-from openai import AsyncOpenAI
 import os
-from typing import Optional
-from datetime import datetime
-import sqlalchemy as sa
-from app.database import get_connection
+from typing import AsyncIterator, List, Optional, Tuple
+from app.modules.child_cache import child_profile_cache, get_age_group
+from app.modules.llm_client import get_llm_client, LLMUnavailableError
+from app.modules.llm_providers import TASK_SUMMARIZE
+from app.modules.moderation_lexicon import StreamModerator
+from app.modules.response_cache import response_cache
+from app.modules.conversation_memory import ConversationMemory
+from app.modules.prompt_registry import estimate_tokens, prompt_registry
+from app.modules.chatbot_quota import chatbot_quota
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+async def summarize_conversation(child_username: str, summary: str, turns: List[dict]) -> str:
+    """Fold older chatbot turns into the running conversation summary"""
+    transcript = "\n".join(
+        f"{'الطفل' if turn['role'] == 'user' else 'المساعد'}: {turn['content']}" for turn in turns
+    )
+    messages = [
+        prompt_registry.template("summary").message,
+        {"role": "user", "content": f"الملخص السابق: {summary or 'لا يوجد'}\n\nالمحادثة:\n{transcript}"}
+    ]
+    response = await get_llm_client("chatbot").chat_completion(
+        task=TASK_SUMMARIZE,
+        messages=messages,
+        temperature=0.2,
+        max_tokens=200
+    )
+    answer = response.choices[0].message.content
+    # Summaries are made on the child's behalf, so they count against the same daily budget
+    chatbot_quota.record_tokens(
+        child_username,
+        response.usage.total_tokens if response.usage
+        else sum(estimate_tokens(message["content"]) for message in messages) + estimate_tokens(answer)
+    )
+    return answer
+
+# Per-child conversation memory shared by all chatbot requests
+conversation_memory = ConversationMemory(summarize=summarize_conversation)
+
 class Chatbot:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("CHATBOT_OPENAI_API_KEY"))
+    @property
+    def llm(self):
+        """Shared chatbot client from the process-wide registry"""
+        return get_llm_client("chatbot")
         
     def get_child_age(self, child_username: str) -> Optional[int]:
-        """Get child's age from the database"""
+        """Get child's age from the cached child profile"""
         try:
-            with get_connection() as conn:
-                query = sa.text("""
-                    SELECT dateOfBirth 
-                    FROM Child 
-                    WHERE childUserName = :username
-                """)
-                result = conn.execute(query, {"username": child_username}).scalar()
-                
-                if result:
-                    birth_date = result
-                    today = datetime.now()
-                    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-                    return age
-                return None
+            profile = child_profile_cache.get_profile(child_username)
+            return profile["age"] if profile else None
         except Exception as e:
             print(f"Error getting child age: {str(e)}")
             return None
 
     def get_age_group(self, age: int) -> str:
         """Determine the age group for response tailoring"""
-        if age <= 6:
-            return "preschool"
-        elif 7 <= age <= 9:
-            return "early_elementary"
-        elif 10 <= age <= 12:
-            return "late_elementary"
-        elif 13 <= age <= 15:
-            return "early_teen"
-        else:
-            return "teen"
+        return get_age_group(age)
 
     def get_system_prompt(self, age_group: str) -> str:
         """Get appropriate system prompt based on age group"""
-        prompts = {
-            "preschool": """أنت مساعد ودود للأطفال في مرحلة ما قبل المدرسة. استخدم لغة بسيطة وجمل قصيرة.
-            كن مرحاً واستخدم أمثلة من عالمهم الصغير. تجنب الكلمات المعقدة.""",
-            
-            "early_elementary": """أنت مساعد صديق للأطفال في المرحلة الابتدائية المبكرة. استخدم لغة واضحة وبسيطة.
-            قدم أمثلة من حياتهم اليومية. كن مشجعاً وداعماً.""",
-            
-            "late_elementary": """أنت مرشد للأطفال في المرحلة الابتدائية المتأخرة. استخدم لغة واضحة مع بعض المفاهيم المتقدمة.
-            قدم أمثلة عملية وشجع التفكير النقدي.""",
-            
-            "early_teen": """أنت مرشد للأطفال في بداية مرحلة المراهقة. استخدم لغة مناسبة لعمرهم مع تقديم مفاهيم أكثر تعقيداً.
-            شجع الاستقلالية والتفكير النقدي.""",
-            
-            "teen": """أنت مرشد للمراهقين. استخدم لغة ناضجة ومناسبة لعمرهم.
-            شجع التفكير المستقل واتخاذ القرارات المسؤولة."""
-        }
-        return prompts.get(age_group, prompts["early_elementary"])
+        return prompt_registry.template(age_group).text
 
     async def get_response(self, child_username: str, message: str) -> str:
         """Get age-appropriate response for the child's message"""
@@ -77,24 +73,112 @@ class Chatbot:
 
             # Determine age group
             age_group = self.get_age_group(age)
+
+            # Earlier turns of this child's conversation, kept within the token budget
+            history = conversation_memory.get_context(child_username)
+
+            # Children of the same age group often ask the same questions; a cached
+            # answer is only valid when there is no earlier context to follow up on
+            if not history:
+                cached = response_cache.get(age_group, message)
+                if cached is not None:
+                    conversation_memory.record(child_username, message, cached)
+                    return cached
             
-            # Create messages array with system prompt and current message only
-            messages = [
-                {"role": "system", "content": self.get_system_prompt(age_group)},
-                {"role": "user", "content": message}
-            ]
+            # Create messages array with system prompt, conversation memory and current message
+            messages = prompt_registry.build_messages(age_group, history, message)
 
             # Get response from GPT
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            response = await self.llm.chat_completion(
                 messages=messages,
                 temperature=0.7,
                 max_tokens=150
             )
 
-            # Return response without storing history
-            return response.choices[0].message.content.strip()
+            answer = response.choices[0].message.content.strip()
+            chatbot_quota.record_tokens(
+                child_username,
+                response.usage.total_tokens if response.usage
+                else prompt_registry.estimate_request_tokens(age_group, history, message) + estimate_tokens(answer)
+            )
+            if not history:
+                response_cache.put(age_group, message, answer)
+            conversation_memory.record(child_username, message, answer)
+            return answer
 
+        except LLMUnavailableError as e:
+            print(f"Chatbot LLM unavailable: {str(e)}")
+            return "عذراً، المساعد مشغول حالياً. يرجى المحاولة مرة أخرى بعد قليل."
         except Exception as e:
             print(f"Error getting chatbot response: {str(e)}")
-            return "عذراً، حدث خطأ في معالجة رسالتك. يرجى المحاولة مرة أخرى لاحقاً."
\ No newline at end of file
+            return "عذراً، حدث خطأ في معالجة رسالتك. يرجى المحاولة مرة أخرى لاحقاً."
+
+    async def stream_response(self, child_username: str, message: str) -> AsyncIterator[Tuple[str, str]]:
+        """Stream an age-appropriate response as (event, text) pairs.
+
+        Events are "token" for moderated text, then one of "done", "blocked" or "error".
+        """
+        age = self.get_child_age(child_username)
+        if not age:
+            yield "error", "عذراً، حدث خطأ في تحديد عمرك. يرجى المحاولة مرة أخرى لاحقاً."
+            return
+
+        age_group = self.get_age_group(age)
+        history = conversation_memory.get_context(child_username)
+        if not history:
+            cached = response_cache.get(age_group, message)
+            if cached is not None:
+                conversation_memory.record(child_username, message, cached)
+                yield "token", cached
+                yield "done", ""
+                return
+
+        messages = prompt_registry.build_messages(age_group, history, message)
+
+        # The output goes straight to a child, so every chunk passes the lexicon first
+        moderator = StreamModerator()
+        stream = self.llm.stream_chat_completion(
+            messages=messages,
+            temperature=0.7,
+            max_tokens=150
+        )
+        answer = []
+        sent = []
+        try:
+            async for delta in stream:
+                answer.append(delta)
+                text = moderator.feed(delta)
+                if text:
+                    sent.append(text)
+                    yield "token", text
+                if moderator.blocked:
+                    yield "blocked", "عذراً، لا أستطيع الإجابة عن هذا السؤال. اسأل والديك أو معلمك."
+                    return
+            text = moderator.flush()
+            if moderator.blocked:
+                yield "blocked", "عذراً، لا أستطيع الإجابة عن هذا السؤال. اسأل والديك أو معلمك."
+                return
+            if text:
+                sent.append(text)
+                yield "token", text
+            if not history:
+                response_cache.put(age_group, message, "".join(answer).strip())
+            # Remember what the child actually saw, after masking
+            conversation_memory.record(child_username, message, "".join(sent).strip())
+            yield "done", ""
+        except LLMUnavailableError as e:
+            print(f"Chatbot LLM unavailable: {str(e)}")
+            yield "error", "عذراً، المساعد مشغول حالياً. يرجى المحاولة مرة أخرى بعد قليل."
+        except Exception as e:
+            print(f"Error streaming chatbot response: {str(e)}")
+            yield "error", "عذراً، حدث خطأ في معالجة رسالتك. يرجى المحاولة مرة أخرى لاحقاً."
+        finally:
+            # Blocked, failed and abandoned streams were still generated upstream, so whatever
+            # arrived is charged too; streamed chunks carry no usage, so it is estimated
+            if answer:
+                chatbot_quota.record_tokens(
+                    child_username,
+                    prompt_registry.estimate_request_tokens(age_group, history, message) + estimate_tokens("".join(answer))
+                )
+            # Closing the upstream stream releases the connection as soon as the client goes away
+            await stream.aclose()
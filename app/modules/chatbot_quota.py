@@ -0,0 +1,293 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional
+import sqlalchemy as sa
+from fastapi import HTTPException
+from app.database import get_connection
+from app.modules.child_cache import child_profile_cache
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# Defaults for children whose parent has not set limits
+CHATBOT_REQUESTS_PER_MINUTE = int(os.getenv("CHATBOT_REQUESTS_PER_MINUTE", "10"))
+CHATBOT_DAILY_REQUESTS = int(os.getenv("CHATBOT_DAILY_REQUESTS", "100"))
+CHATBOT_DAILY_TOKENS = int(os.getenv("CHATBOT_DAILY_TOKENS", "30000"))
+CHATBOT_USAGE_FLUSH_SECONDS = float(os.getenv("CHATBOT_USAGE_FLUSH_SECONDS", "30"))
+
+
+class ChildUsage:
+    """Token bucket plus today's counters for one child"""
+
+    def __init__(self, limits: dict):
+        self.limits = limits
+        self.tokens = float(limits["requestsPerMinute"])
+        self.refilled_at = time.monotonic()
+        self.day = date.today()
+        # Totals known from MySQL plus what this worker has not flushed yet
+        self.stored_requests = 0
+        self.stored_tokens = 0
+        self.pending_requests = 0
+        self.pending_tokens = 0
+
+    @property
+    def requests_today(self) -> int:
+        return self.stored_requests + self.pending_requests
+
+    @property
+    def tokens_today(self) -> int:
+        return self.stored_tokens + self.pending_tokens
+
+    def roll_over(self) -> Optional[dict]:
+        """Start today's counters; returns the previous day's unflushed usage, if any"""
+        if self.day == date.today():
+            return None
+        leftover = None
+        if self.pending_requests or self.pending_tokens:
+            leftover = {"day": self.day, "requests": self.pending_requests, "tokens": self.pending_tokens}
+        self.day = date.today()
+        self.stored_requests = self.stored_tokens = 0
+        self.pending_requests = self.pending_tokens = 0
+        return leftover
+
+    def refill(self):
+        now = time.monotonic()
+        rate = self.limits["requestsPerMinute"] / 60
+        self.tokens = min(float(self.limits["requestsPerMinute"]), self.tokens + (now - self.refilled_at) * rate)
+        self.refilled_at = now
+
+
+class ChatbotQuota:
+    """In-memory per-child chatbot rate limits and daily quotas, flushed to MySQL in batches.
+
+    Limits and today's usage are loaded once at startup and refreshed on every flush. The
+    first request of a child this worker has not counted yet is checked against the child
+    profile cache, which reads the Child table on a miss; later requests stay in memory.
+    """
+
+    def __init__(self):
+        self.default_limits = {
+            "requestsPerMinute": CHATBOT_REQUESTS_PER_MINUTE,
+            "dailyRequests": CHATBOT_DAILY_REQUESTS,
+            "dailyTokens": CHATBOT_DAILY_TOKENS,
+        }
+        self._limits: Dict[str, dict] = {}
+        self._usage: Dict[str, ChildUsage] = {}
+        # Unflushed usage of past days, written to those days' rows by the next flush
+        self._carried: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _get_usage(self, child_username: str) -> ChildUsage:
+        usage = self._usage.get(child_username)
+        if usage is None:
+            usage = self._usage[child_username] = ChildUsage(self._limits.get(child_username, self.default_limits))
+        leftover = usage.roll_over()
+        if leftover is not None:
+            self._carried.append({"child": child_username, **leftover})
+        return usage
+
+    def check(self, child_username: str):
+        """Take one request from the child's budget or raise 429 (404 for an unknown child)"""
+        with self._lock:
+            known = child_username in self._usage
+        # Only real children get counters, so arbitrary names can neither grow memory nor
+        # produce rows the ChatbotUsage foreign key rejects
+        if not known and child_profile_cache.get_profile(child_username) is None:
+            raise HTTPException(status_code=404, detail="الطفل غير موجود")
+        with self._lock:
+            usage = self._get_usage(child_username)
+            limits = usage.limits
+            if usage.requests_today >= limits["dailyRequests"] or usage.tokens_today >= limits["dailyTokens"]:
+                raise HTTPException(status_code=429, detail="لقد وصلت إلى الحد اليومي لاستخدام المساعد")
+            usage.refill()
+            if usage.tokens < 1:
+                retry_after = max(1, int((1 - usage.tokens) * 60 / max(limits["requestsPerMinute"], 1)))
+                raise HTTPException(
+                    status_code=429,
+                    detail="أرسلت أسئلة كثيرة بسرعة، انتظر قليلاً ثم حاول مرة أخرى",
+                    headers={"Retry-After": str(retry_after)}
+                )
+            usage.tokens -= 1
+            usage.pending_requests += 1
+
+    def record_tokens(self, child_username: str, tokens: int):
+        """Count LLM tokens used by an answer against the child's daily budget"""
+        with self._lock:
+            if child_username in self._usage:
+                self._get_usage(child_username).pending_tokens += tokens
+
+    # ---------------------- storage ----------------------
+    def load(self):
+        """Load every parent-set limit and today's usage into memory"""
+        with get_connection() as conn:
+            limits = conn.execute(sa.text("""
+                SELECT childUserName, requestsPerMinute, dailyRequests, dailyTokens FROM ChatbotLimit
+            """)).mappings().all()
+            totals = conn.execute(
+                sa.text("SELECT childUserName, requestCount, tokenCount FROM ChatbotUsage WHERE usageDate = :today"),
+                {"today": date.today()}
+            ).mappings().all()
+
+        with self._lock:
+            self._limits = {
+                row["childUserName"]: {
+                    "requestsPerMinute": row["requestsPerMinute"],
+                    "dailyRequests": row["dailyRequests"],
+                    "dailyTokens": row["dailyTokens"],
+                }
+                for row in limits
+            }
+            for usage_child, usage in self._usage.items():
+                usage.limits = self._limits.get(usage_child, self.default_limits)
+            for row in totals:
+                usage = self._get_usage(row["childUserName"])
+                usage.stored_requests = row["requestCount"]
+                usage.stored_tokens = row["tokenCount"]
+
+    def _write(self, batch: List[dict]):
+        with get_connection() as conn:
+            conn.execute(
+                sa.text("""
+                    INSERT INTO ChatbotUsage (childUserName, usageDate, requestCount, tokenCount)
+                    VALUES (:child, :day, :requests, :tokens)
+                    ON DUPLICATE KEY UPDATE
+                        requestCount = requestCount + VALUES(requestCount),
+                        tokenCount = tokenCount + VALUES(tokenCount)
+                """),
+                batch
+            )
+            conn.commit()
+
+    def _restore(self, batch: List[dict]):
+        """Put counts that could not be written back, so the next flush retries them"""
+        with self._lock:
+            for item in batch:
+                usage = self._usage.get(item["child"])
+                if usage is not None and usage.day == item["day"]:
+                    usage.stored_requests -= item["requests"]
+                    usage.stored_tokens -= item["tokens"]
+                    usage.pending_requests += item["requests"]
+                    usage.pending_tokens += item["tokens"]
+                else:
+                    self._carried.append(item)
+
+    def flush(self):
+        """Write this worker's unflushed usage with one batched upsert, then refresh from MySQL"""
+        with self._lock:
+            batch, self._carried = self._carried, []
+            for child_username, usage in self._usage.items():
+                if usage.pending_requests or usage.pending_tokens:
+                    batch.append({
+                        "child": child_username,
+                        "day": usage.day,
+                        "requests": usage.pending_requests,
+                        "tokens": usage.pending_tokens,
+                    })
+                    usage.stored_requests += usage.pending_requests
+                    usage.stored_tokens += usage.pending_tokens
+                    usage.pending_requests = usage.pending_tokens = 0
+
+        if batch:
+            try:
+                self._write(batch)
+            except (sa.exc.IntegrityError, sa.exc.DataError):
+                # A row MySQL refuses (say, of a child deleted meanwhile) is dropped on its own
+                # instead of failing the batch again on every flush
+                for position, item in enumerate(batch):
+                    try:
+                        self._write([item])
+                    except (sa.exc.IntegrityError, sa.exc.DataError) as e:
+                        print(f"Dropping chatbot usage of {item['child']}: {str(e)}")
+                    except Exception:
+                        self._restore(batch[position:])
+                        raise
+            except Exception:
+                self._restore(batch)
+                raise
+
+        # Pick up limits changed by parents and usage recorded by other workers
+        self.load()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(CHATBOT_USAGE_FLUSH_SECONDS)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Error flushing chatbot usage: {str(e)}")
+
+    def start(self):
+        """Load limits and usage, then flush in the background (called at app startup)"""
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Error loading chatbot limits, using defaults: {str(e)}")
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as e:
+            print(f"Error flushing chatbot usage: {str(e)}")
+
+    # ---------------------- parent controls ----------------------
+    def set_limits(self, parent_username: str, child_username: str, limits: dict):
+        """Store limits for a child of this parent and apply them immediately"""
+        with get_connection() as conn:
+            result = conn.execute(
+                sa.text("""
+                    INSERT INTO ChatbotLimit (childUserName, requestsPerMinute, dailyRequests, dailyTokens)
+                    SELECT childUserName, :rpm, :daily_requests, :daily_tokens
+                    FROM Child
+                    WHERE childUserName = :child AND parentUserName = :parent
+                    ON DUPLICATE KEY UPDATE
+                        requestsPerMinute = VALUES(requestsPerMinute),
+                        dailyRequests = VALUES(dailyRequests),
+                        dailyTokens = VALUES(dailyTokens)
+                """),
+                {
+                    "child": child_username,
+                    "parent": parent_username,
+                    "rpm": limits["requestsPerMinute"],
+                    "daily_requests": limits["dailyRequests"],
+                    "daily_tokens": limits["dailyTokens"],
+                }
+            )
+            conn.commit()
+
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="الطفل غير موجود أو لا يتبع لهذا الأب")
+
+        with self._lock:
+            self._limits[child_username] = dict(limits)
+            self._get_usage(child_username).limits = self._limits[child_username]
+        return {"message": "Chatbot limits updated successfully"}
+
+    def get_status(self, child_username: str) -> dict:
+        """Limits and today's usage for a child"""
+        with self._lock:
+            usage = self._get_usage(child_username)
+            return {
+                **usage.limits,
+                "requestsToday": usage.requests_today,
+                "tokensToday": usage.tokens_today,
+            }
+
+    def forget(self, child_username: str):
+        with self._lock:
+            self._limits.pop(child_username, None)
+            self._usage.pop(child_username, None)
+            self._carried = [item for item in self._carried if item["child"] != child_username]
+
+
+chatbot_quota = ChatbotQuota()
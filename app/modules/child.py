@@ -1,6 +1,11 @@
 from pydantic import BaseModel
 import sqlalchemy as sa
 from app.database import get_connection
+from app.modules.child_cache import child_profile_cache
+from app.modules.friend_graph import add_friend_edges, add_friend_edges_many, set_friend_edges_status
+from app.modules.friend_suggestions import record_friendships, remove_friendship
+from app.modules.social_graph import social_graph
+from app.modules.user_search import user_search_index
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta, timezone
@@ -107,6 +112,8 @@ def update_settings(childUserName: str, settings: dict) -> FriendResponse:
                 update_values
             )
             conn.commit()
+    if "firstName" in settings or "lastName" in settings or "profileIcon" in settings:
+        user_search_index.refresh([childUserName])
     
     return FriendResponse(
         message="Settings updated successfully!",
@@ -156,6 +163,8 @@ def update_child_by_parent(childUserName: str, updates: dict):
         conn.execute(update_query, update_values)
         conn.commit()
 
+    child_profile_cache.invalidate(childUserName)
+    user_search_index.refresh([childUserName])
     return {"message": "Child updated successfully"}
 
 
@@ -165,46 +174,84 @@ def update_child_by_parent(childUserName: str, updates: dict):
 
 # ---------------------- create a friendship request ------------------------
 def create_friend_request(sender: str, receiver: str) -> FriendResponse:
+    """Create a pending request in one statement; the checks only run when it inserts nothing"""
+    try:
+        with get_connection() as conn:
+            # Both children must exist, be different and not be friends or blocked already;
+            # a second pending request between them (either direction) violates uq_request_pending_pair
+            created = conn.execute(
+                sa.text("""
+                    INSERT INTO Request (requestChildUserName, ReceiverChildUserName, requestStatus)
+                    SELECT s.childUserName, r.childUserName, 'Pending'
+                    FROM Child s
+                    JOIN Child r ON r.childUserName = :receiver
+                    WHERE s.childUserName = :sender
+                    AND s.childUserName != r.childUserName
+                    AND NOT EXISTS (
+                        SELECT 1 FROM FriendEdge
+                        WHERE childUserName = :sender AND friendUserName = :receiver
+                    )
+                """),
+                {"sender": sender, "receiver": receiver}
+            ).rowcount
+            conn.commit()
+    except sa.exc.IntegrityError:
+        created = None
+
+    if not created:
+        return _friend_request_not_created(sender, receiver)
+    
+    return FriendResponse(
+        message="Friend request sent successfully!",
+        data=None
+    )
+
+def _friend_request_not_created(sender: str, receiver: str) -> FriendResponse:
+    """Work out why a friend request was not inserted, accepting it when the receiver already asked"""
     with get_connection() as conn:
-        # Validate sender and receiver
-        for user, role in [(sender, "Sender"), (receiver, "Receiver")]:
-            if not conn.execute(
-                sa.text("SELECT 1 FROM Child WHERE childUserName = :username"),
-                {"username": user}
-            ).scalar():
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"{role} child does not exist"
-                )
-
-        # existing request
-        if conn.execute(
+        state = conn.execute(
             sa.text("""
-                SELECT 1 FROM Request 
-                WHERE requestChildUserName = :sender 
-                AND ReceiverChildUserName = :receiver 
-                AND requestStatus = 'Pending'
+                SELECT
+                    EXISTS(SELECT 1 FROM Child WHERE childUserName = :sender) AS senderExists,
+                    EXISTS(SELECT 1 FROM Child WHERE childUserName = :receiver) AS receiverExists,
+                    (
+                        SELECT status FROM FriendEdge
+                        WHERE childUserName = :sender AND friendUserName = :receiver
+                    ) AS friendship,
+                    (
+                        SELECT requestID FROM Request
+                        WHERE requestChildUserName = :receiver
+                        AND ReceiverChildUserName = :sender
+                        AND requestStatus = 'Pending'
+                        LIMIT 1
+                    ) AS mutualRequestID
             """),
             {"sender": sender, "receiver": receiver}
-        ).scalar():
+        ).mappings().first()
+
+    for exists, role in [(state["senderExists"], "Sender"), (state["receiverExists"], "Receiver")]:
+        if not exists:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Friend request already exists"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{role} child does not exist"
             )
-
-        # new request
-        conn.execute(
-            sa.text("""
-                INSERT INTO Request (requestChildUserName, ReceiverChildUserName, requestStatus)
-                VALUES (:sender, :receiver, 'Pending')
-            """),
-            {"sender": sender, "receiver": receiver}
+    if sender == receiver:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You cannot send a friend request to yourself"
         )
-        conn.commit()
-    
-    return FriendResponse(
-        message="Friend request sent successfully!",
-        data=None
+    if state["friendship"] is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You are already friends" if state["friendship"] == "Active" else "This friendship is blocked"
+        )
+    if state["mutualRequestID"] is not None:
+        # Both children asked: accept the one that was already waiting
+        accept_friend_request(state["mutualRequestID"], sender)
+        return FriendResponse(message="Friend request accepted: you had a pending request from this child.", data=None)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Friend request already exists"
     )
 
 # ---------------------- return the requests avialable ----------------------
@@ -261,7 +308,7 @@ def accept_friend_request(request_id: int, receiver: str) -> FriendResponse:
         sender, receiver_child_username = request
 
         # Insert into Friendship
-        conn.execute(
+        friendship = conn.execute(
             sa.text("""
                 INSERT INTO Friendship (childUserName1, childUserName2, status)
                 VALUES (:child1, :child2, 'Active')
@@ -271,6 +318,8 @@ def accept_friend_request(request_id: int, receiver: str) -> FriendResponse:
                 "child2": receiver_child_username
             }
         )
+        add_friend_edges(conn, sender, receiver_child_username, friendship.lastrowid)
+        record_friendships(conn, receiver_child_username, [sender])
 
         # Delete the request from Request table
         conn.execute(
@@ -279,6 +328,7 @@ def accept_friend_request(request_id: int, receiver: str) -> FriendResponse:
         )
 
         conn.commit()
+    social_graph.invalidate(sender, receiver_child_username)
 
     return FriendResponse(message="Friend request accepted and removed.", data=None)
 
@@ -313,6 +363,86 @@ def reject_friend_request(request_id: int, receiver: str) -> FriendResponse:
 
     return FriendResponse(message="Friend request rejected and removed.", data=None)
 
+# ---------------------- accept / reject many requests ----------------------
+MAX_BATCH_FRIEND_REQUESTS = 100
+
+def _lock_pending_requests(conn, request_ids: List[int], receiver: str) -> dict:
+    """Pending requests among request_ids addressed to receiver, locked until commit"""
+    rows = conn.execute(
+        sa.text("""
+            SELECT requestID, requestChildUserName
+            FROM Request
+            WHERE requestID IN :ids
+            AND ReceiverChildUserName = :receiver
+            AND requestStatus = 'Pending'
+            FOR UPDATE
+        """).bindparams(sa.bindparam("ids", expanding=True)),
+        {"ids": request_ids, "receiver": receiver}
+    ).all()
+    return {request_id: sender for request_id, sender in rows}
+
+def _delete_requests(conn, request_ids: List[int]):
+    conn.execute(
+        sa.text("DELETE FROM Request WHERE requestID IN :ids").bindparams(sa.bindparam("ids", expanding=True)),
+        {"ids": request_ids}
+    )
+
+def _batch_outcomes(request_ids: List[int], handled: dict, outcome: str) -> List[dict]:
+    return [
+        {"requestID": request_id, "status": outcome if request_id in handled else "not_found"}
+        for request_id in request_ids
+    ]
+
+def accept_friend_requests(request_ids: List[int], receiver: str) -> FriendResponse:
+    """Accept many requests in one transaction with a fixed number of queries; per-id outcomes"""
+    request_ids = list(dict.fromkeys(request_ids))
+    with get_connection() as conn:
+        pending = _lock_pending_requests(conn, request_ids, receiver)
+        senders = list(dict.fromkeys(pending.values()))
+        if senders:
+            conn.execute(
+                sa.text("""
+                    INSERT INTO Friendship (childUserName1, childUserName2, status)
+                    VALUES (:child1, :child2, 'Active')
+                """),
+                [{"child1": sender, "child2": receiver} for sender in senders]
+            )
+            # A multi-row insert only reports the first id, so read back the newest friendship per sender
+            friendships = conn.execute(
+                sa.text("""
+                    SELECT childUserName1, MAX(friendshipID)
+                    FROM Friendship
+                    WHERE childUserName2 = :receiver AND childUserName1 IN :senders
+                    GROUP BY childUserName1
+                """).bindparams(sa.bindparam("senders", expanding=True)),
+                {"receiver": receiver, "senders": senders}
+            ).all()
+            add_friend_edges_many(conn, [(sender, receiver, friendship_id) for sender, friendship_id in friendships])
+            record_friendships(conn, receiver, senders)
+            _delete_requests(conn, list(pending))
+        conn.commit()
+    if senders:
+        social_graph.invalidate(receiver, *senders)
+
+    return FriendResponse(
+        message=f"Accepted {len(pending)} of {len(request_ids)} friend requests.",
+        data=_batch_outcomes(request_ids, pending, "accepted")
+    )
+
+def reject_friend_requests(request_ids: List[int], receiver: str) -> FriendResponse:
+    """Reject many requests in one transaction; per-id outcomes"""
+    request_ids = list(dict.fromkeys(request_ids))
+    with get_connection() as conn:
+        pending = _lock_pending_requests(conn, request_ids, receiver)
+        if pending:
+            _delete_requests(conn, list(pending))
+        conn.commit()
+
+    return FriendResponse(
+        message=f"Rejected {len(pending)} of {len(request_ids)} friend requests.",
+        data=_batch_outcomes(request_ids, pending, "rejected")
+    )
+
 # ---------------------- get the friends of the child ----------------------
 def get_friends(childUserName: str) -> FriendResponse:
     """Get all friends for a child"""
@@ -320,13 +450,10 @@ def get_friends(childUserName: str) -> FriendResponse:
         results = conn.execute(
             sa.text("""
                 SELECT c.childUserName, c.firstName, c.lastName, c.profileIcon
-                FROM Friendship f
-                JOIN Child c ON (
-                    (f.childUserName1 = c.childUserName AND f.childUserName2 = :childUserName) OR
-                    (f.childUserName2 = c.childUserName AND f.childUserName1 = :childUserName)
-                )
-                WHERE f.status = 'Active'
-                AND c.childUserName != :childUserName
+                FROM FriendEdge e
+                JOIN Child c ON c.childUserName = e.friendUserName
+                WHERE e.childUserName = :childUserName
+                AND e.status = 'Active'
             """),
             {"childUserName": childUserName}
         ).mappings().all()
@@ -337,24 +464,10 @@ def get_friends(childUserName: str) -> FriendResponse:
     )
 #-------------------------- friend search --------------------
 def search_users(query: str, current_child_username: str) -> FriendResponse:
-    with get_connection() as conn:
-        results = conn.execute(
-            sa.text("""
-                SELECT childUserName, firstName, lastName, profileIcon
-                FROM Child
-                WHERE childUserName LIKE :query
-                AND childUserName != :current_user
-                LIMIT 10
-            """),
-            {
-                "query": f"%{query}%",
-                "current_user": current_child_username
-            }
-        ).mappings().all()
-    
+    """Match usernames and names by prefix or infix, friends of friends first"""
     return FriendResponse(
         message="Search results retrieved successfully",
-        data=[dict(row) for row in results]
+        data=user_search_index.search(query, current_child_username)
     )
 
 
@@ -364,14 +477,10 @@ def block_friend(childUserName: str, friendUserName: str) -> FriendResponse:
     with get_connection() as conn:
         result = conn.execute(
             sa.text("""
-                SELECT * FROM Friendship
-                WHERE (
-                    (childUserName1 = :childUserName AND childUserName2 = :friendUserName) OR
-                    (childUserName1 = :friendUserName AND childUserName2 = :childUserName)
-                )
+                SELECT friendshipID FROM FriendEdge
+                WHERE childUserName = :childUserName
+                AND friendUserName = :friendUserName
                 AND status = 'Active'
-                ORDER BY friendshipID DESC
-                LIMIT 1
             """),
             {"childUserName": childUserName, "friendUserName": friendUserName}
         ).mappings().first()
@@ -390,7 +499,10 @@ def block_friend(childUserName: str, friendUserName: str) -> FriendResponse:
             """),
             {"fid": result['friendshipID']}
         )
+        set_friend_edges_status(conn, childUserName, friendUserName, "Blocked")
+        remove_friendship(conn, childUserName, friendUserName)
         conn.commit()
+    social_graph.invalidate(childUserName, friendUserName)
 
     return FriendResponse(
         message="Friend blocked successfully!",
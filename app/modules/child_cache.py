@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+import sqlalchemy as sa
+from app.database import get_connection
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+CHILD_CACHE_TTL_SECONDS = float(os.getenv("CHILD_CACHE_TTL_SECONDS", "600"))
+CHILD_CACHE_MAX_ENTRIES = int(os.getenv("CHILD_CACHE_MAX_ENTRIES", "10000"))
+
+
+def calculate_age(birth_date: date) -> int:
+    """Age in whole years as of today"""
+    today = datetime.now()
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+def get_age_group(age: int) -> str:
+    """Determine the age group for response tailoring"""
+    if age <= 6:
+        return "preschool"
+    elif 7 <= age <= 9:
+        return "early_elementary"
+    elif 10 <= age <= 12:
+        return "late_elementary"
+    elif 13 <= age <= 15:
+        return "early_teen"
+    else:
+        return "teen"
+
+
+class ChildProfileCache:
+    """LRU cache with TTL of the child fields used on every message and chatbot request.
+
+    Only the date of birth and parent are stored; age and age group are derived on
+    read so a cached entry never goes stale across a birthday.
+    """
+
+    def __init__(self, ttl_seconds: float = CHILD_CACHE_TTL_SECONDS, max_entries: int = CHILD_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Notification delivery runs in worker threads, so access is guarded
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _build_profile(self, username: str, row: dict) -> dict:
+        age = calculate_age(row["dateOfBirth"])
+        return {
+            "childUserName": username,
+            "age": age,
+            "ageGroup": get_age_group(age),
+            "parentUserName": row["parentUserName"],
+        }
+
+    def _lookup(self, username: str) -> Optional[dict]:
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self._entries.move_to_end(username)
+        return entry[1]
+
+    def _store(self, username: str, row: dict):
+        self._entries[username] = (time.monotonic() + self.ttl_seconds, row)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_profiles(self, usernames: Iterable[str]) -> Dict[str, dict]:
+        """Profiles for the given children; cache misses are loaded with a single query"""
+        usernames = set(usernames)
+        rows = {}
+        with self._lock:
+            for username in usernames:
+                row = self._lookup(username)
+                if row is not None:
+                    rows[username] = row
+            self.stats["hits"] += len(rows)
+            self.stats["misses"] += len(usernames) - len(rows)
+
+        missing = [username for username in usernames if username not in rows]
+        if missing:
+            with get_connection() as conn:
+                query = sa.text("""
+                    SELECT childUserName, dateOfBirth, parentUserName
+                    FROM Child
+                    WHERE childUserName IN :usernames
+                """).bindparams(sa.bindparam("usernames", expanding=True))
+                loaded = conn.execute(query, {"usernames": missing}).mappings().all()
+            with self._lock:
+                for result in loaded:
+                    row = {"dateOfBirth": result["dateOfBirth"], "parentUserName": result["parentUserName"]}
+                    self._store(result["childUserName"], row)
+                    rows[result["childUserName"]] = row
+
+        return {username: self._build_profile(username, row) for username, row in rows.items()}
+
+    def get_profile(self, username: str) -> Optional[dict]:
+        """Profile of one child, or None if the child does not exist"""
+        return self.get_profiles([username]).get(username)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def invalidate_parent(self, parent_username: str):
+        """Drop every cached child that belongs to the parent"""
+        with self._lock:
+            for username in [u for u, (_, row) in self._entries.items() if row["parentUserName"] == parent_username]:
+                del self._entries[username]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+child_profile_cache = ChildProfileCache()
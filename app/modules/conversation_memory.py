@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional
+import sqlalchemy as sa
+from app.database import get_connection
+from app.modules.prompt_registry import estimate_tokens
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+CHATBOT_MEMORY_MAX_TURNS = int(os.getenv("CHATBOT_MEMORY_MAX_TURNS", "12"))
+CHATBOT_MEMORY_TOKEN_BUDGET = int(os.getenv("CHATBOT_MEMORY_TOKEN_BUDGET", "600"))
+CHATBOT_MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("CHATBOT_MEMORY_SUMMARY_MAX_CHARS", "800"))
+CHATBOT_MEMORY_TURN_MAX_CHARS = int(os.getenv("CHATBOT_MEMORY_TURN_MAX_CHARS", "1000"))
+CHATBOT_MEMORY_IDLE_SECONDS = float(os.getenv("CHATBOT_MEMORY_IDLE_SECONDS", "1800"))
+CHATBOT_MEMORY_MAX_CHILDREN = int(os.getenv("CHATBOT_MEMORY_MAX_CHILDREN", "5000"))
+# How long shutdown waits for summaries still being written before cancelling them
+CHATBOT_MEMORY_STOP_TIMEOUT_SECONDS = float(os.getenv("CHATBOT_MEMORY_STOP_TIMEOUT_SECONDS", "5"))
+# Keep conversations in the ChatbotMemory table so they survive restarts
+CHATBOT_MEMORY_PERSIST = os.getenv("CHATBOT_MEMORY_PERSIST", "false").lower() == "true"
+
+
+class Conversation:
+    """Recent turns of one child plus a rolling summary of everything older"""
+
+    def __init__(self, turns: Optional[List[dict]] = None, summary: str = ""):
+        self.turns = deque(turns or [], maxlen=CHATBOT_MEMORY_MAX_TURNS)
+        self.summary = summary
+        # Turns pushed out of the budget that still need to be folded into the summary
+        self.unsummarized: List[dict] = []
+        self.summarizing = False
+        self.last_active = time.monotonic()
+
+    def turn_tokens(self) -> int:
+        return sum(estimate_tokens(turn["content"]) for turn in self.turns)
+
+
+class ConversationMemory:
+    """Per-child chat history with a token budget, rolling summaries and idle eviction.
+
+    At most max_children conversations are held in memory; the least recently used and
+    those idle for longer than idle_seconds are dropped first.
+    """
+
+    def __init__(self, summarize: Optional[Callable[[str, str, List[dict]], Awaitable[str]]] = None,
+                 token_budget: int = CHATBOT_MEMORY_TOKEN_BUDGET, max_children: int = CHATBOT_MEMORY_MAX_CHILDREN,
+                 idle_seconds: float = CHATBOT_MEMORY_IDLE_SECONDS, persist: bool = CHATBOT_MEMORY_PERSIST):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.max_children = max_children
+        self.idle_seconds = idle_seconds
+        self.persist = persist
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Running summaries, referenced until they finish so they are not garbage collected
+        self._tasks = set()
+
+    # ---------------------- storage ----------------------
+    def _load(self, child_username: str) -> Conversation:
+        if not self.persist:
+            return Conversation()
+        try:
+            with get_connection() as conn:
+                row = conn.execute(
+                    sa.text("SELECT summary, turns FROM ChatbotMemory WHERE childUserName = :username"),
+                    {"username": child_username}
+                ).mappings().first()
+        except Exception as e:
+            print(f"Error loading chatbot memory: {str(e)}")
+            return Conversation()
+        if not row:
+            return Conversation()
+        return Conversation(json.loads(row["turns"] or "[]"), row["summary"] or "")
+
+    def _save(self, child_username: str, summary: str, turns: List[dict]):
+        try:
+            with get_connection() as conn:
+                conn.execute(
+                    sa.text("""
+                        INSERT INTO ChatbotMemory (childUserName, summary, turns)
+                        VALUES (:username, :summary, :turns)
+                        ON DUPLICATE KEY UPDATE summary = VALUES(summary), turns = VALUES(turns)
+                    """),
+                    {"username": child_username, "summary": summary, "turns": json.dumps(turns, ensure_ascii=False)}
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"Error saving chatbot memory: {str(e)}")
+
+    def _persist_later(self, child_username: str, conversation: Conversation):
+        if not self.persist:
+            return
+        snapshot = (child_username, conversation.summary, list(conversation.turns))
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._save, *snapshot)
+        except RuntimeError:
+            self._save(*snapshot)
+
+    # ---------------------- access ----------------------
+    def _evict(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._conversations:
+            username, conversation = next(iter(self._conversations.items()))
+            if len(self._conversations) <= self.max_children and conversation.last_active >= cutoff:
+                break
+            del self._conversations[username]
+
+    def _get(self, child_username: str) -> Conversation:
+        with self._lock:
+            conversation = self._conversations.get(child_username)
+            if conversation is not None:
+                self._conversations.move_to_end(child_username)
+                conversation.last_active = time.monotonic()
+                return conversation
+        conversation = self._load(child_username)
+        with self._lock:
+            conversation = self._conversations.setdefault(child_username, conversation)
+            self._conversations.move_to_end(child_username)
+            self._evict()
+        return conversation
+
+    def get_context(self, child_username: str) -> List[dict]:
+        """Messages to place between the system prompt and the new question"""
+        conversation = self._get(child_username)
+        context = []
+        if conversation.summary:
+            context.append({"role": "system", "content": f"ملخص المحادثة السابقة مع الطفل: {conversation.summary}"})
+        context.extend({"role": turn["role"], "content": turn["content"]} for turn in conversation.turns)
+        return context
+
+    def record(self, child_username: str, question: str, answer: str):
+        """Add a question/answer pair and fold turns beyond the token budget into the summary"""
+        conversation = self._get(child_username)
+        with self._lock:
+            for role, content in (("user", question), ("assistant", answer)):
+                if len(conversation.turns) == conversation.turns.maxlen:
+                    conversation.unsummarized.append(conversation.turns[0])
+                conversation.turns.append({"role": role, "content": content[:CHATBOT_MEMORY_TURN_MAX_CHARS]})
+            while len(conversation.turns) > 2 and conversation.turn_tokens() > self.token_budget:
+                conversation.unsummarized.append(conversation.turns.popleft())
+            needs_summary = bool(conversation.unsummarized) and not conversation.summarizing
+            if needs_summary:
+                conversation.summarizing = True
+
+        if needs_summary:
+            try:
+                task = asyncio.get_running_loop().create_task(self._summarize(child_username, conversation))
+                self._tasks.add(task)
+                task.add_done_callback(self._summary_done)
+                return
+            except RuntimeError:
+                self._fold_without_llm(conversation)
+                conversation.summarizing = False
+        self._persist_later(child_username, conversation)
+
+    def _fold_without_llm(self, conversation: Conversation):
+        """Fallback summary: keep the tail of the old summary plus the dropped questions"""
+        dropped = " | ".join(turn["content"] for turn in conversation.unsummarized if turn["role"] == "user")
+        conversation.unsummarized = []
+        conversation.summary = f"{conversation.summary} | {dropped}".strip(" |")[-CHATBOT_MEMORY_SUMMARY_MAX_CHARS:]
+
+    async def _summarize(self, child_username: str, conversation: Conversation):
+        try:
+            while conversation.unsummarized:
+                turns, conversation.unsummarized = conversation.unsummarized, []
+                try:
+                    if self.summarize is None:
+                        raise RuntimeError("No summarizer configured")
+                    summary = await self.summarize(child_username, conversation.summary, turns)
+                    conversation.summary = summary.strip()[:CHATBOT_MEMORY_SUMMARY_MAX_CHARS]
+                except Exception as e:
+                    print(f"Error summarizing chatbot memory, truncating instead: {str(e)}")
+                    conversation.unsummarized = turns + conversation.unsummarized
+                    self._fold_without_llm(conversation)
+                except asyncio.CancelledError:
+                    # Shutting down: keep the dropped turns in the cheap summary rather than lose them
+                    conversation.unsummarized = turns + conversation.unsummarized
+                    self._fold_without_llm(conversation)
+                    self._persist_later(child_username, conversation)
+                    raise
+        finally:
+            conversation.summarizing = False
+        self._persist_later(child_username, conversation)
+
+    def _summary_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error in chatbot memory summary: {str(task.exception())}")
+
+    async def stop(self, timeout: float = CHATBOT_MEMORY_STOP_TIMEOUT_SECONDS):
+        """Wait for running summaries, cancelling those not done within timeout (called at app shutdown)"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def forget(self, child_username: str):
+        """Drop a child's conversation from memory (the caller removes stored rows)"""
+        with self._lock:
+            self._conversations.pop(child_username, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"active_children": len(self._conversations)}
@@ -0,0 +1,38 @@
+import time
+import sqlalchemy as sa
+from app.database import get_connection
+from app.modules.friend_graph import backfill_friend_edges
+from app.modules.friend_suggestions import rebuild_friend_suggestions
+
+# Data backfills that must have run before the app serves requests, in the order they apply.
+# Each one is idempotent, so two workers starting together may both run it without harm.
+MIGRATIONS = [
+    ("friend_edges", backfill_friend_edges),
+    # Suggestions are derived from FriendEdge, so they are seeded after it
+    ("friend_suggestions", rebuild_friend_suggestions),
+]
+
+# ---------------------- migrations ----------------------
+def applied_migrations() -> set:
+    with get_connection() as conn:
+        return {row.name for row in conn.execute(sa.text("SELECT name FROM DataMigration"))}
+
+def run_data_migrations() -> list:
+    """Apply every migration not yet recorded in DataMigration and return the names that ran"""
+    applied = applied_migrations()
+    ran = []
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        started = time.perf_counter()
+        rows = migrate()
+        with get_connection() as conn:
+            conn.execute(sa.text("INSERT IGNORE INTO DataMigration (name) VALUES (:name)"), {"name": name})
+            conn.commit()
+        print(f"Data migration '{name}' applied ({rows} rows) in {time.perf_counter() - started:.1f}s")
+        ran.append(name)
+    return ran
+
+
+if __name__ == "__main__":
+    print(f"Applied data migrations: {run_data_migrations() or 'none pending'}")
@@ -0,0 +1,76 @@
+import sqlalchemy as sa
+from app.database import get_connection
+
+# FriendEdge stores every friendship twice, once from each side, so "friends of X" and
+# "is X blocked by Y" are primary key range scans instead of an OR across two columns.
+
+# ---------------------- edge maintenance ----------------------
+def add_friend_edges(conn, child1: str, child2: str, friendship_id: int):
+    """Record an active friendship in both directions inside the caller's transaction"""
+    add_friend_edges_many(conn, [(child1, child2, friendship_id)])
+
+def add_friend_edges_many(conn, friendships: list):
+    """add_friend_edges for several (child1, child2, friendshipID) tuples in one multi-row insert"""
+    if not friendships:
+        return
+    conn.execute(
+        sa.text("""
+            INSERT INTO FriendEdge (childUserName, friendUserName, status, friendshipID)
+            VALUES (:child, :friend, 'Active', :friendshipID)
+            ON DUPLICATE KEY UPDATE status = 'Active', friendshipID = VALUES(friendshipID)
+        """),
+        [
+            {"child": child, "friend": friend, "friendshipID": friendship_id}
+            for child1, child2, friendship_id in friendships
+            for child, friend in ((child1, child2), (child2, child1))
+        ]
+    )
+
+def set_friend_edges_status(conn, child1: str, child2: str, status: str):
+    """Change the status of both directions of a friendship inside the caller's transaction"""
+    conn.execute(
+        sa.text("""
+            UPDATE FriendEdge SET status = :status
+            WHERE childUserName = :child AND friendUserName = :friend
+        """),
+        [
+            {"child": child1, "friend": child2, "status": status},
+            {"child": child2, "friend": child1, "status": status},
+        ]
+    )
+
+def delete_friend_edges_for(conn, usernames: list):
+    """Remove every edge touching the given children inside the caller's transaction"""
+    if not usernames:
+        return
+    for column in ("childUserName", "friendUserName"):
+        conn.execute(
+            sa.text(f"DELETE FROM FriendEdge WHERE {column} IN :usernames").bindparams(
+                sa.bindparam("usernames", expanding=True)
+            ),
+            {"usernames": list(usernames)}
+        )
+
+# ---------------------- backfill ----------------------
+def backfill_friend_edges() -> int:
+    """Build FriendEdge from the Friendship table; safe to run again at any time.
+
+    Rows are applied in friendshipID order so the latest friendship between two children wins.
+    """
+    with get_connection() as conn:
+        result = conn.execute(sa.text("""
+            INSERT INTO FriendEdge (childUserName, friendUserName, status, friendshipID)
+            SELECT child, friend, status, friendshipID FROM (
+                SELECT childUserName1 AS child, childUserName2 AS friend, status, friendshipID FROM Friendship
+                UNION ALL
+                SELECT childUserName2 AS child, childUserName1 AS friend, status, friendshipID FROM Friendship
+            ) AS edges
+            ORDER BY friendshipID
+            ON DUPLICATE KEY UPDATE status = VALUES(status), friendshipID = VALUES(friendshipID)
+        """))
+        conn.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    print(f"Backfilled friend edges ({backfill_friend_edges()} rows affected)")
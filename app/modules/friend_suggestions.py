@@ -0,0 +1,240 @@
+import os
+import sqlalchemy as sa
+from app.database import get_connection
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+FRIEND_SUGGESTIONS_DEFAULT_LIMIT = int(os.getenv("FRIEND_SUGGESTIONS_DEFAULT_LIMIT", "20"))
+FRIEND_SUGGESTIONS_MAX_LIMIT = 50
+
+# FriendSuggestion holds, for every child, the children they are not connected to but share
+# active friends with, and how many. Pairs that already have a FriendEdge (friends or blocked)
+# are never stored. Counts are adjusted in the transaction that changes a friendship, so
+# reading suggestions is one range scan on (childUserName, mutualCount).
+
+# Ordered pairs whose mutual count drops when :child1 and :child2 stop being friends:
+# child2 with each other friend of child1, and child1 with each other friend of child2
+_AFFECTED_PAIRS = """
+    SELECT :child2 AS child, e.friendUserName AS candidate FROM FriendEdge e
+    WHERE e.childUserName = :child1 AND e.status = 'Active' AND e.friendUserName != :child2
+    UNION ALL
+    SELECT e.friendUserName, :child2 FROM FriendEdge e
+    WHERE e.childUserName = :child1 AND e.status = 'Active' AND e.friendUserName != :child2
+    UNION ALL
+    SELECT :child1, e.friendUserName FROM FriendEdge e
+    WHERE e.childUserName = :child2 AND e.status = 'Active' AND e.friendUserName != :child1
+    UNION ALL
+    SELECT e.friendUserName, :child1 FROM FriendEdge e
+    WHERE e.childUserName = :child2 AND e.status = 'Active' AND e.friendUserName != :child1
+"""
+
+
+# ---------------------- incremental maintenance ----------------------
+def record_friendships(conn, child: str, new_friends: list):
+    """Count new mutual friends after child became friends with everyone in new_friends.
+
+    Runs inside the caller's transaction after the FriendEdge rows are written, with a
+    fixed number of statements however many friendships were added. A pair of child's
+    friends gains child as a mutual friend when at least one of them is new, and child
+    gains each new friend as a mutual friend with that friend's other friends.
+    """
+    if not new_friends:
+        return
+    conn.execute(
+        sa.text("""
+            INSERT INTO FriendSuggestion (childUserName, candidateUserName, mutualCount)
+            SELECT * FROM (
+                SELECT pair.child, pair.candidate, SUM(pair.gained) AS gained
+                FROM (
+                    SELECT a.friendUserName AS child, b.friendUserName AS candidate, 1 AS gained
+                    FROM FriendEdge a
+                    JOIN FriendEdge b
+                        ON b.childUserName = a.childUserName AND b.status = 'Active'
+                        AND b.friendUserName != a.friendUserName
+                    WHERE a.childUserName = :child AND a.status = 'Active'
+                      AND (a.friendUserName IN :newFriends OR b.friendUserName IN :newFriends)
+                    UNION ALL
+                    SELECT :child, e.friendUserName, 1 FROM FriendEdge e
+                    WHERE e.childUserName IN :newFriends AND e.status = 'Active' AND e.friendUserName != :child
+                    UNION ALL
+                    SELECT e.friendUserName, :child, 1 FROM FriendEdge e
+                    WHERE e.childUserName IN :newFriends AND e.status = 'Active' AND e.friendUserName != :child
+                ) AS pair
+                LEFT JOIN FriendEdge known
+                    ON known.childUserName = pair.child AND known.friendUserName = pair.candidate
+                WHERE known.childUserName IS NULL
+                GROUP BY pair.child, pair.candidate
+            ) AS gains
+            ON DUPLICATE KEY UPDATE mutualCount = mutualCount + VALUES(mutualCount)
+        """).bindparams(sa.bindparam("newFriends", expanding=True)),
+        {"child": child, "newFriends": list(new_friends)}
+    )
+    _drop_pairs(conn, child, new_friends)
+
+def remove_friendship(conn, child1: str, child2: str):
+    """Undo record_friendships when the friendship is blocked, inside the caller's transaction"""
+    params = {"child1": child1, "child2": child2}
+    conn.execute(
+        sa.text(f"""
+            UPDATE FriendSuggestion s
+            JOIN ({_AFFECTED_PAIRS}) AS pair
+                ON s.childUserName = pair.child AND s.candidateUserName = pair.candidate
+            SET s.mutualCount = s.mutualCount - 1
+        """),
+        params
+    )
+    conn.execute(
+        sa.text(f"""
+            DELETE s FROM FriendSuggestion s
+            JOIN ({_AFFECTED_PAIRS}) AS pair
+                ON s.childUserName = pair.child AND s.candidateUserName = pair.candidate
+            WHERE s.mutualCount <= 0
+        """),
+        params
+    )
+    _drop_pairs(conn, child1, [child2])
+
+def _drop_pairs(conn, child: str, others: list):
+    """Forget suggestions between child and others once they are connected"""
+    conn.execute(
+        sa.text("""
+            DELETE FROM FriendSuggestion
+            WHERE (childUserName = :child AND candidateUserName IN :others)
+               OR (candidateUserName = :child AND childUserName IN :others)
+        """).bindparams(sa.bindparam("others", expanding=True)),
+        {"child": child, "others": list(others)}
+    )
+
+def forget_children(conn, usernames: list):
+    """Remove deleted children from suggestions, including as the mutual friend of others.
+
+    Must run before their FriendEdge rows are deleted.
+    """
+    if not usernames:
+        return
+    params = {"usernames": list(usernames)}
+    lost = """
+        SELECT a.friendUserName AS child, b.friendUserName AS candidate, COUNT(*) AS lost
+        FROM FriendEdge a
+        JOIN FriendEdge b
+            ON b.childUserName = a.childUserName AND b.status = 'Active' AND b.friendUserName != a.friendUserName
+        WHERE a.childUserName IN :usernames AND a.status = 'Active'
+        GROUP BY a.friendUserName, b.friendUserName
+    """
+    conn.execute(
+        sa.text(f"""
+            UPDATE FriendSuggestion s
+            JOIN ({lost}) AS lost ON s.childUserName = lost.child AND s.candidateUserName = lost.candidate
+            SET s.mutualCount = s.mutualCount - lost.lost
+        """).bindparams(sa.bindparam("usernames", expanding=True)),
+        params
+    )
+    conn.execute(
+        sa.text(f"""
+            DELETE s FROM FriendSuggestion s
+            JOIN ({lost}) AS lost ON s.childUserName = lost.child AND s.candidateUserName = lost.candidate
+            WHERE s.mutualCount <= 0
+        """).bindparams(sa.bindparam("usernames", expanding=True)),
+        params
+    )
+    for column in ("childUserName", "candidateUserName"):
+        conn.execute(
+            sa.text(f"DELETE FROM FriendSuggestion WHERE {column} IN :usernames").bindparams(
+                sa.bindparam("usernames", expanding=True)
+            ),
+            params
+        )
+
+# ---------------------- backfill ----------------------
+def rebuild_friend_suggestions() -> int:
+    """Recompute every suggestion from FriendEdge; safe to run again at any time"""
+    with get_connection() as conn:
+        conn.execute(sa.text("DELETE FROM FriendSuggestion"))
+        result = conn.execute(sa.text("""
+            INSERT INTO FriendSuggestion (childUserName, candidateUserName, mutualCount)
+            SELECT a.childUserName, b.friendUserName, COUNT(*)
+            FROM FriendEdge a
+            JOIN FriendEdge b ON b.childUserName = a.friendUserName AND b.status = 'Active'
+            LEFT JOIN FriendEdge known
+                ON known.childUserName = a.childUserName AND known.friendUserName = b.friendUserName
+            WHERE a.status = 'Active'
+              AND b.friendUserName != a.childUserName
+              AND known.childUserName IS NULL
+            GROUP BY a.childUserName, b.friendUserName
+        """))
+        conn.commit()
+    return result.rowcount
+
+# ---------------------- reading ----------------------
+def get_suggestions(childUserName: str, limit: int = FRIEND_SUGGESTIONS_DEFAULT_LIMIT) -> list:
+    """Children who share the most friends with this child, excluding pending requests
+    and families that turned suggestions off"""
+    limit = max(1, min(limit, FRIEND_SUGGESTIONS_MAX_LIMIT))
+    with get_connection() as conn:
+        allowed = conn.execute(
+            sa.text("""
+                SELECT COALESCE(s.allowSuggestions, 1)
+                FROM Child c
+                LEFT JOIN ParentSuggestionSetting s ON s.parentUserName = c.parentUserName
+                WHERE c.childUserName = :childUserName
+            """),
+            {"childUserName": childUserName}
+        ).scalar()
+        if not allowed:
+            return []
+        rows = conn.execute(
+            sa.text("""
+                SELECT c.childUserName, c.firstName, c.lastName, c.profileIcon, f.mutualCount
+                FROM FriendSuggestion f
+                JOIN Child c ON c.childUserName = f.candidateUserName
+                LEFT JOIN ParentSuggestionSetting s ON s.parentUserName = c.parentUserName
+                WHERE f.childUserName = :childUserName
+                  AND COALESCE(s.allowSuggestions, 1) = 1
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Request r
+                      WHERE r.requestChildUserName = :childUserName
+                        AND r.ReceiverChildUserName = f.candidateUserName
+                        AND r.requestStatus = 'Pending'
+                  )
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Request r
+                      WHERE r.requestChildUserName = f.candidateUserName
+                        AND r.ReceiverChildUserName = :childUserName
+                        AND r.requestStatus = 'Pending'
+                  )
+                ORDER BY f.mutualCount DESC, f.candidateUserName
+                LIMIT :limit
+            """),
+            {"childUserName": childUserName, "limit": limit}
+        ).mappings().all()
+    return [dict(row) for row in rows]
+
+# ---------------------- parent settings ----------------------
+def get_suggestion_setting(parentUserName: str) -> dict:
+    with get_connection() as conn:
+        allowed = conn.execute(
+            sa.text("SELECT allowSuggestions FROM ParentSuggestionSetting WHERE parentUserName = :parentUserName"),
+            {"parentUserName": parentUserName}
+        ).scalar()
+    return {"allowSuggestions": True if allowed is None else bool(allowed)}
+
+def set_suggestion_setting(parentUserName: str, allowSuggestions: bool) -> dict:
+    """Whether this parent's children are suggested to others and receive suggestions"""
+    with get_connection() as conn:
+        conn.execute(
+            sa.text("""
+                INSERT INTO ParentSuggestionSetting (parentUserName, allowSuggestions)
+                VALUES (:parentUserName, :allowSuggestions)
+                ON DUPLICATE KEY UPDATE allowSuggestions = VALUES(allowSuggestions)
+            """),
+            {"parentUserName": parentUserName, "allowSuggestions": allowSuggestions}
+        )
+        conn.commit()
+    return get_suggestion_setting(parentUserName)
+
+
+if __name__ == "__main__":
+    print(f"Rebuilt friend suggestions ({rebuild_friend_suggestions()} rows)")
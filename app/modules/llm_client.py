@@ -0,0 +1,353 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Optional
+import httpx
+import openai
+from dotenv import load_dotenv
+from app.modules.llm_providers import LLMProvider, TASK_CHAT, create_provider
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "10"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "15"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Connection pool shared by every client, so TLS connections to the API are reused across requests
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "50"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_POOL_KEEPALIVE_SECONDS = float(os.getenv("LLM_POOL_KEEPALIVE_SECONDS", "120"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+
+# API key environment variable used by each named client
+LLM_CLIENT_KEYS = {
+    "moderation": "OPENAI_API_KEY",
+    "chatbot": "CHATBOT_OPENAI_API_KEY",
+}
+
+# Backend of each named client: "openai", "stub" (deterministic, offline) or "local" (on-box ONNX, moderation only)
+LLM_PROVIDERS = {
+    "moderation": os.getenv("MODERATION_LLM_PROVIDER", "openai"),
+    "chatbot": os.getenv("CHATBOT_LLM_PROVIDER", "openai"),
+}
+LLM_MODELS = {
+    "moderation": os.getenv("MODERATION_LLM_MODEL", "gpt-4o-mini"),
+    "chatbot": os.getenv("CHATBOT_LLM_MODEL", "gpt-4o-mini"),
+}
+
+# Upstream errors that are worth retrying: rate limits, 5xx, timeouts and dropped connections
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the upstream LLM cannot be used: breaker open, deadline passed or retries exhausted"""
+
+
+# ---------------------- circuit breaker ----------------------
+class CircuitBreaker:
+    """Open after consecutive failures, then let a single trial call through after reset_seconds"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_progress:
+            self.trial_in_progress = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_progress = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def end_trial(self):
+        """Let another trial through when this one ended without a verdict (client error or cancellation)"""
+        self.trial_in_progress = False
+
+
+# ---------------------- metrics ----------------------
+class LLMMetrics:
+    """Counters and upstream latency samples for one client"""
+
+    def __init__(self, sample_size: int = 1000):
+        self.counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+        }
+        self.latencies = deque(maxlen=sample_size)
+        # Time to first token of streamed completions
+        self.first_token_latencies = deque(maxlen=sample_size)
+
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def record_first_token(self, seconds: float):
+        self.first_token_latencies.append(seconds)
+
+    @staticmethod
+    def summarize(latencies: deque) -> dict:
+        samples = sorted(latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        return {
+            "samples": len(samples),
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": round(samples[-1] * 1000, 1) if samples else None,
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counters,
+            "latency_ms": self.summarize(self.latencies),
+            "first_token_ms": self.summarize(self.first_token_latencies),
+        }
+
+
+# ---------------------- client wrapper ----------------------
+class LLMClient:
+    """LLM provider wrapper with a concurrency cap, per-call deadlines, jittered retries and a circuit breaker"""
+
+    def __init__(self, name: str, provider: LLMProvider, model: str = "gpt-4o-mini"):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_SECONDS)
+        self.metrics = LLMMetrics()
+
+    async def chat_completion(self, timeout: Optional[float] = None, deadline: Optional[float] = None,
+                              task: str = TASK_CHAT, **params):
+        """Request a completion from the provider under the client's limits and return the raw response"""
+        params.setdefault("model", self.model)
+        self.metrics.counters["calls"] += 1
+        # Only the half-open trial has to be released if it ends early
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow_request():
+            self.metrics.counters["short_circuited"] += 1
+            raise LLMUnavailableError(f"{self.name} LLM circuit breaker is open")
+
+        timeout = timeout or LLM_TIMEOUT_SECONDS
+        # A cancelled call (client gone, outer wait_for) must not leave the breaker half-open forever
+        try:
+            give_up_at = time.monotonic() + (deadline or LLM_DEADLINE_SECONDS)
+
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                remaining = give_up_at - time.monotonic()
+                # Waiting for a free slot counts against the deadline as well, but a busy pool
+                # says nothing about upstream health, so it is not a breaker failure
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    await asyncio.wait_for(self.semaphore.acquire(), remaining)
+                except asyncio.TimeoutError as e:
+                    self.metrics.counters["timeouts"] += 1
+                    self.metrics.counters["failures"] += 1
+                    raise LLMUnavailableError(f"{self.name} LLM has no free slot") from e
+
+                try:
+                    try:
+                        start = time.monotonic()
+                        response = await asyncio.wait_for(
+                            self.provider.complete(task, **params),
+                            min(timeout, give_up_at - start)
+                        )
+                        self.metrics.record_latency(time.monotonic() - start)
+                    finally:
+                        self.semaphore.release()
+
+                    self.metrics.counters["successes"] += 1
+                    self.breaker.record_success()
+                    return response
+
+                except RETRYABLE_ERRORS as e:
+                    if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                        self.metrics.counters["timeouts"] += 1
+                    backoff = LLM_BACKOFF_BASE_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+                    if attempt == LLM_MAX_RETRIES or time.monotonic() + backoff >= give_up_at:
+                        self.metrics.counters["failures"] += 1
+                        self.breaker.record_failure()
+                        raise LLMUnavailableError(f"{self.name} LLM call failed: {type(e).__name__}") from e
+                    self.metrics.counters["retries"] += 1
+                    await asyncio.sleep(backoff)
+
+                except Exception:
+                    # Client-side errors (bad request, auth) do not say anything about upstream health
+                    self.metrics.counters["failures"] += 1
+                    raise
+        finally:
+            if trial:
+                self.breaker.end_trial()
+
+    async def stream_chat_completion(self, timeout: Optional[float] = None, task: str = TASK_CHAT,
+                                     **params) -> AsyncIterator[str]:
+        """Yield content deltas of a streamed completion under the client's limits.
+
+        Streams are not retried: the first token has to arrive within timeout, and each
+        following chunk within timeout of the previous one. The concurrency slot is held
+        until the stream ends or the caller closes the generator.
+        """
+        self.metrics.counters["calls"] += 1
+        # Only the half-open trial has to be released if it ends before its verdict
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow_request():
+            self.metrics.counters["short_circuited"] += 1
+            raise LLMUnavailableError(f"{self.name} LLM circuit breaker is open")
+
+        params.setdefault("model", self.model)
+        timeout = timeout or LLM_TIMEOUT_SECONDS
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout)
+        except asyncio.TimeoutError as e:
+            self.metrics.counters["timeouts"] += 1
+            self.metrics.counters["failures"] += 1
+            if trial:
+                self.breaker.end_trial()
+            raise LLMUnavailableError(f"{self.name} LLM has no free slot") from e
+        except asyncio.CancelledError:
+            if trial:
+                self.breaker.end_trial()
+            raise
+
+        stream = None
+        try:
+            start = time.monotonic()
+            try:
+                stream = await asyncio.wait_for(self.provider.stream(task, **params), timeout)
+                chunks = stream.__aiter__()
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                chunk = None
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                    self.metrics.counters["timeouts"] += 1
+                self.metrics.counters["failures"] += 1
+                self.breaker.record_failure()
+                raise LLMUnavailableError(f"{self.name} LLM stream failed: {type(e).__name__}") from e
+            except BaseException as e:
+                # Client errors and cancellation (the SSE client left before the first
+                # token) say nothing about upstream health, but must end the trial
+                if isinstance(e, Exception):
+                    self.metrics.counters["failures"] += 1
+                if trial:
+                    self.breaker.end_trial()
+                raise
+
+            self.metrics.record_first_token(time.monotonic() - start)
+            self.metrics.counters["successes"] += 1
+            self.breaker.record_success()
+
+            while chunk is not None:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                except RETRYABLE_ERRORS as e:
+                    raise LLMUnavailableError(f"{self.name} LLM stream interrupted: {type(e).__name__}") from e
+            self.metrics.record_latency(time.monotonic() - start)
+        finally:
+            if stream is not None:
+                await stream.close()
+            self.semaphore.release()
+
+
+# ---------------------- shared clients ----------------------
+_http_client: Optional[httpx.AsyncClient] = None
+_llm_clients: Dict[str, LLMClient] = {}
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Build the keep-alive connection pool used for all upstream LLM traffic"""
+    limits = httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_POOL_KEEPALIVE_SECONDS
+    )
+    # Timeouts are enforced per call by LLMClient, the pool only bounds connecting
+    timeout = httpx.Timeout(None, connect=10.0)
+    try:
+        return httpx.AsyncClient(http2=LLM_HTTP2, limits=limits, timeout=timeout)
+    except ImportError:
+        # HTTP/2 needs the optional "h2" package
+        print("h2 is not installed, LLM connection pool falls back to HTTP/1.1")
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+def start_llm_clients():
+    """Create the shared connection pool and every named client (called at app startup)"""
+    for name in LLM_CLIENT_KEYS:
+        get_llm_client(name)
+
+async def close_llm_clients():
+    """Close the shared connection pool and forget all clients (called at app shutdown)"""
+    global _http_client
+    for client in _llm_clients.values():
+        await client.provider.close()
+    _llm_clients.clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def get_llm_client(name: str) -> LLMClient:
+    """Return the shared client for a purpose ("moderation" or "chatbot"), creating it on first use"""
+    global _http_client
+    if name not in _llm_clients:
+        kind = LLM_PROVIDERS[name]
+        # Only the OpenAI backend needs the upstream connection pool
+        if kind == "openai" and _http_client is None:
+            _http_client = _create_http_client()
+        provider = create_provider(kind, name, api_key=os.getenv(LLM_CLIENT_KEYS[name]), http_client=_http_client)
+        _llm_clients[name] = LLMClient(name, provider, model=LLM_MODELS[name])
+    return _llm_clients[name]
+
+def get_llm_metrics() -> dict:
+    """Metrics and breaker state for every client created so far"""
+    return {
+        name: {"provider": client.provider.name, "breaker": client.breaker.state, **client.metrics.snapshot()}
+        for name, client in _llm_clients.items()
+    }
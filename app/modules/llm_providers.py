@@ -0,0 +1,248 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import os
+import re
+from types import SimpleNamespace
+from typing import List, Optional
+import httpx
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from app.modules.moderation_lexicon import classify_with_lexicon
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# Simulated upstream latency of the stub provider, for load tests
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+# Delay between streamed chunks of the stub provider
+LLM_STUB_CHUNK_DELAY_MS = float(os.getenv("LLM_STUB_CHUNK_DELAY_MS", "0"))
+
+# On-box moderation classifier: an ONNX model with one string input whose first
+# output is the classification (0-3), e.g. a scikit-learn TF-IDF pipeline exported with skl2onnx
+LOCAL_MODERATION_MODEL_PATH = os.getenv("LOCAL_MODERATION_MODEL_PATH", "")
+LOCAL_MODERATION_THREADS = int(os.getenv("LOCAL_MODERATION_THREADS", "1"))
+
+# Tasks callers pass so non-OpenAI backends know what shape of answer is expected
+TASK_CHAT = "chat"
+TASK_SUMMARIZE = "summarize"
+TASK_CLASSIFY = "classify"
+TASK_EXTRACT_WORDS = "extract_words"
+TASK_CLASSIFY_BATCH = "classify_batch"
+
+
+# ---------------------- response shapes ----------------------
+def make_response(content: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Completion object shaped like the OpenAI SDK response that callers read"""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+    )
+
+def make_chunk(content: str):
+    """Streamed chunk shaped like the OpenAI SDK chunk"""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 3) if text else 0
+
+def _last_user_message(messages: List[dict]) -> str:
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return message["content"]
+    return ""
+
+def _parse_numbered_batch(content: str) -> List[tuple]:
+    """Read back the '<id>. <json string>' lines built by MessageFilter.classify_batch"""
+    items = []
+    for line in content.splitlines():
+        match = re.match(r"^(\d+)\.\s(.*)$", line)
+        if match:
+            try:
+                items.append((int(match.group(1)), json.loads(match.group(2))))
+            except ValueError:
+                items.append((int(match.group(1)), match.group(2)))
+    return items
+
+
+class _ListStream:
+    """Async iterator over prepared chunks with the close() of an SDK stream"""
+
+    def __init__(self, pieces: List[str], delay: float = 0):
+        self.pieces = pieces
+        self.delay = delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for piece in self.pieces:
+            if self.closed:
+                return
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield make_chunk(piece)
+
+    async def close(self):
+        self.closed = True
+
+
+# ---------------------- providers ----------------------
+class LLMProvider(ABC):
+    """Backend that serves chat completions for an LLMClient.
+
+    complete() returns an OpenAI-shaped response and stream() an object that can be
+    iterated for chunks and closed. task tells non-OpenAI backends what is asked for.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, task: str, **params):
+        """OpenAI-shaped response to a completion request"""
+
+    @abstractmethod
+    async def stream(self, task: str, **params):
+        """Iterable, closable stream of OpenAI-shaped chunks"""
+
+    async def close(self):
+        pass
+
+
+class OpenAIProvider(LLMProvider):
+    """Chat completions from the OpenAI API over the shared connection pool"""
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, http_client: Optional[httpx.AsyncClient] = None):
+        # Retries are handled by LLMClient so the SDK must not retry on its own
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0, http_client=http_client)
+
+    async def complete(self, task: str, **params):
+        return await self.client.chat.completions.create(**params)
+
+    async def stream(self, task: str, **params):
+        return await self.client.chat.completions.create(stream=True, **params)
+
+
+class StubProvider(LLMProvider):
+    """Deterministic offline backend for tests and load tests; needs no network or API key.
+
+    Moderation tasks are answered with the local lexicon and chat answers echo the
+    question, so the same input always gives the same output.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = LLM_STUB_LATENCY_MS, chunk_delay_ms: float = LLM_STUB_CHUNK_DELAY_MS):
+        self.latency = latency_ms / 1000
+        self.chunk_delay = chunk_delay_ms / 1000
+
+    def answer(self, task: str, messages: List[dict]) -> str:
+        content = _last_user_message(messages)
+        if task == TASK_CLASSIFY:
+            return str(classify_with_lexicon(content)[0])
+        if task == TASK_EXTRACT_WORDS:
+            return "\n".join(classify_with_lexicon(content)[1])
+        if task == TASK_CLASSIFY_BATCH:
+            results = []
+            for index, text in _parse_numbered_batch(content):
+                classification, words = classify_with_lexicon(str(text))
+                results.append({"id": index, "classification": classification, "words": words})
+            return json.dumps({"results": results}, ensure_ascii=False)
+        if task == TASK_SUMMARIZE:
+            return content[-400:]
+        return f"سؤال جميل! سألت: {content}"
+
+    async def complete(self, task: str, **params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        messages = params.get("messages", [])
+        content = self.answer(task, messages)
+        return make_response(
+            content,
+            sum(_estimate_tokens(message["content"]) for message in messages),
+            _estimate_tokens(content)
+        )
+
+    async def stream(self, task: str, **params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = self.answer(task, params.get("messages", []))
+        return _ListStream(re.findall(r"\S+\s*", content), self.chunk_delay)
+
+
+class LocalModerationProvider(LLMProvider):
+    """CPU-only moderation with an on-box ONNX classifier (needs the optional onnxruntime package).
+
+    Classification comes from the model and flagged words from the lexicon. Chat
+    tasks are not supported.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path: str = LOCAL_MODERATION_MODEL_PATH, threads: int = LOCAL_MODERATION_THREADS):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, texts: List[str]) -> List[int]:
+        """Classify several texts with one model run"""
+        import numpy
+
+        labels = self.session.run(None, {self.input_name: numpy.array(texts, dtype=object).reshape(-1, 1)})[0]
+        return [min(max(int(label), 0), 3) for label in numpy.ravel(labels)]
+
+    def answer(self, task: str, messages: List[dict]) -> str:
+        content = _last_user_message(messages)
+        if task == TASK_CLASSIFY:
+            return str(self.predict([content])[0])
+        if task == TASK_EXTRACT_WORDS:
+            return "\n".join(classify_with_lexicon(content)[1])
+        if task == TASK_CLASSIFY_BATCH:
+            items = _parse_numbered_batch(content)
+            labels = self.predict([str(text) for _, text in items]) if items else []
+            return json.dumps({
+                "results": [
+                    {"id": index, "classification": label, "words": classify_with_lexicon(str(text))[1]}
+                    for (index, text), label in zip(items, labels)
+                ]
+            }, ensure_ascii=False)
+        raise ValueError(f"The local moderation provider cannot serve '{task}' requests")
+
+    async def complete(self, task: str, **params):
+        # Inference is CPU-bound, keep it off the event loop
+        content = await asyncio.to_thread(self.answer, task, params.get("messages", []))
+        return make_response(content)
+
+    async def stream(self, task: str, **params):
+        return _ListStream([(await self.complete(task, **params)).choices[0].message.content])
+
+
+def create_provider(kind: str, purpose: str, api_key: Optional[str] = None,
+                    http_client: Optional[httpx.AsyncClient] = None) -> LLMProvider:
+    """Build the backend named by kind ("openai", "stub" or "local") for a client purpose"""
+    if kind == "stub":
+        return StubProvider()
+    if kind == "local":
+        if purpose != "moderation":
+            raise ValueError("The local provider only supports moderation")
+        try:
+            return LocalModerationProvider()
+        except Exception as e:
+            # Chosen explicitly, so a missing onnxruntime or model file stops startup instead of
+            # quietly moderating with the lexicon alone
+            raise RuntimeError(f"Local moderation model unavailable: {str(e)}") from e
+    if kind != "openai":
+        raise ValueError(f"Unknown LLM provider '{kind}'")
+    return OpenAIProvider(api_key=api_key, http_client=http_client)
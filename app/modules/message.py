@@ -1,3 +1,4 @@
+from collections import Counter
 from pydantic import BaseModel
 import sqlalchemy as sa
 from sqlalchemy.sql import func
@@ -5,7 +6,16 @@ from datetime import datetime
 from app.database import get_connection
 from fastapi import HTTPException
 from app.modules.message_filter import MessageFilter
-from typing import Optional
+from app.modules.child_cache import child_profile_cache
+from app.modules.moderation_policy import moderation_policy
+from app.modules import notification_feed
+from app.modules.notification_hub import notification_hub
+from app.modules.notification_dedup import notification_deduplicator
+from app.modules.notification_feed import DEFAULT_PAGE_SIZE, fetch_notifications, increment_unread
+from typing import Dict, Optional, List, Tuple
+
+# Shared filter; its LLM client comes from the process-wide registry
+message_filter = MessageFilter()
 
 class MessageInput(BaseModel):
     senderChildUserName: str
@@ -22,9 +32,6 @@ class MessageResponse(BaseModel):
 async def process_message(msg: MessageInput) -> MessageResponse:
     """Process message content, analyze and mask if needed"""
     try:
-        # Initialize message filter
-        message_filter = MessageFilter()
-        
         # Analyze and filter the message
         filtered_message = await message_filter.filter_message(
             content=msg.content,
@@ -59,18 +66,12 @@ async def process_message(msg: MessageInput) -> MessageResponse:
         print(f"Error processing message: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to process message")
 
-RISK_TYPES = {
-    1: "Inappropriate Language",
-    2: "Sexual Assault",
-    3: "Drugs"
-}
-
 def process_message_old(msg: MessageInput):
     if msg.riskID == 0:
         print("Message is safe.")
         return {"message": "Forward to Firebase."}
 
-    risk_type = RISK_TYPES.get(msg.riskID)
+    risk_type = moderation_policy.risk_label(moderation_policy.risk_code(msg.riskID))
     if not risk_type:
         raise HTTPException(status_code=400, detail="Invalid riskID")
 
@@ -109,82 +110,226 @@ def process_message_old(msg: MessageInput):
     create_notification(message_id, msg.receiverChildUserName, risk_type, msg.content)
     return {"message": f"Risky message stored. Notification for '{risk_type}' created."}
 
-def create_notification(firebase_message_id: str, sender_child_username: str, receiver_child_username: str, content: str, risk_type: str, original_content: str):
-    with get_connection() as conn:
-        # Get parent username for the receiver child
-        parent_query = sa.text("""
-            SELECT parentUserName FROM Child WHERE childUserName = :receiver
-        """)
-        result = conn.execute(parent_query, {"receiver": receiver_child_username}).mappings().first()
+def notification_event(notification_id: Optional[int], firebase_message_id: str, sender: str, receiver: str,
+                       content: str, risk_type: str, occurrences: int = 1) -> dict:
+    """Payload pushed to connected parents, shaped like a notifications feed row"""
+    return {
+        "notificationID": notification_id,
+        "firebaseMessageID": firebase_message_id,
+        "sender": sender,
+        "receiver": receiver,
+        "content": content,
+        "riskType": risk_type,
+        "riskLabel": moderation_policy.risk_label(risk_type),
+        "timeStamp": datetime.now().isoformat(),
+        "isRead": False,
+        "occurrenceCount": occurrences,
+    }
 
-        if not result:
-            raise HTTPException(status_code=404, detail="Receiver child not found")
+def _coalesce_repeats(conn, groups: List[tuple]) -> Tuple[List[tuple], List[tuple]]:
+    """Fold groups of repeated notifications into rows still open in the dedup window.
+
+    Each group is (key, parent, notifications). Returns the groups that need a new row and
+    the (notification id, parent, notifications) that were folded into an existing one.
+    """
+    new_groups, coalesced = [], []
+    now = datetime.now()
+    for key, parent, group in groups:
+        entry = notification_deduplicator.lookup(key)
+        if entry is not None:
+            # A notification the parent already read is left alone; the repeat starts a new one
+            updated = conn.execute(
+                sa.text("""
+                    UPDATE Notification
+                    SET occurrenceCount = occurrenceCount + :count,
+                        latestContent = :content,
+                        lastOccurrenceAt = :now
+                    WHERE notificationID = :notification_id AND isRead = 0
+                """),
+                {"count": len(group), "content": group[-1]["content"], "now": now, "notification_id": entry.notification_id}
+            ).rowcount
+            if updated:
+                coalesced.append((entry.notification_id, parent, group))
+                continue
+            notification_deduplicator.close(key)
+        new_groups.append((key, parent, group))
+    return new_groups, coalesced
+
+def _inserted_ids(conn, rows: List[dict], first_id: Optional[int]) -> List[Optional[int]]:
+    """Ids of the rows of one multi-row INSERT, in row order, read back by firebaseMessageID.
+
+    MySQL reports the first id the statement generated and none of its rows has a smaller
+    one, so the lookup stays on a primary key range even for parents with long feeds.
+    """
+    found = conn.execute(
+        sa.text("""
+            SELECT notificationID, firebaseMessageID FROM Notification
+            WHERE notificationID >= :first_id
+              AND parentUserName IN :parents
+              AND firebaseMessageID IN :firebase_ids
+            ORDER BY notificationID
+        """).bindparams(sa.bindparam("parents", expanding=True), sa.bindparam("firebase_ids", expanding=True)),
+        {
+            "first_id": first_id or 0,
+            "parents": list({row["parent_username"] for row in rows}),
+            "firebase_ids": [row["firebase_message_id"] for row in rows],
+        }
+    ).all()
+    ids = {}
+    for notification_id, firebase_message_id in found:
+        ids.setdefault(firebase_message_id, notification_id)
+    return [ids.get(row["firebase_message_id"]) for row in rows]
+
+def _save_notifications(notifications: List[dict], parents: Dict[str, str]) -> Tuple[int, int]:
+    """Insert or coalesce notifications in one transaction, then push them; returns (created, coalesced)"""
+    # Repeats of the same (sender, receiver, riskType) collapse into one row with a counter
+    grouped: Dict[tuple, List[dict]] = {}
+    for n in notifications:
+        key = (n["sender_child_username"], n["receiver_child_username"], n["risk_type"])
+        grouped.setdefault(key, []).append(n)
+    groups = [(key, parents[key[1]], group) for key, group in grouped.items()]
+
+    now = datetime.now()
+    with get_connection() as conn:
+        new_groups, coalesced = _coalesce_repeats(conn, groups)
 
-        parent_username = result["parentUserName"]
-        
-        # Insert notification into the database
         insert_notification_query = sa.text("""
             INSERT INTO Notification (
-                firebaseMessageID, 
-                senderChildUserName, 
-                receiverChildUserName, 
-                parentUserName, 
-                content, 
+                firebaseMessageID,
+                senderChildUserName,
+                receiverChildUserName,
+                parentUserName,
+                content,
                 originalContent,
-                riskType
+                riskType,
+                occurrenceCount,
+                latestContent,
+                lastOccurrenceAt
             )
             VALUES (
-                :firebase_message_id, 
-                :sender_username, 
-                :receiver_username, 
-                :parent_username, 
-                :content, 
+                :firebase_message_id,
+                :sender_username,
+                :receiver_username,
+                :parent_username,
+                :content,
                 :original_content,
-                :risk_type
+                :risk_type,
+                :occurrences,
+                :latest_content,
+                :last_occurrence_at
             )
         """)
-        
-        conn.execute(insert_notification_query, {
-            "firebase_message_id": firebase_message_id,
-            "sender_username": sender_child_username,
-            "receiver_username": receiver_child_username,
-            "parent_username": parent_username,
-            "content": content,
-            "original_content": original_content,
-            "risk_type": risk_type
-        })
+        rows = [
+            {
+                "firebase_message_id": group[0]["firebase_message_id"],
+                "sender_username": group[0]["sender_child_username"],
+                "receiver_username": group[0]["receiver_child_username"],
+                "parent_username": parent,
+                "content": group[0]["content"],
+                "original_content": group[0]["original_content"],
+                "risk_type": group[0]["risk_type"],
+                "occurrences": len(group),
+                "latest_content": group[-1]["content"] if len(group) > 1 else None,
+                "last_occurrence_at": now if len(group) > 1 else None
+            }
+            for _, parent, group in new_groups
+        ]
+        new_ids = [None] * len(rows)
+        if len(rows) == 1:
+            new_ids[0] = conn.execute(insert_notification_query, rows[0]).lastrowid
+        elif rows:
+            # A list of parameter sets is sent as one executemany, which the MySQL
+            # driver rewrites into a single multi-row INSERT statement
+            first_id = conn.execute(insert_notification_query, rows).lastrowid
+            new_ids = _inserted_ids(conn, rows, first_id)
+        if new_groups:
+            increment_unread(conn, Counter(parent for _, parent, _ in new_groups))
         conn.commit()
-        
-        print(f"🔔 Notification created for {parent_username} regarding message {firebase_message_id} with risk: {risk_type}")
-        return {"status": "Notification created successfully"}
-        
-def get_notifications(parentUserName: str):
-    with get_connection() as conn:
-        query = sa.text("""
-            SELECT 
-                n.messageID AS notificationID,
-                n.content,
-                n.originalContent,
-                n.timeStamp,
-                n.senderChildUserName AS sender,
-                n.receiverChildUserName AS receiver,
-                c.firstName AS receiverFirstName,
-                c.lastName AS receiverLastName,
-                CASE
-                    WHEN n.riskType IS NOT NULL THEN n.riskType
-                    WHEN n.riskID = 1 THEN 'Inappropriate Language'
-                    WHEN n.riskID = 2 THEN 'Sexual Content'
-                    WHEN n.riskID = 3 THEN 'Drugs'
-                    ELSE NULL
-                END AS riskType
-            FROM 
-                Notification n
-            JOIN 
-                Child c ON n.receiverChildUserName = c.childUserName
-            WHERE 
-                c.parentUserName = :parentUserName
-            ORDER BY n.timeStamp DESC
-        """)
-        results = conn.execute(query, {"parentUserName": parentUserName}).mappings().fetchall()
 
-    return [dict(row) for row in results] if results else []
+    if coalesced:
+        notification_deduplicator.record_coalesced(sum(len(group) for _, _, group in coalesced))
+    # Push to the parents' open sessions once the rows are committed
+    for (key, parent, group), notification_id in zip(new_groups, new_ids):
+        notification_deduplicator.open(key, notification_id)
+        first = group[0]
+        notification_hub.publish(parent, "notification", notification_event(
+            notification_id, first["firebase_message_id"], first["sender_child_username"],
+            first["receiver_child_username"], first["content"], first["risk_type"], len(group)
+        ))
+    for notification_id, parent, group in coalesced:
+        notification_hub.publish(parent, "notification_update", {
+            "notificationID": notification_id,
+            "newOccurrences": len(group),
+            "latestContent": group[-1]["content"],
+        })
+    return len(new_groups), sum(len(group) for _, _, group in coalesced)
+
+def create_notification(firebase_message_id: str, sender_child_username: str, receiver_child_username: str, content: str, risk_type: str, original_content: str):
+    # Get parent username for the receiver child
+    profile = child_profile_cache.get_profile(receiver_child_username)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Receiver child not found")
+
+    parent_username = profile["parentUserName"]
+
+    created, _ = _save_notifications([{
+        "firebase_message_id": firebase_message_id,
+        "sender_child_username": sender_child_username,
+        "receiver_child_username": receiver_child_username,
+        "content": content,
+        "original_content": original_content,
+        "risk_type": risk_type
+    }], {receiver_child_username: parent_username})
+
+    if not created:
+        print(f"🔔 Repeat of an open notification for {parent_username} folded in (message {firebase_message_id}, risk: {risk_type})")
+        return {"status": "Notification coalesced with a recent one"}
+    print(f"🔔 Notification created for {parent_username} regarding message {firebase_message_id} with risk: {risk_type}")
+    return {"status": "Notification created successfully"}
+
+def create_notifications(notifications: List[dict]):
+    """Create many notifications with one cached parent lookup and one multi-row insert.
+
+    Each item carries the same keys as the create_notification arguments. Repeats of
+    the same (sender, receiver, riskType) are coalesced into one row.
+    """
+    if not notifications:
+        return {"status": "No notifications to create", "count": 0}
+
+    receivers = list({n["receiver_child_username"] for n in notifications})
+
+    # Cached profiles; any misses are loaded with one query
+    parents = {
+        username: profile["parentUserName"]
+        for username, profile in child_profile_cache.get_profiles(receivers).items()
+    }
+
+    missing = [r for r in receivers if r not in parents]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Receiver child not found: {', '.join(missing)}")
+
+    created, coalesced = _save_notifications(notifications, parents)
+
+    print(f"🔔 {len(notifications)} notifications stored in one batch ({created} new, {coalesced} coalesced)")
+    return {"status": "Notifications created successfully", "count": len(notifications), "created": created, "coalesced": coalesced}
+
+def get_notifications(parentUserName: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                      childUserName: Optional[str] = None, riskType: Optional[str] = None,
+                      unreadOnly: bool = False) -> Tuple[List[dict], Optional[str]]:
+    """One page of the parent's notifications, newest first, plus the cursor of the next page"""
+    return fetch_notifications(parentUserName, limit, cursor, childUserName, riskType, unreadOnly)
+
+def mark_notifications_read(parentUserName: str, notificationIDs: Optional[List[int]] = None,
+                            upToCursor: Optional[str] = None, newestNotificationID: Optional[int] = None,
+                            childUserName: Optional[str] = None):
+    marked = notification_feed.mark_notifications_read(
+        parentUserName, notificationIDs, upToCursor, newestNotificationID, childUserName
+    )
+    unread = notification_feed.get_unread_count(parentUserName)
+    if marked:
+        # Other devices of the same parent update their badge
+        notification_hub.publish(parentUserName, "unread_count", {"unreadCount": unread})
+    return {"marked": marked, "unreadCount": unread}
+
+def get_unread_count(parentUserName: str):
+    return {"unreadCount": notification_feed.get_unread_count(parentUserName)}
@@ -1,16 +1,29 @@
-from openai import AsyncOpenAI
+import asyncio
+import json
 import os
 from typing import Tuple, Optional, List
 from pydantic import BaseModel
-from datetime import datetime
-import sqlalchemy as sa
-from app.database import get_connection
+from app.modules.child_cache import child_profile_cache
+from app.modules.moderation_policy import moderation_policy
+from app.modules.moderation_batcher import ModerationBatcher, ModerationOverloadedError
+from app.modules.llm_providers import TASK_CLASSIFY, TASK_CLASSIFY_BATCH, TASK_EXTRACT_WORDS
+from app.modules.llm_client import get_llm_client, LLMUnavailableError
+from app.modules.moderation_lexicon import classify_with_lexicon
 import re
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Maximum number of messages classified in parallel by filter_messages
+MODERATION_BATCH_CONCURRENCY = int(os.getenv("MODERATION_BATCH_CONCURRENCY", "5"))
+
+# Micro-batching of concurrent analyze_message calls into one classification request
+MODERATION_BATCHING = os.getenv("MODERATION_BATCHING", "false").lower() == "true"
+MODERATION_BATCH_MAX_SIZE = int(os.getenv("MODERATION_BATCH_MAX_SIZE", "16"))
+MODERATION_BATCH_MAX_WAIT_MS = int(os.getenv("MODERATION_BATCH_MAX_WAIT_MS", "20"))
+MODERATION_BATCH_MAX_PENDING = int(os.getenv("MODERATION_BATCH_MAX_PENDING", "1000"))
+
 class FilteredMessage(BaseModel):
     content: str
     is_filtered: bool
@@ -19,13 +32,10 @@ class FilteredMessage(BaseModel):
     should_notify_parent: bool = False
 
 class MessageFilter:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.risk_types = {
-            "inappropriate_content": 1,
-            "sexual_content": 2,
-            "drug_related": 3
-        }
+    @property
+    def llm(self):
+        """Shared moderation client from the process-wide registry"""
+        return get_llm_client("moderation")
 
     def mask_content(self, content: str, inappropriate_words: List[str]) -> str:
         """Mask only inappropriate words in the content with asterisks"""
@@ -42,22 +52,10 @@ class MessageFilter:
         return masked_content
 
     def get_child_age(self, child_username: str) -> Optional[int]:
-        """Get child's age from the database"""
+        """Get child's age from the cached child profile"""
         try:
-            with get_connection() as conn:
-                query = sa.text("""
-                    SELECT dateOfBirth 
-                    FROM Child 
-                    WHERE childUserName = :username
-                """)
-                result = conn.execute(query, {"username": child_username}).scalar()
-                
-                if result:
-                    birth_date = result
-                    today = datetime.now()
-                    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-                    return age
-                return None
+            profile = child_profile_cache.get_profile(child_username)
+            return profile["age"] if profile else None
         except Exception as e:
             print(f"Error getting child age: {str(e)}")
             return None
@@ -90,13 +88,12 @@ class MessageFilter:
             print(f"Error extracting classification number: {str(e)}")
             return 0  # Default to safe on error
 
-    async def analyze_message(self, content: str, receiver_username: str) -> Tuple[bool, Optional[str], Optional[int], bool, Optional[List[str]]]:
-        """Analyze message content using GPT-4o-mini and check if parent notification is needed"""
-        try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": """أنت مصنف محتوى للنصوص باللهجة السعودية. صنّف النص وفقًا للفئات التالية، مع إعطاء رقم التصنيف فقط (دون أي شرح إضافي):
+    async def classify_message(self, content: str) -> Tuple[int, List[str]]:
+        """Classify a single message and extract its inappropriate words"""
+        response = await self.llm.chat_completion(
+            task=TASK_CLASSIFY,
+            messages=[
+                {"role": "system", "content": """أنت مصنف محتوى للنصوص باللهجة السعودية. صنّف النص وفقًا للفئات التالية، مع إعطاء رقم التصنيف فقط (دون أي شرح إضافي):
 0. نص سليم: إذا كان النص لا يحتوي على أي محتوى غير لائق.
 1. ألفاظ غير لائقة: إذا كان النص يضم شتائم أو إهانات أو ألفاظ مسيئة.
 2. نص جنسي: إذا كان النص يضم وصفًا جنسيًا صريحًا أو تلميحات جنسية واضحة. 
@@ -104,53 +101,108 @@ class MessageFilter:
 انتبه للألفاظ المحلية العامية، وحافظ على دقة التصنيف بإعطاء رقم واحد فقط (0 أو 1 أو 2 أو 3).
 
 أجب برقم واحد فقط."""},
+                {"role": "user", "content": content}
+            ],
+            temperature=0.1
+        )
+        
+        # Extract and validate the classification number
+        response_text = response.choices[0].message.content.strip()
+        classification = self.extract_classification_number(response_text)
+        
+        # Get inappropriate words if any
+        inappropriate_words = []
+        if classification > 0:
+            word_response = await self.llm.chat_completion(
+                task=TASK_EXTRACT_WORDS,
+                messages=[
+                    {"role": "system", "content": """حدد الكلمات غير اللائقة في النص التالي فقط، دون أي شرح إضافي.
+أجب بالكلمات فقط، كل كلمة في سطر جديد."""},
                     {"role": "user", "content": content}
                 ],
                 temperature=0.1
             )
-            
-            # Extract and validate the classification number
-            response_text = response.choices[0].message.content.strip()
-            classification = self.extract_classification_number(response_text)
-            
-            # Get inappropriate words if any
-            inappropriate_words = []
-            if classification > 0:
-                word_response = await self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": """حدد الكلمات غير اللائقة في النص التالي فقط، دون أي شرح إضافي.
-أجب بالكلمات فقط، كل كلمة في سطر جديد."""},
-                        {"role": "user", "content": content}
-                    ],
-                    temperature=0.1
-                )
-                words = word_response.choices[0].message.content.strip().split('\n')
-                inappropriate_words = [word.strip() for word in words if word.strip()]
-            
-            # Check if parent notification is needed based on message type and age
-            should_notify = False
-            child_age = self.get_child_age(receiver_username)
-            
-            if child_age:
-                if classification == 1 and 6 <= child_age <= 9:  # Inappropriate content for ages 6-9
-                    should_notify = True
-                elif classification == 2 and 6 <= child_age <= 13:  # Sexual content for ages 6-13
-                    should_notify = True
-                elif classification == 3 and 6 <= child_age <= 17:  # Drug-related content for ages 6-17
-                    should_notify = True
+            words = word_response.choices[0].message.content.strip().split('\n')
+            inappropriate_words = [word.strip() for word in words if word.strip()]
+
+        return classification, inappropriate_words
+
+    async def classify_batch(self, contents: List[str]) -> List[Tuple[int, List[str]]]:
+        """Classify several messages with one structured call, returning results in input order"""
+        numbered = "\n".join(
+            f"{index}. {json.dumps(content, ensure_ascii=False)}" for index, content in enumerate(contents)
+        )
+        response = await self.llm.chat_completion(
+            task=TASK_CLASSIFY_BATCH,
+            messages=[
+                {"role": "system", "content": """أنت مصنف محتوى للنصوص باللهجة السعودية. ستصلك عدة رسائل مرقمة، صنّف كل رسالة على حدة وفقًا للفئات التالية:
+0. نص سليم: إذا كان النص لا يحتوي على أي محتوى غير لائق.
+1. ألفاظ غير لائقة: إذا كان النص يضم شتائم أو إهانات أو ألفاظ مسيئة.
+2. نص جنسي: إذا كان النص يضم وصفًا جنسيًا صريحًا أو تلميحات جنسية واضحة. 
+3. مخدرات: إذا كان النص يتحدث عن المخدرات بأي شكل (ترويج، تعاطٍ، اتجار، إلخ).
+انتبه للألفاظ المحلية العامية.
+
+أجب بكائن JSON فقط بالشكل التالي:
+{"results": [{"id": رقم الرسالة, "classification": رقم التصنيف, "words": [الكلمات غير اللائقة كما وردت في الرسالة]}]}"""},
+                {"role": "user", "content": numbered}
+            ],
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+
+        results = {}
+        try:
+            payload = json.loads(response.choices[0].message.content)
+            for item in payload.get("results", []):
+                classification = int(item.get("classification", 0))
+                words = [str(word).strip() for word in item.get("words") or [] if str(word).strip()]
+                results[int(item["id"])] = (classification if 0 <= classification <= 3 else 0, words)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Error parsing batch classification: {str(e)}")
+
+        # Anything the model skipped is classified on its own rather than assumed safe
+        missing = [index for index in range(len(contents)) if index not in results]
+        if missing:
+            single_results = await asyncio.gather(*(self.classify_message(contents[index]) for index in missing))
+            results.update(zip(missing, single_results))
+
+        return [results[index] for index in range(len(contents))]
+
+    async def analyze_message(self, content: str, receiver_username: str) -> Tuple[bool, Optional[str], Optional[int], bool, Optional[List[str]]]:
+        """Analyze message content using GPT-4o-mini and check if parent notification is needed"""
+        try:
+            try:
+                if MODERATION_BATCHING:
+                    classification, inappropriate_words = await get_moderation_batcher().submit(content)
+                else:
+                    classification, inappropriate_words = await self.classify_message(content)
+            except LLMUnavailableError as e:
+                # Upstream is slow or down: fall back to the local lexicon instead of assuming safe
+                print(f"Moderation LLM unavailable, using lexicon verdict: {str(e)}")
+                classification, inappropriate_words = classify_with_lexicon(content)
             
             if classification == 0:
                 return False, None, 0, False, []
-            elif classification == 1:
-                return True, "inappropriate_content", 1, should_notify, inappropriate_words
-            elif classification == 2:
-                return True, "sexual_content", 2, should_notify, inappropriate_words
-            elif classification == 3:
-                return True, "drug_related", 3, should_notify, inappropriate_words
-            else:
+
+            # Look up the action for this risk and the receiver's age, honouring the parent's overrides
+            try:
+                profile = child_profile_cache.get_profile(receiver_username)
+            except Exception as e:
+                print(f"Error getting receiver profile: {str(e)}")
+                profile = None
+            action = moderation_policy.decide(
+                classification,
+                profile["age"] if profile else None,
+                profile["parentUserName"] if profile else None
+            )
+            risk_type = moderation_policy.risk_code(classification)
+
+            if action == "allow" or risk_type is None:
                 return False, None, 0, False, []
+            return True, risk_type, classification, action == "notify", inappropriate_words
             
+        except ModerationOverloadedError:
+            raise
         except Exception as e:
             print(f"Error analyzing message: {str(e)}")
             return False, None, 0, False, []
@@ -174,4 +226,36 @@ class MessageFilter:
             risk_type=None,
             risk_level=0,
             should_notify_parent=False
-        ) 
\ No newline at end of file
+        )
+
+    async def filter_messages(self, messages: List[Tuple[str, str]]) -> List[FilteredMessage]:
+        """Filter many (content, receiver_username) pairs with bounded concurrency, keeping input order"""
+        semaphore = asyncio.Semaphore(MODERATION_BATCH_CONCURRENCY)
+
+        async def filter_one(content: str, receiver_username: str) -> FilteredMessage:
+            async with semaphore:
+                return await self.filter_message(content, receiver_username)
+
+        return list(await asyncio.gather(*(filter_one(content, receiver) for content, receiver in messages)))
+
+
+_moderation_batcher: Optional[ModerationBatcher] = None
+
+def get_moderation_batcher() -> ModerationBatcher:
+    """Return the process-wide moderation batcher, creating it on first use"""
+    global _moderation_batcher
+    if _moderation_batcher is None:
+        _moderation_batcher = ModerationBatcher(
+            MessageFilter().classify_batch,
+            max_batch_size=MODERATION_BATCH_MAX_SIZE,
+            max_wait_ms=MODERATION_BATCH_MAX_WAIT_MS,
+            max_pending=MODERATION_BATCH_MAX_PENDING
+        )
+    return _moderation_batcher
+
+async def close_moderation_batcher():
+    """Stop the shared moderation batcher if it was started (called at app shutdown)"""
+    global _moderation_batcher
+    if _moderation_batcher is not None:
+        await _moderation_batcher.close()
+        _moderation_batcher = None
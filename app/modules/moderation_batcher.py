@@ -0,0 +1,116 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+# (classification, inappropriate_words) for one message
+Classification = Tuple[int, List[str]]
+
+
+class ModerationOverloadedError(Exception):
+    """Raised when the moderation queue is full and a message cannot be queued in time"""
+
+
+class ModerationBatcher:
+    """Coalesce concurrent moderation requests into batched classification calls.
+
+    Each submitted message waits until either max_batch_size messages are queued
+    or max_wait_ms has passed since the first one arrived, then the whole batch is
+    classified with one call and every caller's future is resolved individually.
+    The queue is bounded by max_pending; callers wait up to enqueue_timeout_ms for
+    room before ModerationOverloadedError is raised.
+    """
+
+    def __init__(
+        self,
+        classify_batch: Callable[[List[str]], Awaitable[List[Classification]]],
+        max_batch_size: int = 16,
+        max_wait_ms: int = 20,
+        max_pending: int = 1000,
+        max_concurrent_batches: int = 4,
+        enqueue_timeout_ms: int = 100
+    ):
+        self.classify_batch = classify_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.max_concurrent_batches = max_concurrent_batches
+        self.stats = {"submitted": 0, "batches": 0, "rejected": 0, "failed_batches": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = set()
+        # Messages taken off the queue that have not been handed to a batch task yet
+        self._collecting: List[Tuple[str, asyncio.Future]] = []
+
+    def _ensure_worker(self):
+        """Create the queue and worker task lazily inside the running event loop"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._batch_slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.create_task(self._collect_batches())
+
+    async def submit(self, content: str) -> Classification:
+        """Queue a message for classification and wait for its individual result"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self._queue.put((content, future)), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise ModerationOverloadedError("Moderation queue is full")
+        self.stats["submitted"] += 1
+        return await future
+
+    async def _collect_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._collecting = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Keep collecting the next batch while this one is being classified
+            await self._batch_slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._collecting = []
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            self.stats["batches"] += 1
+            results = await self.classify_batch([content for content, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} classifications, got {len(results)}")
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            print(f"Error classifying moderation batch: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._batch_slots.release()
+
+    async def close(self):
+        """Stop the worker and fail any messages still waiting in the queue or for a batch slot"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        await asyncio.gather(self._worker, *self._in_flight, return_exceptions=True)
+        waiting = self._collecting
+        self._collecting = []
+        while not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        for _, future in waiting:
+            if not future.done():
+                future.set_exception(ModerationOverloadedError("Moderation batcher stopped"))
+        self._worker = None
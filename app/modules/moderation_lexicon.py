@@ -0,0 +1,108 @@
+import json
+import os
+import re
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Words per classification (1 inappropriate, 2 sexual, 3 drugs) used when the LLM is unavailable.
+# Override with a JSON file of the same shape via MODERATION_LEXICON_PATH.
+DEFAULT_LEXICON: Dict[int, List[str]] = {
+    1: ["غبي", "حمار", "كلب", "حقير", "تافه", "يلعن", "وسخ", "حيوان"],
+    2: ["جنس", "جنسي", "سكس", "اباحي", "إباحي", "عاري"],
+    3: ["مخدرات", "مخدر", "حشيش", "كبتاجون", "شبو", "حبوب مخدرة", "هيروين", "كوكايين"],
+}
+
+
+def load_lexicon() -> Dict[int, List[str]]:
+    """Load the fallback lexicon from MODERATION_LEXICON_PATH, or use the built-in one"""
+    path = os.getenv("MODERATION_LEXICON_PATH")
+    if not path:
+        return DEFAULT_LEXICON
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {int(classification): list(words) for classification, words in json.load(f).items()}
+    except (OSError, ValueError) as e:
+        print(f"Error loading moderation lexicon, using the default one: {str(e)}")
+        return DEFAULT_LEXICON
+
+
+lexicon = load_lexicon()
+
+# One pattern per classification, checked from the most to the least severe
+_patterns = {
+    classification: re.compile(
+        r"(?<!\w)(" + "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True)) + r")(?!\w)",
+        re.IGNORECASE
+    )
+    for classification, words in lexicon.items() if words
+}
+
+
+def classify_with_lexicon(content: str) -> Tuple[int, List[str]]:
+    """Classify text with the local lexicon, returning (classification, matched words)"""
+    for classification in sorted(_patterns, reverse=True):
+        matches = _patterns[classification].findall(content)
+        if matches:
+            return classification, list(dict.fromkeys(matches))
+    return 0, []
+
+
+# Longest lexicon entry in words; the stream keeps that many trailing words pending
+_WORD = re.compile(r"\w+")
+MAX_PHRASE_WORDS = max((len(_WORD.findall(word)) for words in lexicon.values() for word in words), default=1)
+
+
+class StreamModerator:
+    """Incrementally moderate streamed text with the local lexicon.
+
+    Only whole words are moderated, and the last MAX_PHRASE_WORDS - 1 of them are
+    held back with the unfinished word, so a flagged word or phrase is always seen
+    whole before any of it is released. Inappropriate words (classification 1) are
+    masked; anything more severe blocks the rest of the stream.
+    """
+
+    def __init__(self, block_from: int = 2):
+        self.block_from = block_from
+        self.hold_words = max(MAX_PHRASE_WORDS - 1, 0)
+        # Text not yet released; the words already moderated in it are masked in place
+        self.pending = ""
+        self.blocked = False
+
+    def _moderate(self, text: str) -> str:
+        classification, words = classify_with_lexicon(text)
+        if classification >= self.block_from:
+            self.blocked = True
+            return ""
+        for word in words:
+            text = re.sub(r"(?<!\w)" + re.escape(word) + r"(?!\w)", "*" * len(word), text, flags=re.IGNORECASE)
+        return text
+
+    def feed(self, delta: str) -> str:
+        """Add a streamed chunk and return the text that is safe to send so far"""
+        if self.blocked:
+            return ""
+        self.pending += delta
+        complete = re.search(r"\w*\Z", self.pending).start()
+        if complete == 0:
+            return ""
+        text, partial = self.pending[:complete], self.pending[complete:]
+        moderated = self._moderate(text)
+        if self.blocked:
+            return ""
+        # Masking keeps the length, so word offsets in the raw text hold for the masked one
+        cut = complete
+        if self.hold_words:
+            words = [match.start() for match in _WORD.finditer(text)]
+            cut = words[-self.hold_words] if len(words) >= self.hold_words else 0
+        self.pending = moderated[cut:] + partial
+        return moderated[:cut]
+
+    def flush(self) -> str:
+        """Moderate and return whatever is left once the stream has ended"""
+        if self.blocked or not self.pending:
+            return ""
+        ready, self.pending = self.pending, ""
+        return self._moderate(ready)
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+import sqlalchemy as sa
+from app.database import get_connection
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+MODERATION_POLICY_PATH = os.getenv("MODERATION_POLICY_PATH")
+MODERATION_POLICY_RELOAD_SECONDS = float(os.getenv("MODERATION_POLICY_RELOAD_SECONDS", "60"))
+
+# Ages above this share the last column of the matrix
+MAX_POLICY_AGE = 25
+ACTIONS = ("allow", "mask", "notify")
+
+# Classification number -> risk settings. Flagged messages are masked, and the parent is
+# notified when the receiving child's age falls inside a "notify" rule.
+# MODERATION_POLICY_PATH may point to a JSON file of the same shape.
+DEFAULT_POLICY = {
+    "risks": {
+        "1": {
+            "code": "inappropriate_content",
+            "label": "Inappropriate Language",
+            "default_action": "mask",
+            "rules": [{"min_age": 6, "max_age": 9, "action": "notify"}],
+        },
+        "2": {
+            "code": "sexual_content",
+            "label": "Sexual Content",
+            "default_action": "mask",
+            "rules": [{"min_age": 6, "max_age": 13, "action": "notify"}],
+        },
+        "3": {
+            "code": "drug_related",
+            "label": "Drugs",
+            "default_action": "mask",
+            "rules": [{"min_age": 6, "max_age": 17, "action": "notify"}],
+        },
+    }
+}
+
+
+def compile_row(default_action: str, rules: List[dict]) -> List[str]:
+    """Expand age rules into one action per age, index MAX_POLICY_AGE + 1 holds the unknown-age action"""
+    row = [default_action] * (MAX_POLICY_AGE + 2)
+    min_ages = set()
+    for rule in rules:
+        if rule["action"] not in ACTIONS:
+            raise ValueError(f"Unknown moderation action: {rule['action']}")
+        if rule["min_age"] > rule["max_age"]:
+            raise ValueError(f"Rule min_age {rule['min_age']} is above its max_age {rule['max_age']}")
+        # Rules are stored keyed by their min_age
+        if rule["min_age"] in min_ages:
+            raise ValueError(f"More than one rule starts at age {rule['min_age']}")
+        min_ages.add(rule["min_age"])
+        for age in range(max(0, rule["min_age"]), min(MAX_POLICY_AGE, rule["max_age"]) + 1):
+            row[age] = rule["action"]
+    return row
+
+
+class CompiledPolicy:
+    """Immutable lookup tables built from the policy config, RiskType labels and parent overrides"""
+
+    def __init__(self, config: dict, labels: Dict[int, str], overrides: Dict[str, Dict[int, List[dict]]]):
+        self.risks = {int(risk_id): settings for risk_id, settings in config["risks"].items()}
+        self.codes = {risk_id: settings["code"] for risk_id, settings in self.risks.items()}
+        self.classifications = {code: risk_id for risk_id, code in self.codes.items()}
+        self.labels = {
+            settings["code"]: labels.get(risk_id, settings.get("label", settings["code"]))
+            for risk_id, settings in self.risks.items()
+        }
+        self.matrix = {
+            risk_id: compile_row(settings.get("default_action", "mask"), settings.get("rules", []))
+            for risk_id, settings in self.risks.items()
+        }
+        self.override_rules = overrides
+        self.parent_matrix = {
+            parent: {
+                risk_id: compile_row(self.risks[risk_id].get("default_action", "mask"), rules)
+                for risk_id, rules in risks.items() if risk_id in self.risks
+            }
+            for parent, risks in overrides.items()
+        }
+
+
+class ModerationPolicy:
+    """Hot-reloadable (risk, age) -> action lookup used by message moderation"""
+
+    def __init__(self):
+        self._compiled: Optional[CompiledPolicy] = None
+        self._lock = threading.Lock()
+        self._reload_task: Optional[asyncio.Task] = None
+
+    @property
+    def compiled(self) -> CompiledPolicy:
+        if self._compiled is None:
+            self.reload()
+        return self._compiled
+
+    # ---------------------- loading ----------------------
+    def _load_config(self) -> dict:
+        if not MODERATION_POLICY_PATH:
+            return DEFAULT_POLICY
+        with open(MODERATION_POLICY_PATH, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load_labels(self) -> Dict[int, str]:
+        with get_connection() as conn:
+            rows = conn.execute(sa.text("SELECT riskID, riskType FROM RiskType")).mappings().all()
+        return {row["riskID"]: row["riskType"] for row in rows}
+
+    def _load_overrides(self) -> Dict[str, Dict[int, List[dict]]]:
+        with get_connection() as conn:
+            rows = conn.execute(sa.text("""
+                SELECT parentUserName, riskID, minAge, maxAge, action
+                FROM ModerationPolicyOverride
+            """)).mappings().all()
+        overrides: Dict[str, Dict[int, List[dict]]] = {}
+        for row in rows:
+            overrides.setdefault(row["parentUserName"], {}).setdefault(row["riskID"], []).append(
+                {"min_age": row["minAge"], "max_age": row["maxAge"], "action": row["action"]}
+            )
+        return overrides
+
+    def reload(self):
+        """Rebuild the lookup tables and swap them in; on failure the previous tables stay active"""
+        previous = self._compiled
+        try:
+            config = self._load_config()
+        except (OSError, ValueError) as e:
+            print(f"Error loading moderation policy config: {str(e)}")
+            if previous is not None:
+                return
+            config = DEFAULT_POLICY
+
+        try:
+            labels = self._load_labels()
+            overrides = self._load_overrides()
+        except Exception as e:
+            print(f"Error loading moderation policy from the database: {str(e)}")
+            labels = {}
+            overrides = previous.override_rules if previous else {}
+
+        try:
+            compiled = CompiledPolicy(config, labels, overrides)
+        except (KeyError, ValueError) as e:
+            print(f"Invalid moderation policy, keeping the previous one: {str(e)}")
+            if previous is not None:
+                return
+            compiled = CompiledPolicy(DEFAULT_POLICY, labels, {})
+        with self._lock:
+            self._compiled = compiled
+
+    async def _reload_periodically(self):
+        while True:
+            await asyncio.sleep(MODERATION_POLICY_RELOAD_SECONDS)
+            await asyncio.to_thread(self.reload)
+
+    def start(self):
+        """Load the policy and keep refreshing it in the background (called at app startup)"""
+        self.reload()
+        self._reload_task = asyncio.create_task(self._reload_periodically())
+
+    async def stop(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            await asyncio.gather(self._reload_task, return_exceptions=True)
+            self._reload_task = None
+
+    # ---------------------- lookups ----------------------
+    def decide(self, classification: int, age: Optional[int], parent_username: Optional[str] = None) -> str:
+        """Action for a classified message sent to a child of the given age"""
+        compiled = self.compiled
+        row = compiled.parent_matrix.get(parent_username, {}).get(classification) or compiled.matrix.get(classification)
+        if row is None:
+            return "allow"
+        return row[MAX_POLICY_AGE + 1 if age is None else min(max(age, 0), MAX_POLICY_AGE)]
+
+    def risk_code(self, classification: int) -> Optional[str]:
+        return self.compiled.codes.get(classification)
+
+    def classification_for(self, risk_code: Optional[str]) -> int:
+        return self.compiled.classifications.get(risk_code, 0)
+
+    def risk_label(self, risk_code: Optional[str]) -> Optional[str]:
+        if risk_code is None:
+            return None
+        return self.compiled.labels.get(risk_code, risk_code)
+
+    def describe(self, parent_username: Optional[str] = None) -> dict:
+        """Effective rules per risk, including the parent's overrides when given"""
+        compiled = self.compiled
+        parent_rules = compiled.override_rules.get(parent_username, {})
+        return {
+            settings["code"]: {
+                "riskID": risk_id,
+                "label": compiled.labels[settings["code"]],
+                "default_action": settings.get("default_action", "mask"),
+                "rules": parent_rules.get(risk_id, settings.get("rules", [])),
+                "overridden": risk_id in parent_rules,
+            }
+            for risk_id, settings in compiled.risks.items()
+        }
+
+    # ---------------------- parent overrides ----------------------
+    def set_parent_override(self, parent_username: str, classification: int, rules: List[dict]):
+        """Replace the parent's rules for one risk; an empty list removes the override"""
+        compiled = self.compiled
+        if classification not in compiled.risks:
+            raise ValueError(f"Unknown risk: {classification}")
+        compile_row("mask", rules)  # validate before writing
+
+        with get_connection() as conn:
+            conn.execute(
+                sa.text("""
+                    DELETE FROM ModerationPolicyOverride
+                    WHERE parentUserName = :parent AND riskID = :risk
+                """),
+                {"parent": parent_username, "risk": classification}
+            )
+            if rules:
+                conn.execute(
+                    sa.text("""
+                        INSERT INTO ModerationPolicyOverride (parentUserName, riskID, minAge, maxAge, action)
+                        VALUES (:parent, :risk, :min_age, :max_age, :action)
+                    """),
+                    [{"parent": parent_username, "risk": classification, **rule} for rule in rules]
+                )
+            conn.commit()
+
+        # Apply locally straight away; other workers pick it up on their next reload
+        overrides = {parent: dict(risks) for parent, risks in compiled.override_rules.items()}
+        parent_overrides = overrides.setdefault(parent_username, {})
+        if rules:
+            parent_overrides[classification] = rules
+        else:
+            parent_overrides.pop(classification, None)
+        self._swap_overrides(overrides)
+
+    def forget_parent(self, parent_username: str):
+        """Drop a deleted parent's overrides from memory"""
+        overrides = dict(self.compiled.override_rules)
+        if overrides.pop(parent_username, None) is not None:
+            self._swap_overrides(overrides)
+
+    def _swap_overrides(self, overrides: Dict[str, Dict[int, List[dict]]]):
+        compiled = self.compiled
+        labels = {risk_id: compiled.labels[code] for risk_id, code in compiled.codes.items()}
+        config = {"risks": {str(risk_id): settings for risk_id, settings in compiled.risks.items()}}
+        with self._lock:
+            self._compiled = CompiledPolicy(config, labels, overrides)
+
+
+moderation_policy = ModerationPolicy()
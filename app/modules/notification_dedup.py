@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# Repeats of the same (sender, receiver, riskType) within this many seconds of the previous
+# one are folded into the open notification; 0 turns deduplication off
+NOTIFICATION_DEDUP_WINDOW_SECONDS = float(os.getenv("NOTIFICATION_DEDUP_WINDOW_SECONDS", "120"))
+# A burst starts a fresh notification after this long, so ongoing abuse still resurfaces
+NOTIFICATION_DEDUP_MAX_SPAN_SECONDS = float(os.getenv("NOTIFICATION_DEDUP_MAX_SPAN_SECONDS", "900"))
+NOTIFICATION_DEDUP_MAX_KEYS = int(os.getenv("NOTIFICATION_DEDUP_MAX_KEYS", "10000"))
+
+DedupKey = Tuple[str, str, str]
+
+
+class OpenNotification:
+    """The notification currently absorbing repeats of one key"""
+
+    def __init__(self, notification_id: int, now: float):
+        self.notification_id = notification_id
+        self.opened_at = now
+        self.last_seen = now
+
+
+class NotificationDeduplicator:
+    """Sliding windows of open notifications keyed on (sender, receiver, riskType).
+
+    Windows are per worker process; with several workers a burst collapses into at
+    most one notification per worker per window.
+    """
+
+    def __init__(self, window_seconds: float = NOTIFICATION_DEDUP_WINDOW_SECONDS,
+                 max_span_seconds: float = NOTIFICATION_DEDUP_MAX_SPAN_SECONDS,
+                 max_keys: int = NOTIFICATION_DEDUP_MAX_KEYS):
+        self.window_seconds = window_seconds
+        self.max_span_seconds = max_span_seconds
+        self.max_keys = max_keys
+        self._open: "OrderedDict[DedupKey, OpenNotification]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "coalesced": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0
+
+    def lookup(self, key: DedupKey) -> Optional[OpenNotification]:
+        """The open notification for key, with its window slid forward, or None"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._open.get(key)
+            if entry is None:
+                return None
+            if now - entry.last_seen > self.window_seconds or now - entry.opened_at > self.max_span_seconds:
+                del self._open[key]
+                return None
+            entry.last_seen = now
+            self._open.move_to_end(key)
+            return entry
+
+    def open(self, key: DedupKey, notification_id: Optional[int]):
+        """Start a window for a freshly inserted notification"""
+        if not self.enabled or notification_id is None:
+            return
+        with self._lock:
+            self._open[key] = OpenNotification(notification_id, time.monotonic())
+            self._open.move_to_end(key)
+            while len(self._open) > self.max_keys:
+                self._open.popitem(last=False)
+            self.stats["opened"] += 1
+
+    def close(self, key: DedupKey):
+        with self._lock:
+            self._open.pop(key, None)
+
+    def record_coalesced(self, count: int):
+        with self._lock:
+            self.stats["coalesced"] += count
+
+
+notification_deduplicator = NotificationDeduplicator()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+import sqlalchemy as sa
+from fastapi import HTTPException
+from app.database import get_connection
+from app.modules.moderation_policy import moderation_policy
+from app.modules.notification_dedup import NOTIFICATION_DEDUP_MAX_SPAN_SECONDS
+from app.modules.notification_hub import notification_hub
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+NOTIFICATION_DIGEST_CHECK_SECONDS = float(os.getenv("NOTIFICATION_DIGEST_CHECK_SECONDS", "300"))
+# Parents handled per check, so a backlog of due digests is spread over several checks
+NOTIFICATION_DIGEST_BATCH_SIZE = int(os.getenv("NOTIFICATION_DIGEST_BATCH_SIZE", "200"))
+
+DIGEST_PERIODS = {
+    "hourly": timedelta(hours=1),
+    "daily": timedelta(days=1),
+}
+DIGEST_FREQUENCIES = ("off", *DIGEST_PERIODS)
+
+
+class NotificationDigests:
+    """Periodic per-parent summaries of notification activity, for parents who opt in"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"sent": 0, "empty": 0}
+
+    # ---------------------- building ----------------------
+    def _summarize(self, conn, parent_username: str, since: datetime, until: datetime) -> list:
+        # Rows only absorb repeats for the dedup max span after they are opened, so older
+        # rows cannot have activity in the period and the feed index narrows the scan
+        rows = conn.execute(
+            sa.text("""
+                SELECT
+                    receiverChildUserName AS receiver,
+                    riskType,
+                    COUNT(*) AS notifications,
+                    SUM(occurrenceCount) AS occurrences,
+                    SUM(isRead = 0) AS unread
+                FROM Notification
+                WHERE parentUserName = :parentUserName
+                  AND timeStamp >= :earliest
+                  AND COALESCE(lastOccurrenceAt, timeStamp) >= :since
+                  AND COALESCE(lastOccurrenceAt, timeStamp) < :until
+                GROUP BY receiverChildUserName, riskType
+                ORDER BY occurrences DESC
+            """),
+            {
+                "parentUserName": parent_username,
+                "earliest": since - timedelta(seconds=NOTIFICATION_DEDUP_MAX_SPAN_SECONDS),
+                "since": since,
+                "until": until,
+            }
+        ).mappings().all()
+        return [
+            {
+                "receiver": row["receiver"],
+                "riskType": row["riskType"],
+                "riskLabel": moderation_policy.risk_label(row["riskType"]),
+                "notifications": int(row["notifications"]),
+                "occurrences": int(row["occurrences"] or 0),
+                "unread": int(row["unread"] or 0),
+            }
+            for row in rows
+        ]
+
+    def send_due(self) -> int:
+        """Build and deliver every digest that is due; returns how many were sent"""
+        now = datetime.now()
+        with get_connection() as conn:
+            due = conn.execute(
+                sa.text("""
+                    SELECT parentUserName, frequency, lastSentAt
+                    FROM NotificationDigestPreference
+                    WHERE (frequency = 'hourly' AND (lastSentAt IS NULL OR lastSentAt <= :hourAgo))
+                       OR (frequency = 'daily' AND (lastSentAt IS NULL OR lastSentAt <= :dayAgo))
+                    LIMIT :limit
+                """),
+                {
+                    "hourAgo": now - DIGEST_PERIODS["hourly"],
+                    "dayAgo": now - DIGEST_PERIODS["daily"],
+                    "limit": NOTIFICATION_DIGEST_BATCH_SIZE,
+                }
+            ).mappings().all()
+
+        sent = 0
+        for preference in due:
+            parent_username = preference["parentUserName"]
+            since = preference["lastSentAt"] or now - DIGEST_PERIODS[preference["frequency"]]
+            with get_connection() as conn:
+                # Claiming the period first means two workers never send the same digest
+                claimed = conn.execute(
+                    sa.text("""
+                        UPDATE NotificationDigestPreference
+                        SET lastSentAt = :now
+                        WHERE parentUserName = :parentUserName AND lastSentAt <=> :previous
+                    """),
+                    {"now": now, "parentUserName": parent_username, "previous": preference["lastSentAt"]}
+                ).rowcount
+                if not claimed:
+                    continue
+                summary = self._summarize(conn, parent_username, since, now)
+                if summary:
+                    conn.execute(
+                        sa.text("""
+                            INSERT INTO NotificationDigest (
+                                parentUserName, periodStart, periodEnd, notificationCount, occurrenceCount, summary
+                            )
+                            VALUES (:parentUserName, :since, :until, :notifications, :occurrences, :summary)
+                        """),
+                        {
+                            "parentUserName": parent_username,
+                            "since": since,
+                            "until": now,
+                            "notifications": sum(item["notifications"] for item in summary),
+                            "occurrences": sum(item["occurrences"] for item in summary),
+                            "summary": json.dumps(summary, ensure_ascii=False),
+                        }
+                    )
+                conn.commit()
+
+            if not summary:
+                self.stats["empty"] += 1
+                continue
+            notification_hub.publish(parent_username, "digest", {
+                "periodStart": since.isoformat(),
+                "periodEnd": now.isoformat(),
+                "items": summary,
+            })
+            sent += 1
+        self.stats["sent"] += sent
+        return sent
+
+    # ---------------------- background loop ----------------------
+    async def _run_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.send_due)
+            except Exception as e:
+                print(f"Error sending notification digests: {str(e)}")
+            await asyncio.sleep(NOTIFICATION_DIGEST_CHECK_SECONDS)
+
+    def start(self):
+        """Send due digests in the background (called at app startup)"""
+        self._task = asyncio.create_task(self._run_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ---------------------- parent settings ----------------------
+    def get_preference(self, parent_username: str) -> dict:
+        with get_connection() as conn:
+            row = conn.execute(
+                sa.text("""
+                    SELECT frequency, lastSentAt FROM NotificationDigestPreference
+                    WHERE parentUserName = :parentUserName
+                """),
+                {"parentUserName": parent_username}
+            ).mappings().first()
+        return dict(row) if row else {"frequency": "off", "lastSentAt": None}
+
+    def set_preference(self, parent_username: str, frequency: str) -> dict:
+        if frequency not in DIGEST_FREQUENCIES:
+            raise HTTPException(status_code=400, detail="تكرار الملخص غير صالح")
+        with get_connection() as conn:
+            # The first digest covers activity from the moment the parent opted in
+            conn.execute(
+                sa.text("""
+                    INSERT INTO NotificationDigestPreference (parentUserName, frequency, lastSentAt)
+                    VALUES (:parentUserName, :frequency, :now)
+                    ON DUPLICATE KEY UPDATE frequency = VALUES(frequency)
+                """),
+                {"parentUserName": parent_username, "frequency": frequency, "now": datetime.now()}
+            )
+            conn.commit()
+        return self.get_preference(parent_username)
+
+    def get_digests(self, parent_username: str, limit: int = 20) -> list:
+        with get_connection() as conn:
+            rows = conn.execute(
+                sa.text("""
+                    SELECT digestID, periodStart, periodEnd, notificationCount, occurrenceCount, summary
+                    FROM NotificationDigest
+                    WHERE parentUserName = :parentUserName
+                    ORDER BY periodEnd DESC
+                    LIMIT :limit
+                """),
+                {"parentUserName": parent_username, "limit": limit}
+            ).mappings().all()
+        return [{**dict(row), "summary": json.loads(row["summary"])} for row in rows]
+
+
+notification_digests = NotificationDigests()
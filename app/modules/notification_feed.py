@@ -0,0 +1,216 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import sqlalchemy as sa
+from fastapi import HTTPException
+from app.database import get_connection
+from app.modules.moderation_policy import moderation_policy
+
+# ------------------- constants --------------------
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# ---------------------- cursors ----------------------
+def encode_cursor(time_stamp: datetime, notification_id: int) -> str:
+    """Opaque cursor pointing just after the given notification in the feed order"""
+    payload = json.dumps({"t": time_stamp.isoformat(), "id": notification_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload["t"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="مؤشر الصفحة غير صالح")
+
+
+# ---------------------- feed ----------------------
+def fetch_notifications(parent_username: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                        child_username: Optional[str] = None, risk_type: Optional[str] = None,
+                        unread_only: bool = False) -> Tuple[List[dict], Optional[str]]:
+    """One page of a parent's notifications, newest first, and the cursor of the next page.
+
+    Pages are read by seeking on (timeStamp, notificationID) through the parent feed index,
+    so the cost of a page does not depend on how much history the parent has.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    conditions = ["n.parentUserName = :parentUserName"]
+    params = {"parentUserName": parent_username, "limit": limit + 1}
+    if child_username:
+        conditions.append("n.receiverChildUserName = :child")
+        params["child"] = child_username
+    if risk_type:
+        conditions.append("n.riskType = :riskType")
+        params["riskType"] = risk_type
+    if unread_only:
+        conditions.append("n.isRead = 0")
+    if cursor:
+        params["cursorTime"], params["cursorID"] = decode_cursor(cursor)
+        conditions.append(
+            "(n.timeStamp < :cursorTime OR (n.timeStamp = :cursorTime AND n.notificationID < :cursorID))"
+        )
+
+    with get_connection() as conn:
+        rows = conn.execute(
+            sa.text(f"""
+                SELECT
+                    n.notificationID,
+                    n.firebaseMessageID,
+                    n.content,
+                    n.originalContent,
+                    n.timeStamp,
+                    n.senderChildUserName AS sender,
+                    n.receiverChildUserName AS receiver,
+                    c.firstName AS receiverFirstName,
+                    c.lastName AS receiverLastName,
+                    n.riskType,
+                    n.isRead,
+                    n.occurrenceCount,
+                    n.latestContent,
+                    n.lastOccurrenceAt
+                FROM Notification n
+                JOIN Child c ON n.receiverChildUserName = c.childUserName
+                WHERE {" AND ".join(conditions)}
+                ORDER BY n.timeStamp DESC, n.notificationID DESC
+                LIMIT :limit
+            """),
+            params
+        ).mappings().all()
+
+    # One extra row tells whether another page exists without a COUNT query
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timeStamp"], rows[-1]["notificationID"])
+
+    # Display names come from the moderation policy instead of a hard-coded CASE
+    notifications = [
+        {**dict(row), "riskLabel": moderation_policy.risk_label(row["riskType"])}
+        for row in rows
+    ]
+    return notifications, next_cursor
+
+
+# ---------------------- read state ----------------------
+def increment_unread(conn, counts: Dict[str, int]):
+    """Add new notifications to the parents' unread counters inside the caller's transaction.
+
+    Parents without a counter row are skipped; their row is built from a full count the
+    first time the unread count is read, which also covers notifications from before the
+    counter existed.
+    """
+    conn.execute(
+        sa.text("""
+            UPDATE ParentUnreadCounter
+            SET unreadCount = unreadCount + :count
+            WHERE parentUserName = :parentUserName
+        """),
+        [{"parentUserName": parent, "count": count} for parent, count in counts.items()]
+    )
+
+def mark_notifications_read(parent_username: str, notification_ids: Optional[List[int]] = None,
+                            up_to_cursor: Optional[str] = None, newest_id: Optional[int] = None,
+                            child_username: Optional[str] = None) -> int:
+    """Mark notifications read with one UPDATE and return how many changed.
+
+    Either explicit ids, or the range the parent has actually seen: from the newest
+    notification displayed (newest_id) down to the position of a feed cursor, optionally
+    for one child. Notifications that arrived after the feed was loaded stay unread.
+    """
+    if not notification_ids and not up_to_cursor:
+        raise HTTPException(status_code=400, detail="يجب تحديد الإشعارات أو مؤشر الصفحة")
+    if up_to_cursor and newest_id is None:
+        raise HTTPException(status_code=400, detail="يجب تحديد أحدث إشعار معروض مع مؤشر الصفحة")
+
+    conditions = ["parentUserName = :parentUserName", "isRead = 0"]
+    params = {"parentUserName": parent_username}
+    bindparams = []
+    if notification_ids:
+        conditions.append("notificationID IN :ids")
+        params["ids"] = list(notification_ids)
+        bindparams.append(sa.bindparam("ids", expanding=True))
+    if up_to_cursor:
+        params["cursorTime"], params["cursorID"] = decode_cursor(up_to_cursor)
+        params["newestID"] = newest_id
+        conditions.append(
+            "(timeStamp > :cursorTime OR (timeStamp = :cursorTime AND notificationID >= :cursorID))"
+        )
+        conditions.append(
+            "(timeStamp < :newestTime OR (timeStamp = :newestTime AND notificationID <= :newestID))"
+        )
+    if child_username:
+        conditions.append("receiverChildUserName = :child")
+        params["child"] = child_username
+
+    with get_connection() as conn:
+        if up_to_cursor:
+            # MySQL cannot read the updated table in a subquery, so the upper bound is looked up first
+            params["newestTime"] = conn.execute(
+                sa.text("""
+                    SELECT timeStamp FROM Notification
+                    WHERE notificationID = :newestID AND parentUserName = :parentUserName
+                """),
+                {"newestID": newest_id, "parentUserName": parent_username}
+            ).scalar()
+            if params["newestTime"] is None:
+                raise HTTPException(status_code=404, detail="الإشعار غير موجود")
+        # isRead = 0 in the filter makes rowcount exactly the number of newly read rows
+        result = conn.execute(
+            sa.text(f"UPDATE Notification SET isRead = 1 WHERE {' AND '.join(conditions)}").bindparams(*bindparams),
+            params
+        )
+        marked = result.rowcount
+        if marked:
+            conn.execute(
+                sa.text("""
+                    UPDATE ParentUnreadCounter
+                    SET unreadCount = GREATEST(unreadCount - :marked, 0)
+                    WHERE parentUserName = :parentUserName
+                """),
+                {"parentUserName": parent_username, "marked": marked}
+            )
+        conn.commit()
+    return marked
+
+def get_unread_count(parent_username: str) -> int:
+    """Unread notifications of a parent from the maintained counter (one primary key read)"""
+    with get_connection() as conn:
+        count = conn.execute(
+            sa.text("SELECT unreadCount FROM ParentUnreadCounter WHERE parentUserName = :parentUserName"),
+            {"parentUserName": parent_username}
+        ).scalar()
+    if count is None:
+        # Parents without a counter row yet get it built once from their notifications
+        return rebuild_unread_counters(parent_username).get(parent_username, 0)
+    return count
+
+def rebuild_unread_counters(parent_username: Optional[str] = None) -> Dict[str, int]:
+    """Recount unread notifications for one parent, or for everyone to repair drifted counters"""
+    where = "WHERE parentUserName = :parentUserName" if parent_username else ""
+    params = {"parentUserName": parent_username} if parent_username else {}
+    with get_connection() as conn:
+        rows = conn.execute(
+            sa.text(f"""
+                SELECT parentUserName, SUM(isRead = 0) AS unreadCount
+                FROM Notification
+                {where}
+                GROUP BY parentUserName
+            """),
+            params
+        ).mappings().all()
+        counts = {row["parentUserName"]: int(row["unreadCount"] or 0) for row in rows}
+        if parent_username and parent_username not in counts:
+            counts[parent_username] = 0
+        if counts:
+            conn.execute(
+                sa.text("""
+                    INSERT INTO ParentUnreadCounter (parentUserName, unreadCount)
+                    VALUES (:parentUserName, :count)
+                    ON DUPLICATE KEY UPDATE unreadCount = VALUES(unreadCount)
+                """),
+                [{"parentUserName": parent, "count": count} for parent, count in counts.items()]
+            )
+        conn.commit()
+    return counts
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Optional, Set
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# "memory" delivers only to parents connected to this worker; "redis" fans out across workers
+NOTIFICATION_HUB_BACKEND = os.getenv("NOTIFICATION_HUB_BACKEND", "memory")
+NOTIFICATION_HUB_REDIS_URL = os.getenv("NOTIFICATION_HUB_REDIS_URL", "redis://localhost:6379/0")
+NOTIFICATION_HUB_CHANNEL = os.getenv("NOTIFICATION_HUB_CHANNEL", "anees:notifications")
+NOTIFICATION_HEARTBEAT_SECONDS = float(os.getenv("NOTIFICATION_HEARTBEAT_SECONDS", "20"))
+# Events buffered per connection; a slow client loses the oldest ones first
+NOTIFICATION_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("NOTIFICATION_SUBSCRIBER_QUEUE_SIZE", "100"))
+
+
+class Subscription:
+    """Bounded event queue of one connected parent session"""
+
+    def __init__(self, parent_username: str, max_size: int = NOTIFICATION_SUBSCRIBER_QUEUE_SIZE):
+        self.parent_username = parent_username
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        # Events discarded since the client last heard about it
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def next_event(self, timeout: float = NOTIFICATION_HEARTBEAT_SECONDS) -> dict:
+        """Next event to send, a "resync" event after drops, or a heartbeat when idle"""
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {"event": "resync", "data": {"dropped": dropped}}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return {"event": "heartbeat", "data": {}}
+
+
+# ---------------------- fan-out backends ----------------------
+class InMemoryBackend:
+    """Single-process fan-out: events go straight to this worker's subscribers"""
+
+    name = "memory"
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def publish(self, parent_username: str, event: dict):
+        self.deliver(parent_username, event)
+
+    async def stop(self):
+        pass
+
+
+class RedisBackend:
+    """Cross-worker fan-out over Redis pub/sub (needs the optional redis package)"""
+
+    name = "redis"
+
+    def __init__(self, deliver, url: str = NOTIFICATION_HUB_REDIS_URL, channel: str = NOTIFICATION_HUB_CHANNEL):
+        import redis.asyncio as redis
+
+        self.deliver = deliver
+        self.channel = channel
+        self.redis = redis.from_url(url)
+        self.pubsub = None
+        self._listen_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.channel)
+        self._listen_task = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    payload = json.loads(message["data"])
+                    self.deliver(payload["parent"], payload["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error reading notification events from Redis: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def publish(self, parent_username: str, event: dict):
+        await self.redis.publish(
+            self.channel,
+            json.dumps({"parent": parent_username, "event": event}, ensure_ascii=False, default=str)
+        )
+
+    async def stop(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+        await self.redis.aclose()
+
+
+# ---------------------- hub ----------------------
+class NotificationHub:
+    """Pushes new notifications to connected parent sessions.
+
+    publish() may be called from any thread (routes, the notification worker); delivery
+    happens on the event loop captured by start().
+    """
+
+    def __init__(self, backend: str = NOTIFICATION_HUB_BACKEND):
+        self.backend_name = backend
+        self.backend = None
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    async def start(self):
+        """Bind to the running loop and connect the fan-out backend (called at app startup)"""
+        self._loop = asyncio.get_running_loop()
+        if self.backend_name == "redis":
+            try:
+                self.backend = RedisBackend(self._deliver)
+                await self.backend.start()
+                return
+            except Exception as e:
+                print(f"Redis notification backend unavailable, delivering in-process only: {str(e)}")
+        self.backend = InMemoryBackend(self._deliver)
+        await self.backend.start()
+
+    async def stop(self):
+        if self.backend is not None:
+            await self.backend.stop()
+            self.backend = None
+        self._loop = None
+
+    # ---------------------- subscribers ----------------------
+    def subscribe(self, parent_username: str) -> Subscription:
+        subscription = Subscription(parent_username)
+        with self._lock:
+            self._subscribers.setdefault(parent_username, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.parent_username)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.parent_username]
+
+    def _deliver(self, parent_username: str, event: dict):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(parent_username, ()))
+        for subscription in subscriptions:
+            dropped = subscription.dropped
+            subscription.offer(event)
+            self.stats["dropped"] += subscription.dropped - dropped
+            self.stats["delivered"] += 1
+
+    # ---------------------- publishing ----------------------
+    def publish(self, parent_username: str, event: str, data: dict):
+        """Queue an event for a parent's sessions; never blocks or raises into the caller"""
+        loop, backend = self._loop, self.backend
+        if loop is None or backend is None or loop.is_closed():
+            return
+        self.stats["published"] += 1
+        message = {"event": event, "data": data}
+        try:
+            if backend.name == "memory":
+                loop.call_soon_threadsafe(self._deliver, parent_username, message)
+            else:
+                future = asyncio.run_coroutine_threadsafe(backend.publish(parent_username, message), loop)
+                future.add_done_callback(self._report_failure)
+        except RuntimeError:
+            # The loop is shutting down
+            pass
+
+    @staticmethod
+    def _report_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error publishing notification event: {str(future.exception())}")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            connections = sum(len(subscriptions) for subscriptions in self._subscribers.values())
+        return {
+            **self.stats,
+            "backend": self.backend.name if self.backend else None,
+            "connections": connections,
+        }
+
+
+notification_hub = NotificationHub()
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import List, Optional
+import sqlalchemy as sa
+from dotenv import load_dotenv
+from app.modules import message as message_module
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# Send-message routes hand notifications to this pipeline instead of inserting them inline
+NOTIFICATION_ASYNC = os.getenv("NOTIFICATION_ASYNC", "false").lower() == "true"
+NOTIFICATION_OUTBOX_PATH = os.getenv("NOTIFICATION_OUTBOX_PATH", "notification_outbox.db")
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))
+NOTIFICATION_POLL_SECONDS = float(os.getenv("NOTIFICATION_POLL_SECONDS", "2"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "8"))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", "2"))
+# Claims older than this are considered abandoned by a crashed worker and picked up again
+NOTIFICATION_CLAIM_TIMEOUT_SECONDS = float(os.getenv("NOTIFICATION_CLAIM_TIMEOUT_SECONDS", "60"))
+
+# ---------------------- local outbox ----------------------
+# The outbox lives in a local SQLite file so queued notifications survive restarts
+# without adding a MySQL round trip to the send-message path. It is only opened once
+# notifications are actually queued, so deployments without the pipeline never create it.
+outbox_metadata = sa.MetaData()
+
+outboxTable = sa.Table(
+    "NotificationOutbox",
+    outbox_metadata,
+    sa.Column("outboxID", sa.Integer, primary_key=True, autoincrement=True),
+    sa.Column("payload", sa.Text, nullable=False),
+    sa.Column("status", sa.String(10), nullable=False, default="pending"),
+    sa.Column("attempts", sa.Integer, nullable=False, default=0),
+    sa.Column("nextAttemptAt", sa.Float, nullable=False, default=0),
+    sa.Column("claimedBy", sa.String(36), nullable=True),
+    sa.Column("claimedAt", sa.Float, nullable=True),
+    sa.Column("lastError", sa.String(255), nullable=True),
+    sa.Index("ix_outbox_due", "status", "nextAttemptAt"),
+)
+
+_outbox_engine: Optional[sa.engine.Engine] = None
+_outbox_lock = threading.Lock()
+
+def get_outbox_engine(create: bool = True) -> Optional[sa.engine.Engine]:
+    """Open the outbox and create its table on first use.
+
+    With create=False an outbox is only opened if a previous run left its file behind.
+    """
+    global _outbox_engine
+    if _outbox_engine is None and (create or os.path.exists(NOTIFICATION_OUTBOX_PATH)):
+        with _outbox_lock:
+            if _outbox_engine is None:
+                engine = sa.create_engine(f"sqlite:///{NOTIFICATION_OUTBOX_PATH}")
+                outbox_metadata.create_all(engine)
+                _outbox_engine = engine
+    return _outbox_engine
+
+
+def enqueue_notifications(notifications: List[dict]):
+    """Persist notifications to the local outbox and wake the worker.
+
+    Each item carries the same keys as the create_notification arguments.
+    """
+    if not notifications:
+        return
+    with get_outbox_engine().begin() as conn:
+        conn.execute(
+            outboxTable.insert(),
+            [{"payload": json.dumps(n, ensure_ascii=False), "status": "pending", "attempts": 0, "nextAttemptAt": 0}
+             for n in notifications]
+        )
+    notification_worker.wake()
+
+
+# ---------------------- worker ----------------------
+class NotificationWorker:
+    """Drain the outbox into the Notification table in batches, retrying failures with backoff"""
+
+    def __init__(self):
+        self.worker_id = str(uuid.uuid4())
+        self._wake_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"delivered": 0, "retried": 0, "dead": 0}
+
+    def start(self):
+        if NOTIFICATION_ASYNC:
+            get_outbox_engine()
+        self._wake_event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def stop(self):
+        """Stop the worker after one last flush; anything left stays in the outbox for the next start"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Error flushing notification outbox: {str(e)}")
+                delivered = 0
+            # A full batch means there is probably more waiting, so go again straight away
+            if delivered < NOTIFICATION_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), NOTIFICATION_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake_event.clear()
+
+    def _claim_batch(self) -> List[dict]:
+        # Nothing was ever queued here, by this run or a previous one
+        engine = get_outbox_engine(create=False)
+        if engine is None:
+            return []
+        now = time.time()
+        with engine.begin() as conn:
+            due = sa.select(outboxTable.c.outboxID).where(
+                outboxTable.c.status == "pending",
+                outboxTable.c.nextAttemptAt <= now,
+                sa.or_(
+                    outboxTable.c.claimedBy.is_(None),
+                    outboxTable.c.claimedAt < now - NOTIFICATION_CLAIM_TIMEOUT_SECONDS
+                )
+            ).order_by(outboxTable.c.outboxID).limit(NOTIFICATION_BATCH_SIZE)
+            conn.execute(
+                outboxTable.update()
+                .where(outboxTable.c.outboxID.in_(due.scalar_subquery()))
+                .values(claimedBy=self.worker_id, claimedAt=now)
+            )
+            rows = conn.execute(
+                sa.select(outboxTable).where(
+                    outboxTable.c.claimedBy == self.worker_id,
+                    outboxTable.c.status == "pending"
+                )
+            ).mappings().all()
+        return [dict(row) for row in rows]
+
+    def flush(self) -> int:
+        """Deliver one batch of due notifications, returning how many were written"""
+        rows = self._claim_batch()
+        if not rows:
+            return 0
+
+        try:
+            message_module.create_notifications([json.loads(row["payload"]) for row in rows])
+            self._mark_delivered([row["outboxID"] for row in rows])
+            return len(rows)
+        except Exception as e:
+            print(f"Batch notification insert failed, retrying rows one by one: {str(e)}")
+
+        # Isolate the rows that fail so one bad notification does not hold back the rest
+        delivered = []
+        for row in rows:
+            try:
+                message_module.create_notification(**json.loads(row["payload"]))
+                delivered.append(row["outboxID"])
+            except Exception as e:
+                self._mark_failed(row, str(e))
+        self._mark_delivered(delivered)
+        return len(delivered)
+
+    def _mark_delivered(self, outbox_ids: List[int]):
+        if not outbox_ids:
+            return
+        with get_outbox_engine().begin() as conn:
+            conn.execute(outboxTable.delete().where(outboxTable.c.outboxID.in_(outbox_ids)))
+        self.stats["delivered"] += len(outbox_ids)
+
+    def _mark_failed(self, row: dict, error: str):
+        attempts = row["attempts"] + 1
+        if attempts >= NOTIFICATION_MAX_ATTEMPTS:
+            status, self.stats["dead"] = "dead", self.stats["dead"] + 1
+            print(f"Notification {row['outboxID']} moved to dead letter after {attempts} attempts: {error}")
+        else:
+            status, self.stats["retried"] = "pending", self.stats["retried"] + 1
+        with get_outbox_engine().begin() as conn:
+            conn.execute(
+                outboxTable.update().where(outboxTable.c.outboxID == row["outboxID"]).values(
+                    status=status,
+                    attempts=attempts,
+                    nextAttemptAt=time.time() + NOTIFICATION_RETRY_BASE_SECONDS * (2 ** attempts),
+                    claimedBy=None,
+                    claimedAt=None,
+                    lastError=error[:255]
+                )
+            )
+
+
+notification_worker = NotificationWorker()
@@ -0,0 +1,213 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+import sqlalchemy as sa
+from fastapi import HTTPException
+from app.database import get_connection
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# Notifications older than this move to NotificationArchive unless the parent chose otherwise
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+# Archived rows are deleted after this many days; 0 keeps them forever
+NOTIFICATION_ARCHIVE_KEEP_DAYS = int(os.getenv("NOTIFICATION_ARCHIVE_KEEP_DAYS", "365"))
+NOTIFICATION_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_ARCHIVE_INTERVAL_SECONDS", "3600"))
+# Rows moved per transaction, and the pause between transactions so other writers get the locks
+NOTIFICATION_ARCHIVE_BATCH_SIZE = int(os.getenv("NOTIFICATION_ARCHIVE_BATCH_SIZE", "500"))
+NOTIFICATION_ARCHIVE_PAUSE_SECONDS = float(os.getenv("NOTIFICATION_ARCHIVE_PAUSE_SECONDS", "0.2"))
+# Upper bound on batches per run, so one run never monopolises the database
+NOTIFICATION_ARCHIVE_MAX_BATCHES = int(os.getenv("NOTIFICATION_ARCHIVE_MAX_BATCHES", "200"))
+
+MIN_RETENTION_DAYS = 1
+MAX_RETENTION_DAYS = 3650
+
+
+class NotificationRetention:
+    """Background job that keeps the hot Notification table bounded.
+
+    Expired notifications are copied to NotificationArchive without their unmasked
+    originalContent and deleted from Notification, one short transaction per batch.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"runs": 0, "archived": 0, "purged": 0, "last_run_seconds": None}
+
+    # ---------------------- batches ----------------------
+    def _expired_ids(self, conn, now: datetime) -> list:
+        # Nothing newer than the shortest retention anyone uses can be expired,
+        # which lets the timeStamp index cut the scan down first
+        shortest = conn.execute(sa.text("SELECT MIN(retentionDays) FROM ParentRetention")).scalar()
+        earliest_cutoff = now - timedelta(days=min(shortest or NOTIFICATION_RETENTION_DAYS, NOTIFICATION_RETENTION_DAYS))
+        return conn.execute(
+            sa.text("""
+                SELECT n.notificationID
+                FROM Notification n
+                LEFT JOIN ParentRetention r ON r.parentUserName = n.parentUserName
+                WHERE n.timeStamp < :earliestCutoff
+                  AND n.timeStamp < COALESCE(DATE_SUB(:now, INTERVAL r.retentionDays DAY), :defaultCutoff)
+                ORDER BY n.timeStamp
+                LIMIT :limit
+            """),
+            {
+                "now": now,
+                "earliestCutoff": earliest_cutoff,
+                "defaultCutoff": now - timedelta(days=NOTIFICATION_RETENTION_DAYS),
+                "limit": NOTIFICATION_ARCHIVE_BATCH_SIZE,
+            }
+        ).scalars().all()
+
+    def archive_batch(self) -> int:
+        """Move one batch of expired notifications to the archive; returns how many moved"""
+        with get_connection() as conn:
+            ids = self._expired_ids(conn, datetime.now())
+            if not ids:
+                return 0
+            params = {"ids": ids}
+            # Lock just this batch; a row another worker already moved is simply not found
+            rows = conn.execute(
+                sa.text("""
+                    SELECT parentUserName, isRead
+                    FROM Notification
+                    WHERE notificationID IN :ids
+                    FOR UPDATE
+                """).bindparams(sa.bindparam("ids", expanding=True)),
+                params
+            ).mappings().all()
+            unread = Counter(row["parentUserName"] for row in rows if not row["isRead"])
+            conn.execute(
+                sa.text("""
+                    INSERT IGNORE INTO NotificationArchive (
+                        notificationID, firebaseMessageID, senderChildUserName, receiverChildUserName,
+                        parentUserName, content, riskType, timeStamp, isRead,
+                        occurrenceCount, latestContent, lastOccurrenceAt
+                    )
+                    SELECT
+                        notificationID, firebaseMessageID, senderChildUserName, receiverChildUserName,
+                        parentUserName, content, riskType, timeStamp, isRead,
+                        occurrenceCount, latestContent, lastOccurrenceAt
+                    FROM Notification
+                    WHERE notificationID IN :ids
+                """).bindparams(sa.bindparam("ids", expanding=True)),
+                params
+            )
+            moved = conn.execute(
+                sa.text("DELETE FROM Notification WHERE notificationID IN :ids").bindparams(
+                    sa.bindparam("ids", expanding=True)
+                ),
+                params
+            ).rowcount
+            # Archived unread notifications no longer count towards the badge
+            adjustments = [{"parentUserName": parent, "unread": count} for parent, count in unread.items()]
+            if adjustments:
+                conn.execute(
+                    sa.text("""
+                        UPDATE ParentUnreadCounter
+                        SET unreadCount = GREATEST(unreadCount - :unread, 0)
+                        WHERE parentUserName = :parentUserName
+                    """),
+                    adjustments
+                )
+            conn.commit()
+        return moved
+
+    def purge_batch(self) -> int:
+        """Delete one batch of archived notifications past NOTIFICATION_ARCHIVE_KEEP_DAYS"""
+        if NOTIFICATION_ARCHIVE_KEEP_DAYS <= 0:
+            return 0
+        with get_connection() as conn:
+            purged = conn.execute(
+                sa.text("DELETE FROM NotificationArchive WHERE timeStamp < :cutoff ORDER BY timeStamp LIMIT :limit"),
+                {
+                    "cutoff": datetime.now() - timedelta(days=NOTIFICATION_ARCHIVE_KEEP_DAYS),
+                    "limit": NOTIFICATION_ARCHIVE_BATCH_SIZE,
+                }
+            ).rowcount
+            conn.commit()
+        return purged
+
+    def _drain(self, step) -> int:
+        total = 0
+        for _ in range(NOTIFICATION_ARCHIVE_MAX_BATCHES):
+            count = step()
+            total += count
+            if count < NOTIFICATION_ARCHIVE_BATCH_SIZE:
+                break
+            time.sleep(NOTIFICATION_ARCHIVE_PAUSE_SECONDS)
+        return total
+
+    def run_once(self) -> dict:
+        """Archive, then purge, in batches until caught up or the per-run cap is reached"""
+        started = time.monotonic()
+        archived = self._drain(self.archive_batch)
+        purged = self._drain(self.purge_batch)
+
+        self.stats["runs"] += 1
+        self.stats["archived"] += archived
+        self.stats["purged"] += purged
+        self.stats["last_run_seconds"] = round(time.monotonic() - started, 2)
+        if archived or purged:
+            print(f"Notification retention: archived {archived}, purged {purged}")
+        return {"archived": archived, "purged": purged}
+
+    # ---------------------- background loop ----------------------
+    async def _run_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"Error archiving notifications: {str(e)}")
+            await asyncio.sleep(NOTIFICATION_ARCHIVE_INTERVAL_SECONDS)
+
+    def start(self):
+        """Run the retention job in the background (called at app startup)"""
+        self._task = asyncio.create_task(self._run_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ---------------------- parent settings ----------------------
+    def get_retention(self, parent_username: str) -> dict:
+        with get_connection() as conn:
+            days = conn.execute(
+                sa.text("SELECT retentionDays FROM ParentRetention WHERE parentUserName = :parentUserName"),
+                {"parentUserName": parent_username}
+            ).scalar()
+        return {"retentionDays": days or NOTIFICATION_RETENTION_DAYS, "isDefault": days is None}
+
+    def set_retention(self, parent_username: str, days: Optional[int]) -> dict:
+        """Keep a parent's notifications for the given number of days; None restores the default"""
+        if days is not None and not MIN_RETENTION_DAYS <= days <= MAX_RETENTION_DAYS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"مدة الاحتفاظ يجب أن تكون بين {MIN_RETENTION_DAYS} و {MAX_RETENTION_DAYS} يوماً"
+            )
+        with get_connection() as conn:
+            if days is None:
+                conn.execute(
+                    sa.text("DELETE FROM ParentRetention WHERE parentUserName = :parentUserName"),
+                    {"parentUserName": parent_username}
+                )
+            else:
+                conn.execute(
+                    sa.text("""
+                        INSERT INTO ParentRetention (parentUserName, retentionDays)
+                        VALUES (:parentUserName, :days)
+                        ON DUPLICATE KEY UPDATE retentionDays = VALUES(retentionDays)
+                    """),
+                    {"parentUserName": parent_username, "days": days}
+                )
+            conn.commit()
+        return self.get_retention(parent_username)
+
+
+notification_retention = NotificationRetention()
@@ -9,6 +9,15 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext 
 from typing import Optional, Union
 from app.modules.child import Child  
+from app.modules.child_cache import child_profile_cache
+from app.modules.moderation_policy import moderation_policy
+from app.modules.chatbot import conversation_memory
+from app.modules.chatbot_quota import chatbot_quota
+from app.modules.friend_graph import delete_friend_edges_for
+from app.modules.friend_suggestions import forget_children
+from app.modules.social_graph import social_graph
+from app.modules.user_search import user_search_index
+from app.modules.notification_feed import DEFAULT_PAGE_SIZE, fetch_notifications
 
 # --------------------- base models -----------------------
 class FriendResponse(BaseModel):
@@ -91,6 +100,7 @@ def create_child(child_data: Child) -> FriendResponse:
             }
         )
         conn.commit()
+    user_search_index.refresh([child_data.childUserName])
     
     return FriendResponse(
         message="Child registered successfully!",
@@ -153,33 +163,44 @@ def update_parent_settings(parentUserName: str, settings: dict):
 #---------------------------------------------------------------------
 def delete_parent_account(parentUserName: str):
     with get_connection() as conn:
+        children = conn.execute(
+            sa.text("SELECT childUserName FROM Child WHERE parentUserName = :parentUserName"),
+            {"parentUserName": parentUserName}
+        ).scalars().all()
+        for table in ("ChatbotMemory", "ChatbotLimit", "ChatbotUsage"):
+            conn.execute(
+                sa.text(f"""
+                    DELETE FROM {table}
+                    WHERE childUserName IN (SELECT childUserName FROM Child WHERE parentUserName = :parentUserName)
+                """),
+                {"parentUserName": parentUserName}
+            )
+        forget_children(conn, children)
+        delete_friend_edges_for(conn, children)
+        conn.execute(sa.text("DELETE FROM ParentSuggestionSetting WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
+        conn.execute(sa.text("DELETE FROM ModerationPolicyOverride WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
+        conn.execute(sa.text("DELETE FROM ParentUnreadCounter WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
+        conn.execute(sa.text("DELETE FROM ParentRetention WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
+        conn.execute(sa.text("DELETE FROM NotificationArchive WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
+        conn.execute(sa.text("DELETE FROM NotificationDigestPreference WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
+        conn.execute(sa.text("DELETE FROM NotificationDigest WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
         conn.execute(sa.text("DELETE FROM Child WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
         conn.execute(sa.text("DELETE FROM Parent WHERE parentUserName = :parentUserName"), {"parentUserName": parentUserName})
         conn.commit()
+    child_profile_cache.invalidate_parent(parentUserName)
+    moderation_policy.forget_parent(parentUserName)
+    social_graph.forget(children)
+    user_search_index.remove(children)
+    for childUserName in children:
+        conversation_memory.forget(childUserName)
+        chatbot_quota.forget(childUserName)
     return {"message": "Parent account and associated children deleted successfully"}
 #---------------------------------------------------------------------
-def get_notifications(parentUserName: str):
-    with get_connection() as conn:
-        query = sa.text("""
-            SELECT 
-                n.notificationID,
-                n.firebaseMessageID,
-                n.content,
-                n.originalContent,
-                n.timeStamp,
-                n.senderChildUserName AS sender,
-                n.receiverChildUserName AS receiver,
-                c.firstName AS receiverFirstName,
-                c.lastName AS receiverLastName,
-                n.riskType,
-                n.isRead
-            FROM Notification n
-            JOIN Child c ON n.receiverChildUserName = c.childUserName
-            WHERE n.parentUserName = :parentUserName
-            ORDER BY n.timeStamp DESC
-        """)
-        results = conn.execute(query, {"parentUserName": parentUserName}).mappings().fetchall()
-    return [dict(row) for row in results] if results else []
+def get_notifications(parentUserName: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                      childUserName: Optional[str] = None, riskType: Optional[str] = None,
+                      unreadOnly: bool = False):
+    notifications, _ = fetch_notifications(parentUserName, limit, cursor, childUserName, riskType, unreadOnly)
+    return notifications
 
 #---------------------------- child time usage functions -------------------------------------
 def get_child_usage_status(parentUserName: str, childUserName: str) -> dict:
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# JSON file of {"name": "prompt text"} overriding the built-in prompts; re-read when it changes
+CHATBOT_PROMPTS_PATH = os.getenv("CHATBOT_PROMPTS_PATH")
+CHATBOT_PROMPTS_RELOAD_SECONDS = float(os.getenv("CHATBOT_PROMPTS_RELOAD_SECONDS", "30"))
+
+DEFAULT_AGE_GROUP = "early_elementary"
+
+# One system prompt per age group, plus the conversation summary prompt
+DEFAULT_PROMPTS = {
+    "preschool": """أنت مساعد ودود للأطفال في مرحلة ما قبل المدرسة. استخدم لغة بسيطة وجمل قصيرة.
+            كن مرحاً واستخدم أمثلة من عالمهم الصغير. تجنب الكلمات المعقدة.""",
+
+    "early_elementary": """أنت مساعد صديق للأطفال في المرحلة الابتدائية المبكرة. استخدم لغة واضحة وبسيطة.
+            قدم أمثلة من حياتهم اليومية. كن مشجعاً وداعماً.""",
+
+    "late_elementary": """أنت مرشد للأطفال في المرحلة الابتدائية المتأخرة. استخدم لغة واضحة مع بعض المفاهيم المتقدمة.
+            قدم أمثلة عملية وشجع التفكير النقدي.""",
+
+    "early_teen": """أنت مرشد للأطفال في بداية مرحلة المراهقة. استخدم لغة مناسبة لعمرهم مع تقديم مفاهيم أكثر تعقيداً.
+            شجع الاستقلالية والتفكير النقدي.""",
+
+    "teen": """أنت مرشد للمراهقين. استخدم لغة ناضجة ومناسبة لعمرهم.
+            شجع التفكير المستقل واتخاذ القرارات المسؤولة.""",
+
+    "summary": """لخّص المحادثة التالية بين طفل ومساعد في جمل قصيرة، مع الاحتفاظ بالمواضيع والأسماء والتفاصيل التي قد يحتاجها المساعد لاحقاً.
+ادمج الملخص السابق مع المحادثة الجديدة في ملخص واحد. أجب بالملخص فقط.""",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate; Arabic text averages roughly three characters per token"""
+    return max(1, len(text) // 3) if text else 0
+
+
+class PromptTemplate:
+    """A prepared system prompt: cleaned text, its ready-made message and its token estimate"""
+
+    def __init__(self, name: str, text: str):
+        # Indentation inside the source strings is only noise for the model
+        self.name = name
+        self.text = "\n".join(line.strip() for line in text.strip().splitlines())
+        self.tokens = estimate_tokens(self.text)
+        self.message = {"role": "system", "content": self.text}
+
+
+class PromptSet:
+    """Immutable set of templates built from one version of the prompt config"""
+
+    def __init__(self, prompts: Dict[str, str], version: int):
+        missing = set(DEFAULT_PROMPTS) - set(prompts)
+        if missing:
+            raise ValueError(f"Missing prompts: {', '.join(sorted(missing))}")
+        self.templates = {name: PromptTemplate(name, text) for name, text in prompts.items()}
+        self.version = version
+        self.checksum = hashlib.sha256(
+            json.dumps(prompts, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:12]
+
+
+class PromptRegistry:
+    """Chatbot prompts prepared once and swapped atomically when operators change them"""
+
+    def __init__(self):
+        self._prompts = PromptSet(DEFAULT_PROMPTS, version=1)
+        self._lock = threading.Lock()
+        self._file_mtime: Optional[float] = None
+        self._reload_task: Optional[asyncio.Task] = None
+
+    # ---------------------- lookups ----------------------
+    def template(self, name: str) -> PromptTemplate:
+        templates = self._prompts.templates
+        return templates.get(name) or templates[DEFAULT_AGE_GROUP]
+
+    def build_messages(self, age_group: str, history: List[dict], question: str) -> List[dict]:
+        """Message array for a chatbot request: system prompt, conversation memory, then the question"""
+        return [self.template(age_group).message, *history, {"role": "user", "content": question}]
+
+    def estimate_request_tokens(self, age_group: str, history: List[dict], question: str) -> int:
+        """Token estimate of build_messages() without re-measuring the system prompt"""
+        return (
+            self.template(age_group).tokens
+            + sum(estimate_tokens(message["content"]) for message in history)
+            + estimate_tokens(question)
+        )
+
+    @property
+    def version(self) -> int:
+        return self._prompts.version
+
+    def describe(self) -> dict:
+        prompts = self._prompts
+        return {
+            "version": prompts.version,
+            "checksum": prompts.checksum,
+            "tokens": {name: template.tokens for name, template in prompts.templates.items()},
+        }
+
+    # ---------------------- updates ----------------------
+    def update(self, prompts: Dict[str, str]) -> int:
+        """Replace prompts by name, keeping the others; returns the new version"""
+        with self._lock:
+            current = {name: template.text for name, template in self._prompts.templates.items()}
+            current.update(prompts)
+            self._prompts = PromptSet(current, self._prompts.version + 1)
+            return self._prompts.version
+
+    def reload(self):
+        """Apply CHATBOT_PROMPTS_PATH if it changed since the last load; a bad file keeps the current prompts"""
+        if not CHATBOT_PROMPTS_PATH:
+            return
+        try:
+            mtime = os.path.getmtime(CHATBOT_PROMPTS_PATH)
+            if mtime == self._file_mtime:
+                return
+            with open(CHATBOT_PROMPTS_PATH, encoding="utf-8") as f:
+                prompts = {str(name): str(text) for name, text in json.load(f).items()}
+            version = self.update(prompts)
+            self._file_mtime = mtime
+            print(f"Loaded chatbot prompts version {version}")
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Error loading chatbot prompts, keeping the current ones: {str(e)}")
+
+    async def _reload_periodically(self):
+        while True:
+            await asyncio.sleep(CHATBOT_PROMPTS_RELOAD_SECONDS)
+            await asyncio.to_thread(self.reload)
+
+    def start(self):
+        """Load prompt overrides and watch the file for changes (called at app startup)"""
+        self.reload()
+        self._reload_task = asyncio.create_task(self._reload_periodically())
+
+    async def stop(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            await asyncio.gather(self._reload_task, return_exceptions=True)
+            self._reload_task = None
+
+
+prompt_registry = PromptRegistry()
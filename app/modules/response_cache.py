@@ -0,0 +1,152 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from app.modules.moderation_lexicon import classify_with_lexicon
+from app.modules.text_normalization import normalize_text
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+CHATBOT_CACHE_TTL_SECONDS = float(os.getenv("CHATBOT_CACHE_TTL_SECONDS", "86400"))
+CHATBOT_CACHE_MAX_ENTRIES = int(os.getenv("CHATBOT_CACHE_MAX_ENTRIES", "5000"))
+# Near-duplicate matching with MinHash, off by default. A near match must still use exactly
+# the same words (only order and repetition may differ), so "7 × 8" never answers "7 × 9"
+CHATBOT_CACHE_NEAR_DUPLICATES = os.getenv("CHATBOT_CACHE_NEAR_DUPLICATES", "false").lower() == "true"
+CHATBOT_CACHE_SIMILARITY = float(os.getenv("CHATBOT_CACHE_SIMILARITY", "0.8"))
+
+MINHASH_PERMUTATIONS = 32
+MINHASH_BANDS = 8
+SHINGLE_SIZE = 3
+
+
+def _shingles(text: str) -> Set[str]:
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def _minhash(text: str) -> Tuple[int, ...]:
+    """Signature whose matching slots estimate the Jaccard similarity of character shingles"""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in _shingles(text)]
+    return tuple(
+        min((h ^ (seed * 0x9E3779B97F4A7C15)) & 0xFFFFFFFFFFFFFFFF for h in hashes)
+        for seed in range(1, MINHASH_PERMUTATIONS + 1)
+    )
+
+
+class ResponseCache:
+    """Chatbot answers keyed by (age_group, normalized question) with optional near-duplicate lookup.
+
+    Entries expire after ttl_seconds and the least recently used are evicted beyond
+    max_entries. Answers that trip the moderation lexicon are never stored.
+    """
+
+    def __init__(self, ttl_seconds: float = CHATBOT_CACHE_TTL_SECONDS, max_entries: int = CHATBOT_CACHE_MAX_ENTRIES,
+                 near_duplicates: bool = CHATBOT_CACHE_NEAR_DUPLICATES, similarity: float = CHATBOT_CACHE_SIMILARITY):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.near_duplicates = near_duplicates
+        self.similarity = similarity
+        # key -> (expires_at, answer, signature, words)
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        # (age_group, band index, band hash) -> keys sharing that band
+        self._bands: Dict[Tuple[str, int, int], Set[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "stored": 0, "rejected_unsafe": 0, "evicted": 0}
+
+    def _band_keys(self, age_group: str, signature: Tuple[int, ...]) -> List[Tuple[str, int, int]]:
+        rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+        return [(age_group, band, hash(signature[band * rows:(band + 1) * rows])) for band in range(MINHASH_BANDS)]
+
+    def _remove(self, key: Tuple[str, str]):
+        _, _, signature, _ = self._entries.pop(key)
+        if signature is not None:
+            for band_key in self._band_keys(key[0], signature):
+                keys = self._bands.get(band_key)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._bands[band_key]
+
+    def _live_entry(self, key: Tuple[str, str]) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, age_group: str, question: str) -> Optional[str]:
+        normalized = normalize_text(question)
+        key = (age_group, normalized)
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry[1]
+
+            if self.near_duplicates and normalized:
+                signature = _minhash(normalized)
+                words = frozenset(normalized.split())
+                candidates = set()
+                for band_key in self._band_keys(age_group, signature):
+                    candidates |= self._bands.get(band_key, set())
+                best, best_score = None, self.similarity
+                for candidate in candidates:
+                    candidate_entry = self._live_entry(candidate)
+                    # Shingles barely change with one digit or word, so those must match exactly
+                    if candidate_entry is None or candidate_entry[3] != words:
+                        continue
+                    score = sum(a == b for a, b in zip(signature, candidate_entry[2])) / MINHASH_PERMUTATIONS
+                    if score >= best_score:
+                        best, best_score = candidate_entry[1], score
+                if best is not None:
+                    self.stats["near_hits"] += 1
+                    return best
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, age_group: str, question: str, answer: str) -> bool:
+        """Store an answer unless it fails moderation; returns whether it was stored"""
+        if classify_with_lexicon(answer)[0] > 0 or classify_with_lexicon(question)[0] > 0:
+            self.stats["rejected_unsafe"] += 1
+            return False
+
+        normalized = normalize_text(question)
+        key = (age_group, normalized)
+        signature = _minhash(normalized) if self.near_duplicates and normalized else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, answer, signature, frozenset(normalized.split()))
+            if signature is not None:
+                for band_key in self._band_keys(age_group, signature):
+                    self._bands.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats["evicted"] += 1
+            self.stats["stored"] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["near_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": round((self.stats["hits"] + self.stats["near_hits"]) / lookups, 3) if lookups else None,
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set
+import sqlalchemy as sa
+from app.database import get_connection
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+SOCIAL_GRAPH_TTL_SECONDS = float(os.getenv("SOCIAL_GRAPH_TTL_SECONDS", "300"))
+SOCIAL_GRAPH_MAX_USERS = int(os.getenv("SOCIAL_GRAPH_MAX_USERS", "20000"))
+# Reject messages between children who are not active friends before they reach moderation.
+# Reads FriendEdge, which app startup backfills from Friendship on first run
+# (app/modules/data_migrations.py).
+MESSAGE_REQUIRE_FRIENDSHIP = os.getenv("MESSAGE_REQUIRE_FRIENDSHIP", "false").lower() == "true"
+
+
+class Adjacency:
+    """Active and blocked neighbours of one child"""
+
+    __slots__ = ("expires_at", "friends", "blocked")
+
+    def __init__(self, expires_at: float, friends: frozenset, blocked: frozenset):
+        self.expires_at = expires_at
+        self.friends = friends
+        self.blocked = blocked
+
+
+class SocialGraphCache:
+    """LRU cache over children of their FriendEdge neighbourhoods.
+
+    A child's adjacency is loaded with one index range scan on first use, and
+    adjacencies() loads any number of children with one query; afterwards are_friends
+    and is_blocked are set lookups. Entries are dropped by the friendship writers in
+    this process and expire after a TTL to pick up other workers' writes.
+    """
+
+    def __init__(self, ttl_seconds: float = SOCIAL_GRAPH_TTL_SECONDS, max_users: int = SOCIAL_GRAPH_MAX_USERS):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, Adjacency]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a load that raced with a write is not stored
+        self._generation = 0
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _load(self, usernames: List[str]) -> Dict[str, Adjacency]:
+        with get_connection() as conn:
+            rows = conn.execute(
+                sa.text("""
+                    SELECT childUserName, friendUserName, status
+                    FROM FriendEdge
+                    WHERE childUserName IN :usernames
+                """).bindparams(sa.bindparam("usernames", expanding=True)),
+                {"usernames": usernames}
+            ).mappings().all()
+        friends = {username: set() for username in usernames}
+        blocked = {username: set() for username in usernames}
+        for row in rows:
+            if row["status"] == "Active":
+                friends[row["childUserName"]].add(row["friendUserName"])
+            elif row["status"] == "Blocked":
+                blocked[row["childUserName"]].add(row["friendUserName"])
+        expires_at = time.monotonic() + self.ttl_seconds
+        return {
+            username: Adjacency(expires_at, frozenset(friends[username]), frozenset(blocked[username]))
+            for username in usernames
+        }
+
+    def adjacencies(self, usernames: Iterable[str]) -> Dict[str, Adjacency]:
+        """Adjacency of several children; the ones not cached are loaded with a single query"""
+        found = {}
+        with self._lock:
+            now = time.monotonic()
+            for username in set(usernames):
+                entry = self._entries.get(username)
+                if entry is not None and entry.expires_at >= now:
+                    self._entries.move_to_end(username)
+                    found[username] = entry
+            missing = [username for username in set(usernames) if username not in found]
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(missing)
+            generation = self._generation
+        if not missing:
+            return found
+
+        loaded = self._load(missing)
+        with self._lock:
+            if generation == self._generation:
+                for username, entry in loaded.items():
+                    self._entries[username] = entry
+                    self._entries.move_to_end(username)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        found.update(loaded)
+        return found
+
+    def adjacency(self, username: str) -> Adjacency:
+        return self.adjacencies([username])[username]
+
+    # ---------------------- queries ----------------------
+    def friends(self, username: str) -> frozenset:
+        return self.adjacency(username).friends
+
+    def are_friends(self, child1: str, child2: str) -> bool:
+        return child2 in self.adjacency(child1).friends
+
+    def is_blocked(self, child1: str, child2: str) -> bool:
+        """Whether the friendship between the two children has been blocked by either side"""
+        return child2 in self.adjacency(child1).blocked
+
+    def friends_of_friends(self, username: str) -> Set[str]:
+        """Children two steps away who are not friends yet; at most two queries when nothing is cached"""
+        friends = self.friends(username)
+        nearby = set()
+        for adjacency in self.adjacencies(friends).values():
+            nearby |= adjacency.friends
+        nearby -= friends
+        nearby.discard(username)
+        return nearby
+
+    # ---------------------- invalidation ----------------------
+    def invalidate(self, *usernames: str):
+        with self._lock:
+            self._generation += 1
+            for username in usernames:
+                self._entries.pop(username, None)
+
+    def forget(self, usernames: Iterable[str]):
+        """Drop deleted children and every cached neighbourhood that still mentions them"""
+        usernames = set(usernames)
+        if not usernames:
+            return
+        with self._lock:
+            self._generation += 1
+            stale = [
+                username for username, entry in self._entries.items()
+                if username in usernames or not usernames.isdisjoint(entry.friends)
+                or not usernames.isdisjoint(entry.blocked)
+            ]
+            for username in stale:
+                del self._entries[username]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, "users": len(self._entries)}
+
+
+social_graph = SocialGraphCache()
@@ -0,0 +1,14 @@
+import re
+import unicodedata
+
+_ARABIC_DIACRITICS = re.compile(r"[\u064B-\u0652\u0670\u0640]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_text(text: str) -> str:
+    """Fold case, Arabic diacritics, letter variants and punctuation so trivial spelling differences compare equal"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _ARABIC_DIACRITICS.sub("", text)
+    text = re.sub("[إأآ]", "ا", text).replace("ى", "ي").replace("ة", "ه")
+    text = _PUNCTUATION.sub(" ", text)
+    return " ".join(text.split())
@@ -0,0 +1,354 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import sqlalchemy as sa
+from app.database import get_connection
+from app.modules.social_graph import social_graph
+from app.modules.text_normalization import normalize_text
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# ------------------- constants --------------------
+# Full rebuilds pick up children created or renamed through other workers
+USER_SEARCH_REBUILD_SECONDS = float(os.getenv("USER_SEARCH_REBUILD_SECONDS", "600"))
+USER_SEARCH_LIMIT = int(os.getenv("USER_SEARCH_LIMIT", "10"))
+# Shorter queries (after normalization) return nothing instead of most of the index
+USER_SEARCH_MIN_QUERY_LENGTH = int(os.getenv("USER_SEARCH_MIN_QUERY_LENGTH", "2"))
+# Match sets of recent queries are kept briefly so the next keystroke only filters them
+USER_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("USER_SEARCH_CACHE_TTL_SECONDS", "30"))
+USER_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("USER_SEARCH_CACHE_MAX_ENTRIES", "2000"))
+# Queries matching more children than this are not cached; the next keystroke narrows them anyway
+USER_SEARCH_CACHE_MAX_MATCHES = int(os.getenv("USER_SEARCH_CACHE_MAX_MATCHES", "500"))
+
+# Grams of every length up to this are indexed, so one- and two-letter queries also hit postings
+GRAM_SIZE = 3
+
+# Match quality, best first
+MATCH_EXACT, MATCH_USERNAME_PREFIX, MATCH_NAME_PREFIX, MATCH_INFIX = range(4)
+
+
+def normalize_name(text: Optional[str]) -> str:
+    """Arabic and case folding shared by indexed names and queries"""
+    return normalize_text(text or "")
+
+def result_etag(rows: List[dict]) -> str:
+    """Weak validator of a result page, for If-None-Match on repeated searches"""
+    payload = json.dumps(rows, ensure_ascii=False, sort_keys=True, default=str)
+    return 'W/"' + hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest() + '"'
+
+def _grams(term: str) -> Set[str]:
+    return {term[i:i + n] for n in range(1, GRAM_SIZE + 1) for i in range(len(term) - n + 1)}
+
+
+class IndexedChild:
+    """A searchable child: the row returned to clients and its normalized terms"""
+
+    __slots__ = ("row", "key", "username", "names")
+
+    def __init__(self, row: dict):
+        self.row = row
+        self.key = row["childUserName"]
+        self.username = normalize_name(row["childUserName"])
+        words = f"{normalize_name(row['firstName'])} {normalize_name(row['lastName'])}".split()
+        # Each name on its own and the full name, so "سارة الع" matches too
+        self.names = tuple(dict.fromkeys([*words, " ".join(words)]))
+
+    def terms(self) -> Tuple[str, ...]:
+        return (self.username, *self.names)
+
+    def grams(self) -> Set[str]:
+        grams = set()
+        for term in self.terms():
+            grams |= _grams(term)
+        return grams
+
+    def match(self, query: str) -> Optional[int]:
+        if self.username == query:
+            return MATCH_EXACT
+        if self.username.startswith(query):
+            return MATCH_USERNAME_PREFIX
+        if any(name.startswith(query) for name in self.names):
+            return MATCH_NAME_PREFIX
+        if any(query in term for term in self.terms()):
+            return MATCH_INFIX
+        return None
+
+
+class SearchData:
+    """The index structures: sorted terms for prefix ranges and gram postings for infix matches"""
+
+    def __init__(self):
+        self.children: Dict[str, IndexedChild] = {}
+        self.usernames: List[Tuple[str, str]] = []
+        self.names: List[Tuple[str, str]] = []
+        self.postings: Dict[str, Set[str]] = {}
+
+    @classmethod
+    def build(cls, children: List[IndexedChild]) -> "SearchData":
+        data = cls()
+        for child in children:
+            data.children[child.key] = child
+            data.usernames.append((child.username, child.key))
+            data.names.extend((name, child.key) for name in child.names)
+            for gram in child.grams():
+                data.postings.setdefault(gram, set()).add(child.key)
+        data.usernames.sort()
+        data.names.sort()
+        return data
+
+    def add(self, child: IndexedChild):
+        self.children[child.key] = child
+        bisect.insort(self.usernames, (child.username, child.key))
+        for name in child.names:
+            bisect.insort(self.names, (name, child.key))
+        for gram in child.grams():
+            self.postings.setdefault(gram, set()).add(child.key)
+
+    def remove(self, key: str):
+        child = self.children.pop(key, None)
+        if child is None:
+            return
+        _discard_sorted(self.usernames, (child.username, key))
+        for name in child.names:
+            _discard_sorted(self.names, (name, key))
+        for gram in child.grams():
+            postings = self.postings.get(gram)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self.postings[gram]
+
+    @staticmethod
+    def prefixed(terms: List[Tuple[str, str]], query: str) -> Iterator[str]:
+        """Keys whose term starts with query, in term order"""
+        for position in range(bisect.bisect_left(terms, (query,)), len(terms)):
+            term, key = terms[position]
+            if not term.startswith(query):
+                return
+            yield key
+
+    def infix(self, query: str) -> Iterator[str]:
+        grams = {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)} or {query}
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        if len(query) <= GRAM_SIZE:
+            # The posting of the query itself is exact
+            return iter(postings[0])
+        return (
+            key for key in postings[0]
+            if all(key in posting for posting in postings[1:])
+            and any(query in term for term in self.children[key].terms())
+        )
+
+
+def _discard_sorted(terms: List[Tuple[str, str]], item: Tuple[str, str]):
+    position = bisect.bisect_left(terms, item)
+    if position < len(terms) and terms[position] == item:
+        del terms[position]
+
+
+class UserSearchIndex:
+    """In-memory search over child usernames and names.
+
+    Prefix matches come from bisecting sorted term lists and infix matches from
+    postings of every 1-3 character gram, so a query never scans Child the way
+    LIKE '%q%' does. Results are ranked in tiers (friends of friends, exact username,
+    username prefix, name prefix, infix) and each tier stops as soon as the page is
+    full. Built lazily, kept current by the child writers in this process, and
+    rebuilt periodically.
+    """
+
+    def __init__(self, limit: int = USER_SEARCH_LIMIT):
+        self.limit = limit
+        self._data: Optional[SearchData] = None
+        self._lock = threading.Lock()
+        self._rebuild_task: Optional[asyncio.Task] = None
+        # Complete ranked matches keyed by normalized query; cleared whenever the index changes
+        self._matches: "OrderedDict[str, Tuple[float, Optional[Tuple[str, ...]]]]" = OrderedDict()
+        self.stats = {"searches": 0, "rebuilds": 0, "refined": 0, "too_short": 0}
+
+    # ---------------------- building ----------------------
+    def rebuild(self):
+        """Index every child with a single scan of Child; searches keep using the old index meanwhile"""
+        with get_connection() as conn:
+            rows = conn.execute(
+                sa.text("SELECT childUserName, firstName, lastName, profileIcon FROM Child")
+            ).mappings().all()
+        data = SearchData.build([IndexedChild(dict(row)) for row in rows])
+        with self._lock:
+            self._data = data
+            self._matches.clear()
+            self.stats["rebuilds"] += 1
+
+    def _ensure_built(self):
+        if self._data is None:
+            self.rebuild()
+
+    def refresh(self, usernames: Iterable[str]):
+        """Re-index children after they are created or their names change"""
+        usernames = list(usernames)
+        if not usernames or self._data is None:
+            return
+        with get_connection() as conn:
+            rows = conn.execute(
+                sa.text("""
+                    SELECT childUserName, firstName, lastName, profileIcon
+                    FROM Child
+                    WHERE childUserName IN :usernames
+                """).bindparams(sa.bindparam("usernames", expanding=True)),
+                {"usernames": usernames}
+            ).mappings().all()
+        with self._lock:
+            for username in usernames:
+                self._data.remove(username)
+            for row in rows:
+                self._data.add(IndexedChild(dict(row)))
+            self._matches.clear()
+
+    def remove(self, usernames: Iterable[str]):
+        if self._data is None:
+            return
+        with self._lock:
+            for username in usernames:
+                self._data.remove(username)
+            self._matches.clear()
+
+    # ---------------------- searching ----------------------
+    def _friends_of_friends(self, username: str) -> Set[str]:
+        return social_graph.friends_of_friends(username)
+
+    def _cached_matches(self, data: SearchData, query: str) -> Tuple[bool, Optional[Tuple[str, ...]]]:
+        """(found, every child matching query in rank order), refined from the cached matches of its longest cached prefix.
+
+        Anything containing query also contains each of its prefixes, so the next
+        keystroke only has to filter and re-rank the previous keystroke's matches.
+        A cached None marks a query with too many matches to keep.
+        """
+        now = time.monotonic()
+        for length in range(len(query), 0, -1):
+            prefix = query[:length]
+            entry = self._matches.get(prefix)
+            if entry is None:
+                continue
+            if entry[0] < now:
+                del self._matches[prefix]
+                continue
+            self._matches.move_to_end(prefix)
+            if length == len(query):
+                return True, entry[1]
+            if entry[1] is None:
+                break
+            matches = self._rank(data, query, (
+                key for key in entry[1]
+                if any(query in term for term in data.children[key].terms())
+            ))
+            self._store_matches(query, matches)
+            self.stats["refined"] += 1
+            return True, matches
+        return False, None
+
+    @staticmethod
+    def _rank(data: SearchData, query: str, keys: Iterable[str]) -> Tuple[str, ...]:
+        return tuple(key for *_, key in sorted(
+            (child.match(query), child.username, key)
+            for key, child in ((key, data.children[key]) for key in keys)
+        ))
+
+    def _store_matches(self, query: str, matches: Optional[Tuple[str, ...]]):
+        self._matches[query] = (time.monotonic() + USER_SEARCH_CACHE_TTL_SECONDS, matches)
+        self._matches.move_to_end(query)
+        while len(self._matches) > USER_SEARCH_CACHE_MAX_ENTRIES:
+            self._matches.popitem(last=False)
+
+    def search(self, query: str, current_username: str) -> List[dict]:
+        """Best matches for query, friends of friends first, then by match quality"""
+        query = normalize_name(query)
+        if len(query) < USER_SEARCH_MIN_QUERY_LENGTH:
+            self.stats["too_short"] += 1
+            return []
+        self._ensure_built()
+        nearby = self._friends_of_friends(current_username)
+
+        with self._lock:
+            self.stats["searches"] += 1
+            data = self._data
+            cached, matches = self._cached_matches(data, query)
+            if not cached:
+                found = list(islice(data.infix(query), USER_SEARCH_CACHE_MAX_MATCHES + 1))
+                if len(found) <= USER_SEARCH_CACHE_MAX_MATCHES:
+                    matches = self._rank(data, query, found)
+                self._store_matches(query, matches)
+
+            if matches is not None:
+                # Already in rank order; friends of friends move to the front
+                keys = [key for key in matches if key in nearby][:self.limit]
+                keys += islice((key for key in matches if key not in nearby and key != current_username),
+                               self.limit - len(keys))
+                return [dict(data.children[key].row) for key in keys]
+
+            results: Dict[str, IndexedChild] = {}
+
+            def take(keys: Iterable[str]):
+                for key in keys:
+                    if len(results) >= self.limit:
+                        return
+                    if key != current_username and key not in results:
+                        results[key] = data.children[key]
+
+            nearby_matches = [
+                (quality, child.username, child.key)
+                for child in (data.children[key] for key in nearby if key in data.children)
+                for quality in [child.match(query)] if quality is not None
+            ]
+            take(key for _, _, key in sorted(nearby_matches))
+            # An exact username sorts first in its prefix range
+            take(data.prefixed(data.usernames, query))
+            take(data.prefixed(data.names, query))
+            infix_start = len(results)
+            take(data.infix(query))
+        rows = [dict(child.row) for child in results.values()]
+        # Infix matches come out of a set; order the few that were kept
+        rows[infix_start:] = sorted(rows[infix_start:], key=lambda row: row["childUserName"])
+        return rows
+
+    # ---------------------- background rebuild ----------------------
+    async def _rebuild_periodically(self):
+        while True:
+            await asyncio.sleep(USER_SEARCH_REBUILD_SECONDS)
+            try:
+                started = time.monotonic()
+                await asyncio.to_thread(self.rebuild)
+                print(f"User search index rebuilt in {time.monotonic() - started:.2f}s")
+            except Exception as e:
+                print(f"Error rebuilding user search index: {str(e)}")
+
+    def start(self):
+        """Refresh the index in the background (called at app startup); the first search builds it"""
+        self._rebuild_task = asyncio.create_task(self._rebuild_periodically())
+
+    async def stop(self):
+        if self._rebuild_task is not None:
+            self._rebuild_task.cancel()
+            await asyncio.gather(self._rebuild_task, return_exceptions=True)
+            self._rebuild_task = None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            data = self._data
+            return {
+                **self.stats,
+                "children": len(data.children) if data else 0,
+                "grams": len(data.postings) if data else 0,
+                "cached_queries": len(self._matches),
+            }
+
+
+user_search_index = UserSearchIndex()
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
 from app.modules.chatbot import Chatbot 
+from app.modules.chatbot_quota import chatbot_quota
 import asyncio
+import json
 
 router = APIRouter()
 
@@ -15,5 +18,38 @@ async def ask_chatbot(request: Request):
     if not message or not child_username:
         return {"error": "الرجاء إرسال الرسالة واسم المستخدم"}
 
+    # Rejected here, before any LLM work; a child new to this worker costs one cached profile lookup
+    await asyncio.to_thread(chatbot_quota.check, child_username)
+
     response = await chatbot.get_response(child_username, message)
     return {"response": response}
+
+@router.post("/chatbot/ask/stream")
+async def ask_chatbot_stream(request: Request):
+    """Relay the chatbot answer token by token as Server-Sent Events"""
+    body = await request.json()
+    message = body.get("message")
+    child_username = body.get("childUsername")
+
+    if not message or not child_username:
+        return {"error": "الرجاء إرسال الرسالة واسم المستخدم"}
+
+    # Rejected here, before any LLM work; a child new to this worker costs one cached profile lookup
+    await asyncio.to_thread(chatbot_quota.check, child_username)
+
+    async def event_stream():
+        events = chatbot.stream_response(child_username, message)
+        try:
+            async for event, text in events:
+                # Stop generating as soon as the child leaves the conversation
+                if await request.is_disconnected():
+                    break
+                yield f"event: {event}\ndata: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
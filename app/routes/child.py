@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta, datetime
 from app.modules import child as child_module
-from pydantic import BaseModel
+from app.modules import friend_suggestions
+from app.modules.user_search import USER_SEARCH_CACHE_TTL_SECONDS, result_etag
+from pydantic import BaseModel, Field
 from typing import Optional
 from typing import List, Optional
 
@@ -11,6 +13,9 @@ router = APIRouter()
 # ----------------------------------------------
 class FriendRequestIn(BaseModel):
     receiverChildUserName: str
+
+class FriendRequestBatch(BaseModel):
+    requestIDs: List[int] = Field(..., min_length=1, max_length=child_module.MAX_BATCH_FRIEND_REQUESTS)
     
 class FriendRequestOut(BaseModel):
     requestID: int
@@ -92,11 +97,19 @@ def get_usage_status(current_user: dict = Depends(child_module.getCurrentUser)):
 #----------------------- search friends ------------------------
 @router.get("/child/search")
 def search_users(
-    q: str = Query(..., description="Search query for child usernames"),
+    request: Request,
+    response: Response,
+    q: str = Query(..., description="Search query for child usernames and names"),
     current_user: dict = Depends(child_module.getCurrentUser)
 ):
-    """Search for other children to add as friends"""
-    return child_module.search_users(q, current_user['childUserName'])
+    """Search for other children to add as friends; repeated searches can revalidate with If-None-Match"""
+    result = child_module.search_users(q, current_user['childUserName'])
+    etag = result_etag(result.data)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(USER_SEARCH_CACHE_TTL_SECONDS)}"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return result
 
 
     
@@ -137,6 +150,25 @@ def view_friend_requests(
         print(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# -------------------------- accept / reject many requests ------------------------------------
+# Declared before the {request_id} routes so "batch" is not parsed as a request ID
+
+@router.post("/child/friend/accept/batch")
+def accept_friend_requests(
+    data: FriendRequestBatch,
+    current_user: dict = Depends(child_module.getCurrentUser)
+):
+    """Accept several pending friend requests at once; returns the outcome of each ID"""
+    return child_module.accept_friend_requests(data.requestIDs, current_user['childUserName'])
+
+@router.post("/child/friend/reject/batch")
+def reject_friend_requests(
+    data: FriendRequestBatch,
+    current_user: dict = Depends(child_module.getCurrentUser)
+):
+    """Reject several pending friend requests at once; returns the outcome of each ID"""
+    return child_module.reject_friend_requests(data.requestIDs, current_user['childUserName'])
+
 # -------------------------- accept request upon request ID provided ------------------------------------
 
 @router.post("/child/friend/accept/{request_id}")
@@ -171,6 +203,19 @@ def get_friends(
     """Get list of all friends"""
     return child_module.get_friends(current_user['childUserName'])
 
+# -------------------------- friend suggestions ------------------------------------
+
+@router.get("/child/friends/suggestions")
+def get_friend_suggestions(
+    limit: int = Query(friend_suggestions.FRIEND_SUGGESTIONS_DEFAULT_LIMIT, ge=1, le=friend_suggestions.FRIEND_SUGGESTIONS_MAX_LIMIT),
+    current_user: dict = Depends(child_module.getCurrentUser)
+):
+    """People you may know: friends of friends ranked by mutual friends"""
+    return child_module.FriendResponse(
+        message="Friend suggestions retrieved successfully",
+        data=friend_suggestions.get_suggestions(current_user['childUserName'], limit)
+    )
+
 # -------------------------- block friends ------------------------------------
 
 @router.post("/child/friend/block/{friendUserName}")
@@ -1,11 +1,18 @@
-from fastapi import APIRouter
+import asyncio
+from fastapi import APIRouter, HTTPException
 from app.modules import message as message_module
-from app.modules.message_filter import MessageFilter, FilteredMessage
+from app.modules import notification_queue
+from app.modules.moderation_batcher import ModerationOverloadedError
+from app.modules.social_graph import MESSAGE_REQUIRE_FRIENDSHIP, social_graph
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List
 
 router = APIRouter()
-message_filter = MessageFilter()
+message_filter = message_module.message_filter
+
+# Upper bound on messages accepted by /message/send/batch
+MAX_BATCH_MESSAGES = 50
 
 # Dummy input model 
 class TestMessageInput(BaseModel):
@@ -19,35 +26,49 @@ class MessageInput(BaseModel):
     receiverChildUserName: str
     content: str
 
+class BatchMessageInput(BaseModel):
+    messages: List[MessageInput]
+
+async def ensure_friends(pairs):
+    """Reject messages between children who are not active friends, before any moderation work"""
+    if not MESSAGE_REQUIRE_FRIENDSHIP:
+        return
+    # A cache miss reads FriendEdge, which must not block the event loop
+    strangers = await asyncio.to_thread(
+        lambda: [(sender, receiver) for sender, receiver in pairs if not social_graph.are_friends(sender, receiver)]
+    )
+    if strangers:
+        sender, receiver = strangers[0]
+        raise HTTPException(status_code=403, detail=f"{sender} and {receiver} are not friends")
+
 @router.post("/message/send")
-async def send_message(data: MessageInput):
+async def send_message(data: MessageInput, async_notify: bool = notification_queue.NOTIFICATION_ASYNC):
+    await ensure_friends([(data.senderChildUserName, data.receiverChildUserName)])
+
     # Filter the message content
-    filtered_message = await message_filter.filter_message(data.content, data.receiverChildUserName)
-    
-    # Create message input with filtered content
-    message = message_module.MessageInput(
-        senderChildUserName=data.senderChildUserName,
-        receiverChildUserName=data.receiverChildUserName,
-        content=filtered_message.content,
-        riskID=message_filter.risk_types.get(filtered_message.risk_type, 0) if filtered_message.is_filtered else 0
-    )
-    
-    # Process the message
-    result = message_module.process_message(message)
+    try:
+        filtered_message = await message_filter.filter_message(data.content, data.receiverChildUserName)
+    except ModerationOverloadedError:
+        raise HTTPException(status_code=503, detail="Message moderation is busy, please retry shortly")
     
     # If the message was filtered and requires parent notification, create a notification
     if filtered_message.is_filtered and filtered_message.should_notify_parent:
         # Generate a unique ID for the Firebase message
         firebase_message_id = f"{data.senderChildUserName}_{data.receiverChildUserName}_{datetime.now().timestamp()}"
         
-        message_module.create_notification(
-            firebase_message_id=firebase_message_id,
-            sender_child_username=data.senderChildUserName,
-            receiver_child_username=data.receiverChildUserName,
-            content=filtered_message.content,  # Masked content
-            risk_type=filtered_message.risk_type,
-            original_content=data.content  # Original unmasked content
-        )
+        notification = {
+            "firebase_message_id": firebase_message_id,
+            "sender_child_username": data.senderChildUserName,
+            "receiver_child_username": data.receiverChildUserName,
+            "content": filtered_message.content,  # Masked content
+            "risk_type": filtered_message.risk_type,
+            "original_content": data.content  # Original unmasked content
+        }
+        if async_notify:
+            # Parent lookup and insert happen in the background worker
+            notification_queue.enqueue_notifications([notification])
+        else:
+            message_module.create_notification(**notification)
     
     return {
         "message": "Message processed successfully",
@@ -58,6 +79,53 @@ async def send_message(data: MessageInput):
         "parent_notified": filtered_message.should_notify_parent
     }
 
+@router.post("/message/send/batch")
+async def send_message_batch(data: BatchMessageInput, async_notify: bool = notification_queue.NOTIFICATION_ASYNC):
+    """Filter a burst of messages together and return per-message results in order"""
+    if not data.messages:
+        raise HTTPException(status_code=400, detail="No messages provided")
+    if len(data.messages) > MAX_BATCH_MESSAGES:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {MAX_BATCH_MESSAGES} messages")
+    await ensure_friends({(msg.senderChildUserName, msg.receiverChildUserName) for msg in data.messages})
+
+    try:
+        filtered_messages = await message_filter.filter_messages(
+            [(msg.content, msg.receiverChildUserName) for msg in data.messages]
+        )
+    except ModerationOverloadedError:
+        raise HTTPException(status_code=503, detail="Message moderation is busy, please retry shortly")
+
+    # Collect all notifications so they are written with a single insert
+    notifications = []
+    for index, (msg, filtered_message) in enumerate(zip(data.messages, filtered_messages)):
+        if filtered_message.is_filtered and filtered_message.should_notify_parent:
+            notifications.append({
+                "firebase_message_id": f"{msg.senderChildUserName}_{msg.receiverChildUserName}_{datetime.now().timestamp()}_{index}",
+                "sender_child_username": msg.senderChildUserName,
+                "receiver_child_username": msg.receiverChildUserName,
+                "content": filtered_message.content,  # Masked content
+                "risk_type": filtered_message.risk_type,
+                "original_content": msg.content  # Original unmasked content
+            })
+    if async_notify:
+        notification_queue.enqueue_notifications(notifications)
+    else:
+        message_module.create_notifications(notifications)
+
+    return {
+        "message": "Messages processed successfully",
+        "results": [
+            {
+                "content": filtered_message.content,
+                "is_filtered": filtered_message.is_filtered,
+                "risk_type": filtered_message.risk_type,
+                "risk_level": filtered_message.risk_level,
+                "parent_notified": filtered_message.should_notify_parent
+            }
+            for filtered_message in filtered_messages
+        ]
+    }
+
 # Keep the test endpoint for backward compatibility
 @router.post("/message/test")
 def process_message(data: MessageInput):
@@ -4,12 +4,52 @@ from datetime import timedelta
 from app.modules import parent as parent_module
 from app.modules import child as child_module
 from app.modules import message as message_module 
-from fastapi import Request
-from pydantic import BaseModel
+from app.modules import friend_suggestions
+from fastapi import Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.modules.moderation_policy import moderation_policy
+from app.modules.chatbot_quota import chatbot_quota
+from app.modules.notification_feed import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.modules.notification_hub import notification_hub
+from app.modules.notification_retention import notification_retention
+from app.modules.notification_digest import notification_digests
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import json
 
 class MinutesUpdate(BaseModel):
     minutes: int
 
+class ChatbotLimits(BaseModel):
+    requestsPerMinute: int
+    dailyRequests: int
+    dailyTokens: int
+
+class PolicyRule(BaseModel):
+    min_age: int
+    max_age: int
+    action: Literal["allow", "mask", "notify"]
+
+class PolicyOverride(BaseModel):
+    rules: List[PolicyRule]
+
+class RetentionUpdate(BaseModel):
+    # None goes back to the server default
+    retentionDays: Optional[int] = None
+
+class DigestPreference(BaseModel):
+    frequency: Literal["off", "hourly", "daily"]
+
+class SuggestionSetting(BaseModel):
+    allowSuggestions: bool
+
+class MarkRead(BaseModel):
+    notificationIDs: Optional[List[int]] = Field(None, max_length=MAX_PAGE_SIZE)
+    # Mark everything from the newest notification displayed down to this feed cursor
+    upToCursor: Optional[str] = None
+    newestNotificationID: Optional[int] = None
+    childUserName: Optional[str] = None
+
 router = APIRouter()
 
 
@@ -157,11 +197,159 @@ def reset_child_usage_time(
 
 #-------------------- get the notifications --------------------------
 @router.get("/parent/notifications")
-def get_notifications(current_user: dict = Depends(parent_module.getCurrentUser)):
+def get_notifications(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    childUserName: Optional[str] = None,
+    riskType: Optional[str] = None,
+    unreadOnly: bool = False,
+    current_user: dict = Depends(parent_module.getCurrentUser)
+):
     parentUserName = current_user['parentUserName']
-    notifications = message_module.get_notifications(parentUserName)
+    notifications, next_cursor = message_module.get_notifications(
+        parentUserName, limit, cursor, childUserName, riskType, unreadOnly
+    )
+    # The body stays a plain list; the next page is requested with ?cursor=<X-Next-Cursor>
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return notifications
     
+@router.get("/parent/notifications/unread-count")
+def get_unread_count(current_user: dict = Depends(parent_module.getCurrentUser)):
+    return message_module.get_unread_count(current_user['parentUserName'])
+
+@router.post("/parent/notifications/read")
+def mark_notifications_read(data: MarkRead, current_user: dict = Depends(parent_module.getCurrentUser)):
+    return message_module.mark_notifications_read(
+        current_user['parentUserName'], data.notificationIDs, data.upToCursor, data.newestNotificationID,
+        data.childUserName
+    )
+
+@router.get("/parent/notifications/retention")
+def get_notification_retention(current_user: dict = Depends(parent_module.getCurrentUser)):
+    return notification_retention.get_retention(current_user['parentUserName'])
+
+@router.put("/parent/notifications/retention")
+def set_notification_retention(data: RetentionUpdate, current_user: dict = Depends(parent_module.getCurrentUser)):
+    return notification_retention.set_retention(current_user['parentUserName'], data.retentionDays)
+
+@router.get("/parent/notifications/digest")
+def get_digest_preference(current_user: dict = Depends(parent_module.getCurrentUser)):
+    return notification_digests.get_preference(current_user['parentUserName'])
+
+@router.put("/parent/notifications/digest")
+def set_digest_preference(data: DigestPreference, current_user: dict = Depends(parent_module.getCurrentUser)):
+    return notification_digests.set_preference(current_user['parentUserName'], data.frequency)
+
+@router.get("/parent/notifications/digests")
+def get_digests(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(parent_module.getCurrentUser)
+):
+    return notification_digests.get_digests(current_user['parentUserName'], limit)
+
+#------------------ friend suggestions ----------------------
+@router.get("/parent/settings/friend-suggestions")
+def get_friend_suggestion_setting(current_user: dict = Depends(parent_module.getCurrentUser)):
+    return friend_suggestions.get_suggestion_setting(current_user['parentUserName'])
+
+@router.put("/parent/settings/friend-suggestions")
+def set_friend_suggestion_setting(data: SuggestionSetting, current_user: dict = Depends(parent_module.getCurrentUser)):
+    """Whether this parent's children appear in and receive friend suggestions"""
+    return friend_suggestions.set_suggestion_setting(current_user['parentUserName'], data.allowSuggestions)
+
+#------------------ real-time notifications ----------------------
+def _format_sse(message: dict) -> str:
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'], ensure_ascii=False, default=str)}\n\n"
+
+@router.get("/parent/notifications/stream")
+async def stream_notifications(request: Request, current_user: dict = Depends(parent_module.getCurrentUser)):
+    """Push new notifications as Server-Sent Events, with heartbeats while idle"""
+    subscription = notification_hub.subscribe(current_user['parentUserName'])
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                yield _format_sse(await subscription.next_event())
+        finally:
+            notification_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/parent/notifications/ws")
+async def notifications_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """Push new notifications over a WebSocket; the parent JWT comes as ?token= or a bearer header"""
+    authorization = websocket.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    try:
+        if not token:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        current_user = await parent_module.getCurrentUser(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = notification_hub.subscribe(current_user['parentUserName'])
+    try:
+        while True:
+            # Heartbeats also surface dead connections, since sending to them fails
+            await websocket.send_text(json.dumps(await subscription.next_event(), ensure_ascii=False, default=str))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        notification_hub.unsubscribe(subscription)
+
+#------------------ chatbot limits for the child ----------------------
+@router.get("/parent/children/{childUserName}/chatbot/limits")
+def get_child_chatbot_limits(
+    childUserName: str,
+    current_user: dict = Depends(parent_module.getCurrentUser)
+):
+    child = child_module.get_child(childUserName)
+    if not child or child['parentUserName'] != current_user['parentUserName']:
+        raise HTTPException(status_code=404, detail="الطفل غير موجود أو لا يتبع لهذا الأب")
+    return chatbot_quota.get_status(childUserName)
+
+@router.put("/parent/children/{childUserName}/chatbot/limits")
+def set_child_chatbot_limits(
+    childUserName: str,
+    limits: ChatbotLimits,
+    current_user: dict = Depends(parent_module.getCurrentUser)
+):
+    if min(limits.requestsPerMinute, limits.dailyRequests, limits.dailyTokens) < 0:
+        raise HTTPException(status_code=400, detail="Limits cannot be negative")
+    return chatbot_quota.set_limits(current_user['parentUserName'], childUserName, limits.dict())
+
+#-------------------- moderation policy --------------------------
+@router.get("/parent/moderation-policy")
+def get_moderation_policy(current_user: dict = Depends(parent_module.getCurrentUser)):
+    """Effective moderation rules for this parent's children"""
+    return moderation_policy.describe(current_user['parentUserName'])
+
+@router.put("/parent/moderation-policy/{riskID}")
+def set_moderation_policy(
+    riskID: int,
+    override: PolicyOverride,
+    current_user: dict = Depends(parent_module.getCurrentUser)
+):
+    """Replace the age rules for one risk type; an empty list restores the default rules"""
+    try:
+        moderation_policy.set_parent_override(
+            current_user['parentUserName'],
+            riskID,
+            [rule.dict() for rule in override.rules]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Moderation policy updated successfully"}
+
 #---------------------- block child's friend-----------------------------
 @router.post("/parent/children/{childUserName}/block/{friendUserName}")
 def block_child_friend(
@@ -0,0 +1,16 @@
+import os
+import sys
+import types
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+# Unit tests run against an in-memory database instead of the MySQL server app.database
+# connects to on import; endpoint tests talk to a running server and are unaffected
+database = types.ModuleType("app.database")
+database.engine = sa.create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+database.get_connection = database.engine.connect
+sys.modules.setdefault("app.database", database)
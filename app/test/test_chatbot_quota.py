@@ -0,0 +1,93 @@
+import asyncio
+from datetime import date, timedelta
+import pytest
+import sqlalchemy as sa
+from fastapi import HTTPException
+from app.modules import chatbot_quota as quota_module
+from app.modules.chatbot_quota import ChatbotQuota
+
+
+@pytest.fixture
+def quota(monkeypatch):
+    known = {"sara", "omar"}
+    monkeypatch.setattr(
+        quota_module.child_profile_cache, "get_profile",
+        lambda username: {"childUserName": username} if username in known else None
+    )
+    quota = ChatbotQuota()
+    monkeypatch.setattr(quota, "load", lambda: None)
+    quota.written = []
+    return quota
+
+
+def test_unknown_child_is_rejected_and_not_tracked(quota):
+    with pytest.raises(HTTPException) as error:
+        quota.check("x" * 500)
+    assert error.value.status_code == 404
+    assert quota._usage == {}
+
+def test_rate_limit_and_daily_quota(quota):
+    quota.default_limits = {"requestsPerMinute": 2, "dailyRequests": 3, "dailyTokens": 1000}
+    quota.check("sara")
+    quota.check("sara")
+    with pytest.raises(HTTPException) as error:
+        quota.check("sara")
+    assert error.value.status_code == 429 and "Retry-After" in error.value.headers
+    quota._usage["sara"].pending_requests = 3
+    with pytest.raises(HTTPException):
+        quota.check("sara")
+
+def test_rejected_row_is_dropped_and_others_written(quota, monkeypatch):
+    def write(batch):
+        if any(item["child"] == "omar" for item in batch):
+            raise sa.exc.IntegrityError("INSERT", {}, Exception("foreign key"))
+        quota.written.extend(batch)
+    monkeypatch.setattr(quota, "_write", write)
+    quota.check("sara")
+    quota.check("omar")
+    quota.flush()
+    assert [item["child"] for item in quota.written] == ["sara"]
+    # Nothing is left to fail the next flush
+    quota.flush()
+    assert len(quota.written) == 1
+
+def test_failed_flush_keeps_counts_for_the_next_one(quota, monkeypatch):
+    def fail(batch):
+        raise sa.exc.OperationalError("INSERT", {}, Exception("server gone"))
+    monkeypatch.setattr(quota, "_write", fail)
+    quota.check("sara")
+    with pytest.raises(sa.exc.OperationalError):
+        quota.flush()
+    assert quota._usage["sara"].pending_requests == 1
+
+def test_yesterdays_usage_is_written_to_yesterdays_row(quota, monkeypatch):
+    monkeypatch.setattr(quota, "_write", quota.written.extend)
+    quota.check("sara")
+    quota.record_tokens("sara", 40)
+    yesterday = date.today() - timedelta(days=1)
+    quota._usage["sara"].day = yesterday
+    quota.check("sara")
+    assert quota.get_status("sara")["requestsToday"] == 1
+    quota.flush()
+    assert sorted((item["day"], item["requests"], item["tokens"]) for item in quota.written) == [
+        (yesterday, 1, 40), (date.today(), 1, 0)
+    ]
+
+def test_blocked_stream_is_still_charged(quota, monkeypatch):
+    from app.modules import chatbot as chatbot_module
+
+    class UnsafeLLM:
+        async def stream_chat_completion(self, **params):
+            for delta in ["خذ ", "حبوب ", "مخدرة ", "الآن"]:
+                yield delta
+
+    monkeypatch.setattr(chatbot_module, "chatbot_quota", quota)
+    monkeypatch.setattr(chatbot_module.Chatbot, "llm", UnsafeLLM())
+    monkeypatch.setattr(chatbot_module.Chatbot, "get_child_age", lambda self, username: 9)
+    quota.check("sara")
+
+    async def events():
+        return [event async for event, _ in chatbot_module.Chatbot().stream_response("sara", "سؤال جديد")]
+
+    assert asyncio.run(events())[-1] == "blocked"
+    assert quota._usage["sara"].pending_tokens > 0
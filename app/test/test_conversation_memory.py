@@ -0,0 +1,42 @@
+import asyncio
+from app.modules.conversation_memory import ConversationMemory
+
+
+def long_turn(i: int) -> str:
+    return f"سؤال رقم {i} " * 40
+
+def test_summaries_are_tracked_until_they_finish():
+    calls = []
+
+    async def summarize(child_username, summary, turns):
+        calls.append((child_username, len(turns)))
+        await asyncio.sleep(0.01)
+        return "ملخص"
+
+    memory = ConversationMemory(summarize=summarize, token_budget=50, persist=False)
+
+    async def run():
+        memory.record("sara", long_turn(1), long_turn(2))
+        memory.record("sara", long_turn(3), long_turn(4))
+        assert len(memory._tasks) == 1
+        await memory.stop()
+        assert not memory._tasks
+
+    asyncio.run(run())
+    assert calls and calls[0][0] == "sara"
+    assert memory.get_context("sara")[0]["content"].endswith("ملخص")
+
+def test_stop_cancels_slow_summaries_and_keeps_a_fallback_summary():
+    async def summarize(child_username, summary, turns):
+        await asyncio.sleep(10)
+
+    memory = ConversationMemory(summarize=summarize, token_budget=50, persist=False)
+
+    async def run():
+        memory.record("sara", long_turn(1), long_turn(2))
+        memory.record("sara", long_turn(3), long_turn(4))
+        await memory.stop(timeout=0.01)
+        assert not memory._tasks
+
+    asyncio.run(run())
+    assert "سؤال رقم 1" in memory.get_context("sara")[0]["content"]
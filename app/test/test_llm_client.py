@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from app.modules import llm_client as llm_module
+from app.modules.llm_client import CircuitBreaker, LLMClient, LLMUnavailableError
+from app.modules.llm_providers import LLMProvider, make_response
+
+
+class SlowProvider(LLMProvider):
+    """Answers after delay seconds, or fails with error"""
+
+    def __init__(self, delay: float = 0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+
+    async def complete(self, task: str, **params):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return make_response("ok")
+
+    async def stream(self, task: str, **params):
+        await asyncio.sleep(self.delay)
+        raise NotImplementedError
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_reset():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    # Only one trial at a time
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow_request()
+
+def test_open_breaker_short_circuits():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.allow_request()
+
+def test_cancelled_trial_releases_the_breaker():
+    client = LLMClient("test", SlowProvider(delay=10))
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    open_breaker(client.breaker)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.chat_completion(messages=[]), 0.05)
+        client.provider.delay = 0
+        return await client.chat_completion(messages=[])
+
+    assert asyncio.run(run()).choices[0].message.content == "ok"
+    assert client.breaker.state == "closed"
+
+def test_client_error_in_trial_releases_the_breaker():
+    client = LLMClient("test", SlowProvider(error=ValueError("bad request")))
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    open_breaker(client.breaker)
+    with pytest.raises(ValueError):
+        asyncio.run(client.chat_completion(messages=[]))
+    assert client.breaker.allow_request()
+
+def test_retryable_failures_open_the_breaker(monkeypatch):
+    monkeypatch.setattr(llm_module, "LLM_BACKOFF_BASE_SECONDS", 0)
+    client = LLMClient("test", SlowProvider(error=asyncio.TimeoutError()))
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(client.chat_completion(messages=[]))
+    assert client.metrics.counters["retries"] == llm_module.LLM_MAX_RETRIES
+    with pytest.raises(LLMUnavailableError, match="circuit breaker is open"):
+        asyncio.run(client.chat_completion(messages=[]))
+
+def test_busy_slots_do_not_count_against_the_breaker():
+    client = LLMClient("test", SlowProvider())
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+
+    async def run():
+        client.semaphore = asyncio.Semaphore(0)
+        with pytest.raises(LLMUnavailableError, match="no free slot"):
+            await client.chat_completion(deadline=0.05, messages=[])
+
+    asyncio.run(run())
+    assert client.metrics.counters["timeouts"] == 1
+    assert client.metrics.counters["retries"] == 0
+    assert client.breaker.state == "closed"
+
+def test_stream_cancelled_before_first_token_releases_the_breaker():
+    client = LLMClient("test", SlowProvider(delay=10))
+    client.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    open_breaker(client.breaker)
+
+    async def first_token():
+        async for delta in client.stream_chat_completion(messages=[]):
+            return delta
+
+    async def run():
+        task = asyncio.create_task(first_token())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert client.breaker.allow_request()
+    assert client.semaphore._value == llm_module.LLM_MAX_CONCURRENCY
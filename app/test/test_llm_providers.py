@@ -0,0 +1,54 @@
+import asyncio
+import json
+import pytest
+from app.modules.llm_providers import (
+    TASK_CHAT, TASK_CLASSIFY, TASK_CLASSIFY_BATCH, LLMProvider, StubProvider, create_provider
+)
+
+
+def ask(content: str) -> list:
+    return [{"role": "user", "content": content}]
+
+
+def test_provider_must_implement_complete_and_stream():
+    with pytest.raises(TypeError):
+        LLMProvider()
+
+    class CompleteOnly(LLMProvider):
+        async def complete(self, task: str, **params):
+            return None
+
+    with pytest.raises(TypeError):
+        CompleteOnly()
+
+def test_stub_classifies_with_the_lexicon():
+    provider = StubProvider(latency_ms=0)
+    response = asyncio.run(provider.complete(TASK_CLASSIFY, messages=ask("عندي حشيش")))
+    assert response.choices[0].message.content == "3"
+
+def test_stub_batch_answer_keeps_ids():
+    provider = StubProvider(latency_ms=0)
+    content = asyncio.run(provider.complete(TASK_CLASSIFY_BATCH, messages=ask('1. "مرحبا"\n2. "انت غبي"')))
+    results = json.loads(content.choices[0].message.content)["results"]
+    assert [(item["id"], item["classification"]) for item in results] == [(1, 0), (2, 1)]
+
+def test_stub_stream_joins_to_the_full_answer():
+    provider = StubProvider(latency_ms=0)
+
+    async def collect():
+        stream = await provider.stream(TASK_CHAT, messages=ask("ما هو القمر؟"))
+        return "".join([chunk.choices[0].delta.content async for chunk in stream])
+
+    expected = asyncio.run(provider.complete(TASK_CHAT, messages=ask("ما هو القمر؟"))).choices[0].message.content
+    assert asyncio.run(collect()) == expected
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError):
+        create_provider("other", "chatbot")
+    with pytest.raises(ValueError):
+        create_provider("local", "chatbot")
+
+def test_local_provider_without_a_model_fails_instead_of_degrading():
+    # No LOCAL_MODERATION_MODEL_PATH is set in tests
+    with pytest.raises(RuntimeError, match="Local moderation model unavailable"):
+        create_provider("local", "moderation")
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from app.modules.moderation_batcher import ModerationBatcher, ModerationOverloadedError
+
+
+class Classifier:
+    """Records every batch and classifies by message length"""
+
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.batches = []
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self, contents):
+        self.batches.append(list(contents))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return [(len(content) % 4, [content]) for content in contents]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_messages_share_one_call_and_keep_their_results():
+    classifier = Classifier()
+    batcher = ModerationBatcher(classifier, max_batch_size=16, max_wait_ms=20)
+
+    async def scenario():
+        results = await asyncio.gather(*(batcher.submit("x" * size) for size in range(5)))
+        await batcher.close()
+        return results
+
+    assert run(scenario()) == [(size % 4, ["x" * size]) for size in range(5)]
+    assert len(classifier.batches) == 1
+
+def test_batches_are_capped_at_max_batch_size():
+    classifier = Classifier()
+    batcher = ModerationBatcher(classifier, max_batch_size=2, max_wait_ms=20)
+
+    async def scenario():
+        await asyncio.gather(*(batcher.submit(str(index)) for index in range(5)))
+        await batcher.close()
+
+    run(scenario())
+    assert [len(batch) for batch in classifier.batches] == [2, 2, 1]
+
+def test_failed_batch_fails_every_caller():
+    batcher = ModerationBatcher(Classifier(fail=True), max_wait_ms=5)
+
+    async def scenario():
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        await batcher.close()
+        return results
+
+    assert all(isinstance(result, RuntimeError) for result in run(scenario()))
+    assert batcher.stats["failed_batches"] == 1
+
+def test_full_queue_is_rejected():
+    batcher = ModerationBatcher(
+        Classifier(delay=1), max_batch_size=1, max_wait_ms=0, max_pending=1,
+        max_concurrent_batches=1, enqueue_timeout_ms=10
+    )
+
+    async def scenario():
+        pending = [asyncio.create_task(batcher.submit(str(index))) for index in range(4)]
+        await asyncio.sleep(0.1)
+        with pytest.raises(ModerationOverloadedError):
+            await batcher.submit("late")
+        await batcher.close()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    run(scenario())
+    assert batcher.stats["rejected"] >= 1
+
+def test_close_fails_messages_waiting_for_a_batch_slot():
+    batcher = ModerationBatcher(Classifier(delay=0.2), max_batch_size=1, max_wait_ms=0, max_concurrent_batches=1)
+
+    async def scenario():
+        first = asyncio.create_task(batcher.submit("first"))
+        second = asyncio.create_task(batcher.submit("second"))
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(batcher.close(), 1)
+        return await asyncio.wait_for(asyncio.gather(first, second, return_exceptions=True), 1)
+
+    first, second = run(scenario())
+    assert first == (1, ["first"])
+    assert isinstance(second, ModerationOverloadedError)
@@ -0,0 +1,43 @@
+from app.modules.moderation_lexicon import StreamModerator, classify_with_lexicon
+
+
+def stream(chunks):
+    moderator = StreamModerator()
+    sent = "".join(moderator.feed(chunk) for chunk in chunks)
+    return sent + moderator.flush(), moderator.blocked
+
+
+def test_classify_finds_phrase():
+    assert classify_with_lexicon("خذ حبوب مخدرة الآن") == (3, ["حبوب مخدرة"])
+
+def test_phrase_streamed_word_by_word_is_blocked():
+    sent, blocked = stream(["خذ ", "حبوب ", "مخدرة ", "الآن"])
+    assert blocked
+    assert "حبوب" not in sent
+
+def test_phrase_streamed_letter_by_letter_is_blocked():
+    sent, blocked = stream(list("خذ حبوب مخدرة الآن"))
+    assert blocked
+    assert "حبوب" not in sent
+
+def test_word_streamed_token_by_token_is_masked():
+    sent, blocked = stream(["انت ", "غ", "بي ", "جدا"])
+    assert not blocked
+    assert sent == "انت *** جدا"
+
+def test_insult_streamed_word_by_word_is_masked():
+    sent, blocked = stream(["انت ", "يا ", "حمار ", "!"])
+    assert not blocked
+    assert "حمار" not in sent
+
+def test_safe_text_is_released_unchanged():
+    chunks = ["الشمس ", "نجم ", "كبير، ", "وهي ", "قريبة ", "منا."]
+    moderator = StreamModerator()
+    released = [moderator.feed(chunk) for chunk in chunks]
+    assert "".join(released) + moderator.flush() == "".join(chunks)
+    # Only the held-back words wait; earlier text goes out as soon as it is complete
+    assert "".join(released).startswith("الشمس نجم")
+
+def test_single_chunk_and_stream_agree():
+    text = "لا تقل غبي لأحد"
+    assert stream([text])[0] == stream([word + " " for word in text.split(" ")])[0].rstrip() == stream(list(text))[0]
@@ -0,0 +1,51 @@
+import pytest
+from app.modules.moderation_policy import DEFAULT_POLICY, MAX_POLICY_AGE, CompiledPolicy, ModerationPolicy, compile_row
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    policy = ModerationPolicy()
+    monkeypatch.setattr(policy, "_load_labels", lambda: {})
+    monkeypatch.setattr(policy, "_load_overrides", lambda: {"p1": {1: [{"min_age": 10, "max_age": 12, "action": "allow"}]}})
+    return policy
+
+
+def test_rules_expand_into_one_action_per_age():
+    row = compile_row("mask", [{"min_age": 6, "max_age": 9, "action": "notify"}])
+    assert len(row) == MAX_POLICY_AGE + 2
+    assert row[5] == "mask" and row[6] == row[9] == "notify" and row[10] == "mask"
+    # Unknown age uses the default action
+    assert row[MAX_POLICY_AGE + 1] == "mask"
+
+def test_rules_are_clamped_to_the_matrix():
+    row = compile_row("allow", [{"min_age": -3, "max_age": 99, "action": "notify"}])
+    assert set(row[:MAX_POLICY_AGE + 1]) == {"notify"}
+
+@pytest.mark.parametrize("rules", [
+    [{"min_age": 6, "max_age": 9, "action": "delete"}],
+    [{"min_age": 12, "max_age": 8, "action": "notify"}],
+    [{"min_age": 6, "max_age": 9, "action": "notify"}, {"min_age": 6, "max_age": 12, "action": "mask"}],
+])
+def test_invalid_rules_are_rejected(rules):
+    with pytest.raises(ValueError):
+        compile_row("mask", rules)
+
+def test_decide_uses_parent_overrides_then_defaults(policy):
+    assert policy.decide(1, 8) == "notify"
+    assert policy.decide(1, 11, "p1") == "allow"
+    assert policy.decide(1, 8, "p1") == "mask"
+    assert policy.decide(3, 16, "p1") == "notify"
+    assert policy.decide(9, 8) == "allow"
+    assert policy.decide(2, None) == "mask"
+
+def test_invalid_override_is_rejected_before_writing(policy):
+    for rules in ([{"min_age": 12, "max_age": 8, "action": "notify"}],
+                  [{"min_age": 6, "max_age": 7, "action": "mask"}, {"min_age": 6, "max_age": 9, "action": "notify"}]):
+        with pytest.raises(ValueError):
+            policy.set_parent_override("p1", 1, rules)
+    assert policy.decide(1, 11, "p1") == "allow"
+
+def test_codes_and_labels():
+    compiled = CompiledPolicy(DEFAULT_POLICY, {3: "Drugs and alcohol"}, {})
+    assert compiled.classifications["sexual_content"] == 2
+    assert compiled.labels["drug_related"] == "Drugs and alcohol"
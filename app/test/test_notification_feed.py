@@ -0,0 +1,59 @@
+from datetime import datetime
+import pytest
+import sqlalchemy as sa
+from fastapi import HTTPException
+from app.database import engine
+from app.modules.notification_feed import decode_cursor, encode_cursor, mark_notifications_read
+
+
+def test_cursor_round_trips():
+    position = (datetime(2025, 3, 1, 12, 30, 5, 120000), 4821)
+    cursor = encode_cursor(*position)
+    assert decode_cursor(cursor) == position
+    # URL-safe and unpadded, so it can go straight into a query string
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(datetime(2025, 1, 1), 1)[:-3]])
+def test_bad_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+@pytest.fixture
+def feed():
+    with engine.begin() as conn:
+        # MySQL's GREATEST is max() in SQLite
+        conn.connection.driver_connection.create_function("GREATEST", 2, max)
+        conn.execute(sa.text("DROP TABLE IF EXISTS Notification"))
+        conn.execute(sa.text("DROP TABLE IF EXISTS ParentUnreadCounter"))
+        conn.execute(sa.text("""
+            CREATE TABLE Notification (notificationID INTEGER PRIMARY KEY, parentUserName TEXT,
+                                       receiverChildUserName TEXT, timeStamp TIMESTAMP, isRead INTEGER)
+        """))
+        conn.execute(sa.text("CREATE TABLE ParentUnreadCounter (parentUserName TEXT PRIMARY KEY, unreadCount INTEGER)"))
+        conn.execute(
+            sa.text("INSERT INTO Notification VALUES (:id, 'huda', 'sara', :timeStamp, 0)"),
+            [{"id": i, "timeStamp": datetime(2025, 3, 1, 12, i)} for i in range(1, 6)]
+        )
+        conn.execute(sa.text("INSERT INTO ParentUnreadCounter VALUES ('huda', 5)"))
+
+def unread_ids():
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(sa.text("SELECT notificationID FROM Notification WHERE isRead = 0"))]
+
+def test_cursor_range_stops_at_the_newest_notification_displayed(feed):
+    # The parent loaded 4 down to 2; 5 arrived afterwards and must stay unread
+    cursor = encode_cursor(datetime(2025, 3, 1, 12, 2), 2)
+    assert mark_notifications_read("huda", up_to_cursor=cursor, newest_id=4) == 3
+    assert unread_ids() == [1, 5]
+
+def test_cursor_range_needs_the_newest_notification_displayed(feed):
+    cursor = encode_cursor(datetime(2025, 3, 1, 12, 2), 2)
+    with pytest.raises(HTTPException) as error:
+        mark_notifications_read("huda", up_to_cursor=cursor)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException) as error:
+        mark_notifications_read("someone_else", up_to_cursor=cursor, newest_id=4)
+    assert error.value.status_code == 404
+    assert len(unread_ids()) == 5
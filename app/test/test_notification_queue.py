@@ -0,0 +1,15 @@
+from app.modules import notification_queue as queue_module
+
+
+def test_outbox_is_only_created_once_something_is_queued(tmp_path, monkeypatch):
+    path = tmp_path / "outbox.db"
+    monkeypatch.setattr(queue_module, "NOTIFICATION_OUTBOX_PATH", str(path))
+    monkeypatch.setattr(queue_module, "_outbox_engine", None)
+    worker = queue_module.NotificationWorker()
+
+    assert worker._claim_batch() == []
+    assert not path.exists()
+
+    queue_module.enqueue_notifications([{"parentUserName": "huda", "content": "hi"}])
+    assert path.exists()
+    assert [row["outboxID"] for row in worker._claim_batch()] == [1]
@@ -0,0 +1,89 @@
+import pytest
+import sqlalchemy as sa
+from app.database import engine
+from app.modules import message as message_module
+from app.modules.notification_dedup import NotificationDeduplicator
+
+
+@pytest.fixture
+def published(monkeypatch):
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP TABLE IF EXISTS Notification"))
+        conn.execute(sa.text("DROP TABLE IF EXISTS ParentUnreadCounter"))
+        conn.execute(sa.text("""
+            CREATE TABLE Notification (
+                notificationID INTEGER PRIMARY KEY AUTOINCREMENT, firebaseMessageID TEXT,
+                senderChildUserName TEXT, receiverChildUserName TEXT, parentUserName TEXT,
+                content TEXT, originalContent TEXT, riskType TEXT, isRead INT DEFAULT 0,
+                occurrenceCount INT DEFAULT 1, latestContent TEXT, lastOccurrenceAt DATETIME,
+                timeStamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        conn.execute(sa.text("CREATE TABLE ParentUnreadCounter (parentUserName TEXT, unreadCount INT)"))
+        # Rows of other parents already in the table
+        conn.execute(sa.text("""
+            INSERT INTO Notification (firebaseMessageID, senderChildUserName, receiverChildUserName, parentUserName, content, riskType)
+            VALUES ('old', 'x', 'y', 'other', 'c', 'bullying')
+        """))
+    monkeypatch.setattr(message_module, "notification_deduplicator", NotificationDeduplicator(window_seconds=60))
+    events = []
+    monkeypatch.setattr(message_module.notification_hub, "publish", lambda parent, event, data: events.append((event, data)))
+    return events
+
+
+def notification(sender: str, receiver: str, risk_type: str, index: int) -> dict:
+    return {
+        "firebase_message_id": f"{sender}_{receiver}_{index}",
+        "sender_child_username": sender,
+        "receiver_child_username": receiver,
+        "content": f"masked {index}",
+        "original_content": f"original {index}",
+        "risk_type": risk_type,
+    }
+
+
+def test_batch_insert_publishes_the_new_ids(published):
+    batch = [notification("sara", "omar", "bullying", 1), notification("lina", "omar", "drugs", 2)]
+    assert message_module._save_notifications(batch, {"omar": "p1"}) == (2, 0)
+    with engine.connect() as conn:
+        stored = dict(conn.execute(sa.text("SELECT firebaseMessageID, notificationID FROM Notification")).all())
+    assert [data["notificationID"] for _, data in published] == [stored["sara_omar_1"], stored["lina_omar_2"]]
+    assert all(event == "notification" for event, _ in published)
+
+def test_repeat_after_batch_insert_is_coalesced_into_the_open_row(published):
+    message_module._save_notifications(
+        [notification("sara", "omar", "bullying", 1), notification("lina", "omar", "drugs", 2)], {"omar": "p1"}
+    )
+    first_id = published[0][1]["notificationID"]
+    assert message_module._save_notifications([notification("sara", "omar", "bullying", 3)], {"omar": "p1"}) == (0, 1)
+    assert published[-1] == ("notification_update", {
+        "notificationID": first_id, "newOccurrences": 1, "latestContent": "masked 3"
+    })
+
+def test_repeats_within_a_batch_share_one_row(published):
+    batch = [notification("sara", "omar", "bullying", index) for index in range(3)]
+    assert message_module._save_notifications(batch, {"omar": "p1"}) == (1, 0)
+    assert published[0][1]["occurrenceCount"] == 3
+
+def test_deduplicator_window_expires():
+    deduplicator = NotificationDeduplicator(window_seconds=60)
+    key = ("sara", "omar", "bullying")
+    deduplicator.open(key, 7)
+    assert deduplicator.lookup(key).notification_id == 7
+    deduplicator.window_seconds = -1
+    assert deduplicator.lookup(key) is None
+
+def test_deduplicator_needs_an_id_and_can_be_disabled():
+    deduplicator = NotificationDeduplicator(window_seconds=60)
+    deduplicator.open(("a", "b", "c"), None)
+    assert deduplicator.lookup(("a", "b", "c")) is None
+    disabled = NotificationDeduplicator(window_seconds=0)
+    disabled.open(("a", "b", "c"), 1)
+    assert disabled.lookup(("a", "b", "c")) is None
+
+def test_deduplicator_evicts_oldest_key():
+    deduplicator = NotificationDeduplicator(window_seconds=60, max_keys=1)
+    deduplicator.open(("a", "b", "c"), 1)
+    deduplicator.open(("d", "e", "f"), 2)
+    assert deduplicator.lookup(("a", "b", "c")) is None
+    assert deduplicator.lookup(("d", "e", "f")).notification_id == 2
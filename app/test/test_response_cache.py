@@ -0,0 +1,47 @@
+from app.modules.response_cache import CHATBOT_CACHE_NEAR_DUPLICATES, ResponseCache
+from app.modules.text_normalization import normalize_text
+
+
+def test_normalize_folds_arabic_variants_and_punctuation():
+    assert normalize_text("  ما هِيَ الشمسُ؟ ") == normalize_text("ما هي الشمس")
+    assert normalize_text("أين المكتبة") == "اين المكتبه"
+
+def test_exact_hit_is_per_age_group():
+    cache = ResponseCache()
+    cache.put("early_elementary", "ما لون السماء؟", "أزرق")
+    assert cache.get("early_elementary", "ما لون السماء") == "أزرق"
+    assert cache.get("teen", "ما لون السماء") is None
+
+def test_near_duplicates_are_off_by_default():
+    assert not CHATBOT_CACHE_NEAR_DUPLICATES
+    cache = ResponseCache()
+    cache.put("early_elementary", "كم يساوي 7 ضرب 8؟", "7 ضرب 8 يساوي 56")
+    assert cache.get("early_elementary", "كم يساوي 8 ضرب 7؟") is None
+
+def test_near_duplicate_never_answers_a_different_number():
+    cache = ResponseCache(near_duplicates=True)
+    cache.put("early_elementary", "كم يساوي 7 ضرب 8؟", "7 ضرب 8 يساوي 56")
+    cache.put("early_elementary", "what is 12 times 14", "168")
+    assert cache.get("early_elementary", "كم يساوي 7 ضرب 9؟") is None
+    assert cache.get("early_elementary", "what is 12 times 15") is None
+    assert cache.stats["near_hits"] == 0
+
+def test_near_duplicate_matches_same_words_in_another_order():
+    cache = ResponseCache(near_duplicates=True, similarity=0.5)
+    cache.put("teen", "why is the sky blue", "Scattering")
+    assert cache.get("teen", "why is the sky blue blue") == "Scattering"
+    assert cache.stats["near_hits"] == 1
+
+def test_unsafe_answers_are_not_stored():
+    cache = ResponseCache()
+    assert not cache.put("teen", "سؤال", "انت غبي")
+    assert cache.get("teen", "سؤال") is None
+
+def test_expired_and_evicted_entries_are_dropped():
+    cache = ResponseCache(ttl_seconds=-1)
+    cache.put("teen", "a question", "an answer")
+    assert cache.get("teen", "a question") is None
+    cache = ResponseCache(max_entries=1)
+    cache.put("teen", "first", "1")
+    cache.put("teen", "second", "2")
+    assert cache.get("teen", "first") is None and cache.get("teen", "second") == "2"
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+import sqlalchemy as sa
+from fastapi import HTTPException
+from app.database import engine
+from app.modules.social_graph import SocialGraphCache
+from app.routes import message as message_routes
+
+
+@pytest.fixture
+def graph():
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP TABLE IF EXISTS FriendEdge"))
+        conn.execute(sa.text("CREATE TABLE FriendEdge (childUserName TEXT, friendUserName TEXT, status TEXT)"))
+        conn.execute(
+            sa.text("INSERT INTO FriendEdge VALUES (:child, :friend, :status)"),
+            [
+                {"child": "sara", "friend": "omar", "status": "Active"},
+                {"child": "omar", "friend": "sara", "status": "Active"},
+                {"child": "sara", "friend": "lina", "status": "Blocked"},
+                {"child": "lina", "friend": "sara", "status": "Blocked"},
+            ]
+        )
+    return SocialGraphCache(ttl_seconds=60, max_users=2)
+
+
+def test_messages_between_strangers_are_rejected_when_required(graph, monkeypatch):
+    monkeypatch.setattr(message_routes, "social_graph", graph)
+    monkeypatch.setattr(message_routes, "MESSAGE_REQUIRE_FRIENDSHIP", True)
+    asyncio.run(message_routes.ensure_friends([("sara", "omar")]))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(message_routes.ensure_friends([("sara", "omar"), ("sara", "lina")]))
+    assert error.value.status_code == 403 and "lina" in error.value.detail
+
+def test_messages_between_strangers_are_allowed_when_not_required(graph, monkeypatch):
+    monkeypatch.setattr(message_routes, "social_graph", graph)
+    monkeypatch.setattr(message_routes, "MESSAGE_REQUIRE_FRIENDSHIP", False)
+    asyncio.run(message_routes.ensure_friends([("sara", "lina"), ("omar", "nobody")]))
+    assert graph.stats == {"hits": 0, "misses": 0}
+
+def test_friends_and_blocks(graph):
+    assert graph.are_friends("sara", "omar")
+    assert not graph.are_friends("sara", "lina")
+    assert graph.is_blocked("lina", "sara")
+    assert graph.friends("nobody") == frozenset()
+
+def test_adjacency_is_cached_until_invalidated(graph):
+    graph.are_friends("sara", "omar")
+    graph.are_friends("sara", "omar")
+    assert graph.stats == {"hits": 1, "misses": 1}
+    with engine.begin() as conn:
+        conn.execute(sa.text("UPDATE FriendEdge SET status = 'Blocked' WHERE childUserName = 'sara' AND friendUserName = 'omar'"))
+    assert graph.are_friends("sara", "omar")
+    graph.invalidate("sara")
+    assert not graph.are_friends("sara", "omar")
+
+def test_forget_drops_neighbourhoods_mentioning_deleted_children(graph):
+    graph.friends("sara")
+    graph.friends("omar")
+    graph.forget(["lina"])
+    assert graph.metrics()["users"] == 1
+
+def test_least_recently_used_child_is_evicted(graph):
+    for child in ("sara", "omar", "lina"):
+        graph.friends(child)
+    assert list(graph._entries) == ["omar", "lina"]
+
+def test_friends_of_friends_loads_all_neighbours_in_one_query(graph):
+    with engine.begin() as conn:
+        conn.execute(
+            sa.text("INSERT INTO FriendEdge VALUES (:child, :friend, 'Active')"),
+            [
+                {"child": "sara", "friend": "huda"}, {"child": "huda", "friend": "sara"},
+                {"child": "huda", "friend": "ali"}, {"child": "ali", "friend": "huda"},
+                {"child": "omar", "friend": "reem"}, {"child": "reem", "friend": "omar"},
+            ]
+        )
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", count)
+    try:
+        graph.max_users = 100
+        assert graph.friends_of_friends("sara") == {"ali", "reem"}
+        assert len(statements) == 2
+        graph.friends_of_friends("sara")
+        assert len(statements) == 2
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", count)
@@ -0,0 +1,61 @@
+import pytest
+from app.modules.user_search import IndexedChild, SearchData, UserSearchIndex, normalize_name, result_etag
+
+
+def child(username: str, first: str, last: str) -> IndexedChild:
+    return IndexedChild({"childUserName": username, "firstName": first, "lastName": last, "profileIcon": None})
+
+
+@pytest.fixture
+def index():
+    index = UserSearchIndex(limit=3)
+    index._data = SearchData.build([
+        child("sara1", "سارة", "العتيبي"),
+        child("sarah", "Sarah", "Salem"),
+        child("omar", "عمر", "سارة"),
+        child("lina", "Lina", "Hassan"),
+        child("bigsara", "Ali", "Hassan"),
+        child("me", "Me", "Myself"),
+    ])
+    index.nearby = set()
+    index._friends_of_friends = lambda username: index.nearby
+    return index
+
+
+def usernames(rows):
+    return [row["childUserName"] for row in rows]
+
+
+def test_names_are_folded_like_queries():
+    assert normalize_name("سارة") == normalize_name("ساره")
+    assert normalize_name(None) == ""
+
+def test_ranking_prefers_username_then_name_prefix_then_infix(index):
+    assert usernames(index.search("sara", "me")) == ["sara1", "sarah", "bigsara"]
+    # Both match a name prefix, so the username breaks the tie
+    assert usernames(index.search("ساره", "me")) == ["omar", "sara1"]
+
+def test_friends_of_friends_come_first(index):
+    index.nearby = {"bigsara"}
+    assert usernames(index.search("sara", "me"))[0] == "bigsara"
+
+def test_searcher_and_short_queries_are_excluded(index):
+    assert "me" not in usernames(index.search("me", "me"))
+    assert index.search("s", "me") == []
+
+def test_next_keystroke_refines_cached_matches(index):
+    index.search("sa", "me")
+    assert usernames(index.search("sarah", "me")) == ["sarah"]
+    assert index.stats["refined"] == 1
+
+def test_add_and_remove_update_the_index(index):
+    index._data.add(child("sara0", "X", "Y"))
+    index._matches.clear()
+    assert usernames(index.search("sara", "me"))[0] == "sara0"
+    index.remove(["sara0"])
+    assert "sara0" not in usernames(index.search("sara", "me"))
+
+def test_etag_changes_with_results(index):
+    rows = index.search("sara", "me")
+    assert result_etag(rows) == result_etag([dict(row) for row in rows])
+    assert result_etag(rows) != result_etag(rows[:1])